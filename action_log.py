@@ -0,0 +1,361 @@
+# action_log.py - журнал действий пользователей (append-only JSONL)
+import os
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import islice
+
+
+class _Posting:
+    """Список записей индекса: id и время в порядке добавления.
+
+    ordered - время ни разу не шло назад (перевод часов, коррекция
+    времени), и по stamps можно искать бинарным поиском.
+    """
+
+    __slots__ = ('ids', 'stamps', 'ordered')
+
+    def __init__(self):
+        self.ids = []
+        self.stamps = []
+        self.ordered = True
+
+    def add(self, entry_id, stamp):
+        if self.stamps and stamp < self.stamps[-1]:
+            self.ordered = False
+        self.ids.append(entry_id)
+        self.stamps.append(stamp)
+
+
+class ActionLog:
+    """Журнал действий в виде сегментов JSONL.
+
+    Каждая запись дописывается одной строкой в конец текущего сегмента,
+    поэтому стоимость добавления не зависит от длины истории. Когда сегмент
+    заполняется, открывается новый; лимит истории соблюдается удалением
+    самых старых сегментов целиком.
+
+    Последние записи дополнительно держатся в кольцевом буфере в памяти,
+    чтобы дашборд получал их без чтения файлов.
+
+    Для постраничной выборки в памяти держится индекс: по всем записям,
+    по пользователю, по действию и по их паре. Каждый список индекса
+    упорядочен по id, а позиция записи в файле известна, поэтому страница
+    читается бинарным поиском и seek'ами. Локальное время записей может
+    идти назад (переход на зимнее время), поэтому границы по дате ищутся
+    бинарным поиском, только пока время в списке не убывало, иначе
+    список проверяется целиком.
+    """
+
+    SEGMENT_PREFIX = 'actions_'
+    SEGMENT_SUFFIX = '.jsonl'
+
+    def __init__(self, directory='logs', segment_size=200, max_segments=5, recent_size=50):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=recent_size)
+        self.segments = []      # номера сегментов по возрастанию
+        self.tail_count = 0     # записей в текущем сегменте
+        self.tail_size = 0      # размер текущего сегмента в байтах
+        self.tail_file = None
+        self.next_id = 1
+        self.locations = {}     # id -> (сегмент, смещение строки)
+        self.segment_ids = {}   # сегмент -> id его записей
+        self.index = {}         # ключ -> _Posting
+
+    def open(self):
+        """Открыть журнал: найти сегменты, построить индекс и подготовить хвост к дозаписи"""
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self.segments = sorted(
+                int(name[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)])
+                for name in os.listdir(self.directory)
+                if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX)
+            )
+            self.locations = {}
+            self.segment_ids = {}
+            self.index = {}
+            length = 0
+            for number in self.segments:
+                self.segment_ids[number] = []
+                entries, length = self._scan_segment(number)
+                for offset, entry in entries:
+                    if 'id' not in entry:
+                        entry['id'] = self.next_id
+                    self.next_id = max(self.next_id, entry['id'] + 1)
+                    self._index_entry(entry, number, offset)
+
+            if self.segments:
+                self.tail_count = len(self.segment_ids[self.segments[-1]])
+                self._truncate_tail(length)
+                self._open_tail()
+            else:
+                self._start_segment(1)
+            self._seed_recent()
+
+    def close(self):
+        """Закрыть файл текущего сегмента"""
+        with self.lock:
+            if self.tail_file:
+                self.tail_file.close()
+                self.tail_file = None
+
+    def append(self, entry):
+        """Дописать запись в конец журнала"""
+        with self.lock:
+            if self.tail_count >= self.segment_size:
+                self._rotate()
+            entry = dict(entry, id=self.next_id)
+            self.next_id += 1
+            data = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+            self.tail_file.write(data)
+            self.tail_file.flush()
+            self._index_entry(entry, self.segments[-1], self.tail_size)
+            self.tail_size += len(data)
+            self.tail_count += 1
+            self.recent.append(entry)
+        return entry
+
+    def recent_entries(self, limit=5):
+        """Последние записи из памяти, новые первыми"""
+        with self.lock:
+            return list(islice(reversed(self.recent), limit))
+
+    def read_all(self):
+        """Прочитать весь журнал, новые записи первыми"""
+        with self.lock:
+            entries = []
+            for number in self.segments:
+                entries.extend(entry for _, entry in self._scan_segment(number)[0])
+        entries.reverse()
+        return entries
+
+    def query(self, cursor=None, limit=50, user=None, action=None, date_from=None, date_to=None):
+        """Страница записей, новые первыми.
+
+        cursor - id последней записи предыдущей страницы (выдаются записи
+        старше неё). date_from/date_to - строки вида 'YYYY-MM-DD[ HH:MM:SS]',
+        границы включительно. Возвращает (записи, курсор следующей страницы).
+        """
+        with self.lock:
+            posting = self.index.get(self._index_key(user, action))
+            if posting is None:
+                return [], None
+
+            hi = len(posting.ids)
+            if cursor is not None:
+                hi = min(hi, bisect_left(posting.ids, cursor))
+            lower = _stamp_lower(date_from) if date_from else None
+            upper = _stamp_upper(date_to) if date_to else None
+
+            if posting.ordered:
+                if upper is not None:
+                    hi = min(hi, bisect_right(posting.stamps, upper))
+                lo = bisect_left(posting.stamps, lower) if lower is not None else 0
+                start = max(lo, hi - limit)
+                ids = posting.ids[start:hi]
+                more = start > lo
+            else:
+                stamps = posting.stamps
+                matched = [k for k in range(hi)
+                           if (lower is None or stamps[k] >= lower) and (upper is None or stamps[k] <= upper)]
+                ids = [posting.ids[k] for k in matched[-limit:]]
+                more = len(matched) > limit
+
+            ids.reverse()
+            entries = self._load(ids)
+            next_cursor = ids[-1] if ids and more else None
+        return entries, next_cursor
+
+    def clear(self):
+        """Удалить все сегменты и начать журнал заново"""
+        with self.lock:
+            if self.tail_file:
+                self.tail_file.close()
+                self.tail_file = None
+            next_number = self.segments[-1] + 1 if self.segments else 1
+            for number in self.segments:
+                self._remove_segment(number)
+            self.segments = []
+            self.recent.clear()
+            self.locations = {}
+            self.segment_ids = {}
+            self.index = {}
+            self._start_segment(next_number)
+
+    def migrate_legacy(self, path):
+        """Перенести записи из старого system_logs.json (новые первыми)"""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"⚠ Ошибка чтения старого журнала: {e}")
+            return 0
+
+        if not self.locations:
+            for entry in reversed(legacy):
+                self.append(entry)
+        os.replace(path, path + '.bak')
+        print(f"✓ Перенесено записей журнала: {len(legacy)}")
+        return len(legacy)
+
+    @staticmethod
+    def _index_key(user, action):
+        if user and action:
+            return ('user_action', user, action)
+        if user:
+            return ('user', user)
+        if action:
+            return ('action', action)
+        return ('all',)
+
+    def _index_entry(self, entry, number, offset):
+        entry_id = entry['id']
+        stamp = entry.get('timestamp', '')
+        user = entry.get('user')
+        action = entry.get('action')
+        self.locations[entry_id] = (number, offset)
+        self.segment_ids[number].append(entry_id)
+        keys = [('all',), ('user', user), ('action', action), ('user_action', user, action)]
+        for key in keys:
+            posting = self.index.get(key)
+            if posting is None:
+                posting = self.index[key] = _Posting()
+            posting.add(entry_id, stamp)
+
+    def _unindex_segment(self, number):
+        # Записи удаляемого сегмента - самые старые, поэтому из списков
+        # индекса срезается их начало
+        for entry_id in self.segment_ids.pop(number, []):
+            del self.locations[entry_id]
+        first_kept = self.next_id
+        for segment in self.segments:
+            if self.segment_ids[segment]:
+                first_kept = self.segment_ids[segment][0]
+                break
+        for key in list(self.index):
+            posting = self.index[key]
+            cut = bisect_left(posting.ids, first_kept)
+            if cut:
+                del posting.ids[:cut]
+                del posting.stamps[:cut]
+                if not posting.ordered:
+                    # Записи с временем "назад" могли уйти вместе с сегментом
+                    stamps = posting.stamps
+                    posting.ordered = all(stamps[k] <= stamps[k + 1] for k in range(len(stamps) - 1))
+            if not posting.ids:
+                del self.index[key]
+
+    def _load(self, ids):
+        # Читаем записи по известным смещениям, открывая каждый сегмент один раз
+        files = {}
+        entries = []
+        try:
+            for entry_id in ids:
+                number, offset = self.locations[entry_id]
+                f = files.get(number)
+                if f is None:
+                    f = files[number] = open(self._segment_path(number), 'rb')
+                f.seek(offset)
+                entry = json.loads(f.readline())
+                entry.setdefault('id', entry_id)
+                entries.append(entry)
+        finally:
+            for f in files.values():
+                f.close()
+        return entries
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f'{self.SEGMENT_PREFIX}{number:06d}{self.SEGMENT_SUFFIX}')
+
+    def _scan_segment(self, number):
+        """Пары (смещение, запись) для строк сегмента и длина его целой части.
+
+        Строка без перевода строки в конце файла недописана (аварийное
+        завершение) и в целую часть не входит.
+        """
+        entries = []
+        length = 0
+        try:
+            with open(self._segment_path(number), 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    start = length
+                    length += len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        entries.append((start, json.loads(line)))
+                    except ValueError:
+                        # Испорченная строка: пропускаем, следующие читаются
+                        pass
+        except FileNotFoundError:
+            pass
+        return entries, length
+
+    def _truncate_tail(self, length):
+        # Недописанная строка отрезается, иначе следующая запись склеится с ней
+        path = self._segment_path(self.segments[-1])
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = 0
+        if size > length:
+            print(f"⚠ Журнал {path}: отброшена недописанная строка ({size - length} байт)")
+            with open(path, 'r+b') as f:
+                f.truncate(length)
+        self.tail_size = length
+
+    def _seed_recent(self):
+        # Заполняем буфер с конца журнала, читая только нужные сегменты
+        self.recent.clear()
+        needed = self.recent.maxlen
+        chunks = []
+        for number in reversed(self.segments):
+            if needed <= 0:
+                break
+            entries = [entry for _, entry in self._scan_segment(number)[0]]
+            chunks.append(entries[-needed:])
+            needed -= len(entries)
+        for entries in reversed(chunks):
+            self.recent.extend(entries)
+
+    def _open_tail(self):
+        self.tail_file = open(self._segment_path(self.segments[-1]), 'ab')
+
+    def _start_segment(self, number):
+        self.segments.append(number)
+        self.segment_ids[number] = []
+        self.tail_count = 0
+        self.tail_size = 0
+        self._open_tail()
+
+    def _rotate(self):
+        self.tail_file.close()
+        self._start_segment(self.segments[-1] + 1)
+        while len(self.segments) > self.max_segments:
+            number = self.segments.pop(0)
+            self._remove_segment(number)
+            self._unindex_segment(number)
+
+    def _remove_segment(self, number):
+        try:
+            os.remove(self._segment_path(number))
+        except FileNotFoundError:
+            pass
+
+
+def _stamp_lower(value):
+    """Нижняя граница интервала: '2024-01-15' -> '2024-01-15' (начало дня)"""
+    return value.replace('T', ' ')
+
+
+def _stamp_upper(value):
+    """Верхняя граница интервала включительно: '2024-01-15' покрывает весь день"""
+    return value.replace('T', ' ') + '\uffff'
@@ -1,35 +1,42 @@
-from flask import Flask, redirect, render_template_string, jsonify, url_for, request, session
+from flask import Flask, Response, abort, g, redirect, render_template_string, jsonify, url_for, request, session
 import time
-import random
 import threading
+import atexit
 from datetime import datetime, timedelta
 import json
 import os
 import hashlib
 from functools import wraps
-from arduino_connector import ArduinoConnector
-app = Flask(__name__)
+from arduino_pool import ArduinoPool, DEFAULT_DEVICES
+from arduino_connector import SUPERSEDED
+from device_service import DeviceClient
+from action_log import ActionLog
+from timeseries import TimeSeriesStore, bucket_start
+from event_stream import EventBroadcaster
+from assets import PrecompressedAsset, AssetManifest
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from state_store import StateStore
+from persistence import PersistenceWorker
+from energy_wal import EnergyJournal, apply_record, RESET
+import energy_meter
+# Статику отдаем сами: имена с отпечатками и заранее сжатые варианты
+app = Flask(__name__, static_folder=None)
 app.secret_key = 'your-secret-key-here'  # Замените на свой секретный ключ
 
-arduino = ArduinoConnector('COM3', 9600)
-arduino_connected = arduino.connect()
+# Метрики для /api/metrics
+REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ('endpoint', 'method'))
+REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'Запросы по обработчику и коду ответа', ('endpoint', 'method', 'status'))
+ADD_LOG_SECONDS = REGISTRY.histogram('add_log_seconds', 'Время добавления записи в журнал')
+UPDATER_LAG = REGISTRY.histogram(
+    'energy_updater_lag_seconds', 'Опоздание шага фонового начисления энергии относительно интервала')
+REGISTRY.gauge('sse_clients', 'Подключенные клиенты /api/stream', fn=lambda: len(events.subscribers))
+REGISTRY.counter('sse_rejected_total', 'Подключения к /api/stream, отклоненные из-за лимита',
+                 fn=lambda: events.rejected)
 
-# Добавьте callback для обновления состояния в веб-интерфейсе
-def arduino_callback(event_type, *args):
-    if event_type == 'room_changed':
-        room_name, state = args
-        if room_name in current_state['lamps']:
-            current_state['lamps'][room_name]['state'] = state
-            print(f"✓ Комната {room_name} обновлена: {state}")
-    elif event_type == 'status_updated':
-        rooms_state = args[0]
-        for room_name, state in rooms_state.items():
-            if room_name in current_state['lamps']:
-                current_state['lamps'][room_name]['state'] = state
-
-arduino.add_callback(arduino_callback)
-
-current_state = {
+# Состояние системы: читатели берут снимок, писатели публикуют новую версию
+state_store = StateStore({
     'lamps': {
         'living_room': {'state': False, 'power': 0.1, 'name': 'Гостиная', 'icon': 'fa-couch', 'color': '#2196F3'},
         'kitchen': {'state': False, 'power': 0.15, 'name': 'Кухня', 'icon': 'fa-utensils', 'color': '#FF9800'},
@@ -50,6 +57,8 @@ current_state = {
         'hours_on_today': {room: 0.0 for room in ['living_room', 'kitchen', 'bedroom', 'bathroom', 'hallway']},
         'savings_today': 0.0
     },
+    # Включенные комнаты: {комната: (включена с, мощность)} по time.monotonic()
+    'meter': {},
     'system': {
         'auto_save': True,
         'data_interval': 5,
@@ -57,7 +66,8 @@ current_state = {
         'language': 'ru',
         'notifications': True
     }
-}
+})
+REGISTRY.gauge('state_version', 'Версия опубликованного снимка состояния', fn=lambda: state_store.version)
 
 # Простые настройки для демо
 DEMO_USERS = {
@@ -69,9 +79,86 @@ DEMO_USERS = {
 CONFIG = {
     'base_consumption': 0.05,
     'data_file': 'energy_data.json',
-    'settings_file': 'system_settings.json'
+    'settings_file': 'system_settings.json',
+    'legacy_log_file': 'system_logs.json',
+    'log_dir': 'logs',
+    'log_segment_size': 200,
+    'log_max_segments': 5,
+    'log_recent_size': 50,
+    'logs_page_size': 50,
+    'logs_max_page_size': 500,
+    # Сырых отсчетов на ряд: сутки при начислении раз в energy_settle_interval
+    'series_capacity': 17280,
+    # Каждый открытый /api/stream занимает поток воркера (gthread, 16 потоков
+    # в render.yaml): остальные потоки остаются обычным запросам
+    'sse_max_clients': 8,
+    'sse_retry_after': 30,
+    # Агрегаты графиков (часы, дни, месяцы), чтобы история переживала перезапуск
+    'series_file': 'energy_series.json',
+    # Изменения за это время (с) сохраняются одной записью
+    'save_debounce': 1.0,
+    # Журнал счетчиков энергии: fsync группой раз в секунду, снимок раз в 5 минут
+    'wal_dir': 'wal',
+    'wal_sync_interval': 1.0,
+    'wal_snapshot_interval': 300.0,
+    # Журнал ведет один процесс на хосте; остальные проверяют блокировку раз в столько секунд
+    'wal_lock_retry': 1.0,
+    # Как часто (с) начислять энергию включенных комнат без переключений:
+    # столько теряется при сбое и так часто обновляется дашборд
+    'energy_settle_interval': 5.0,
+    'static_dir': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'),
+    # Контроллеры реле: порты и комнаты с каналами (таблица в arduino_pool.py)
+    'arduino_devices': DEFAULT_DEVICES,
+    # Сокет процесса-владельца портов (device_service.py). Если задан, воркеры
+    # не открывают порты сами, а отправляют команды через него
+    'device_socket': os.environ.get('DEVICE_SOCKET')
 }
 
+# Рассылка изменений в браузеры (/api/stream)
+events = EventBroadcaster(max_subscribers=CONFIG['sse_max_clients'])
+
+# Устройства опрашиваются параллельно, команды комнат идут по таблице маршрутов.
+# Подключение идет в фоне (с переподключением), приложение стартует сразу.
+# С владельцем портов у всех воркеров одно подключение к каждому устройству
+if CONFIG['device_socket']:
+    arduino = DeviceClient(CONFIG['device_socket'])
+else:
+    arduino = ArduinoPool(CONFIG['arduino_devices'])
+
+# Добавьте callback для обновления состояния в веб-интерфейсе
+def arduino_callback(event_type, *args):
+    if event_type == 'room_changed':
+        room_name, state = args
+        if room_name in state_store.snapshot()['lamps']:
+            set_room_state(room_name, state)
+            print(f"✓ Комната {room_name} обновлена: {state}")
+    elif event_type == 'status_updated':
+        rooms_state = args[0]
+        for room_name, state in rooms_state.items():
+            set_room_state(room_name, state)
+    elif event_type == 'all_changed':
+        # ALL_ON/ALL_OFF одного устройства: только его комнаты
+        state, rooms = args
+        for room_name in rooms:
+            set_room_state(room_name, state)
+
+# Callback работает в своем потоке шины событий и не задерживает чтение порта.
+# Порядок событий важен для состояния комнат, поэтому без схлопывания
+arduino.add_callback(arduino_callback, topics=('room_changed', 'status_updated', 'all_changed'))
+REGISTRY.gauge('arduino_event_queue_depth', 'События в очередях подписчиков шины', fn=arduino.bus.depth)
+REGISTRY.counter('arduino_events_dropped_total', 'События, отброшенные из-за переполнения очередей',
+                 fn=lambda: arduino.bus.dropped)
+arduino.start()
+
+# Журнал действий: дозапись в JSONL-сегменты вместо перезаписи всего файла
+action_log = ActionLog(CONFIG['log_dir'], CONFIG['log_segment_size'],
+                       CONFIG['log_max_segments'], CONFIG['log_recent_size'])
+action_log.open()
+action_log.migrate_legacy(CONFIG['legacy_log_file'])
+
+# История мощности: по ряду на комнату и общий ряд, фиксированная емкость
+energy_series = TimeSeriesStore(CONFIG['series_capacity'])
+
 def load_data():
     """Загрузка данных из файлов"""
     # Загрузка данных энергии
@@ -79,10 +166,12 @@ def load_data():
         try:
             with open(CONFIG['data_file'], 'r') as f:
                 data = json.load(f)
-                if 'energy' in data:
-                    current_state['energy']['total_month'] = data['energy'].get('total_month', 0.0)
-                    current_state['energy']['cost_month'] = data['energy'].get('cost_month', 0.0)
-                    current_state['energy']['tariff'] = data['energy'].get('tariff', 25.0)
+            if 'energy' in data:
+                with state_store.edit() as draft:
+                    energy = draft.edit('energy')
+                    energy['total_month'] = data['energy'].get('total_month', 0.0)
+                    energy['cost_month'] = data['energy'].get('cost_month', 0.0)
+                    energy['tariff'] = data['energy'].get('tariff', 25.0)
             print("✓ Данные энергии загружены")
         except:
             print("⚠ Ошибка загрузки данных энергии")
@@ -92,36 +181,95 @@ def load_data():
         try:
             with open(CONFIG['settings_file'], 'r') as f:
                 settings = json.load(f)
-                current_state['system'].update(settings.get('system', {}))
+            with state_store.edit() as draft:
+                draft.edit('system').update(settings.get('system', {}))
                 
                 # Обновление настроек комнат
                 for room_id, room_data in settings.get('lamps', {}).items():
-                    if room_id in current_state['lamps']:
-                        current_state['lamps'][room_id].update(room_data)
+                    if room_id in draft['lamps']:
+                        draft.edit('lamps', room_id).update(room_data)
             print("✓ Настройки системы загружены")
         except:
             print("⚠ Ошибка загрузки настроек системы")
+    
+    # Агрегаты графиков за прошлые запуски
+    if os.path.exists(CONFIG['series_file']):
+        try:
+            with open(CONFIG['series_file'], 'r') as f:
+                energy_series.load_rollups(json.load(f))
+            print("✓ История потребления загружена")
+        except Exception as e:
+            print(f"⚠ Ошибка загрузки истории потребления: {e}")
+
+def open_energy_journal():
+    """Восстановить счетчики энергии из журнала и вести его дальше.
+
+    Журнал ведет один процесс на хосте. Остальные ждут, пока владелец не
+    завершится (например, старый воркер при перезапуске gunicorn), и до
+    этого не пишут в журнал.
+    """
+    if not energy_journal.acquire():
+        print("⏳ Журнал счетчиков ведет другой процесс, ожидание")
+        while not energy_journal.acquire():
+            if energy_journal.closed.wait(CONFIG['wal_lock_retry']):
+                return
+    # Счетчики энергии: последний снимок журнала плюс записи после него
+    with state_store.edit() as draft:
+        energy = draft.edit('energy')
+        hours = draft.edit('stats', 'hours_on_today')
+        replayed = energy_journal.recover(energy, hours)
+        # Включенные комнаты считаются с момента загрузки
+        room_switched(draft, *draft['lamps'])
+    print(f"✓ Счетчики энергии восстановлены (записей журнала: {replayed})")
+    energy_journal.start(capture_counters, CONFIG['wal_snapshot_interval'])
+
+def data_to_save(snapshot):
+    """Содержимое файла данных: состояние без счетчиков включенных комнат (монотонные часы процесса)"""
+    return {key: value for key, value in snapshot.data.items() if key != 'meter'}
+
+def settings_to_save(snapshot):
+    """Содержимое файла настроек: комнаты, система и тариф"""
+    return {
+        'lamps': snapshot['lamps'],
+        'system': snapshot['system'],
+        'energy': {'tariff': snapshot['energy']['tariff']}
+    }
+
+# Файлы пишутся в фоне из одного снимка; тариф меняется только вместе с system.
+# Агрегаты графиков живут вне снимка и сохраняются вместе со снимком счетчиков
+persistence = PersistenceWorker(state_store, [
+    (CONFIG['data_file'], ('lamps', 'energy', 'stats', 'system'), data_to_save),
+    (CONFIG['settings_file'], ('lamps', 'system'), settings_to_save),
+    (CONFIG['series_file'], ('series',), lambda snapshot: energy_series.export_rollups())
+], CONFIG['save_debounce'])
+
+def close_persistence():
+    """При остановке дописать несохраненное, включая агрегаты графиков"""
+    persistence.mark_dirty('series')
+    persistence.close()
+
+atexit.register(close_persistence)
+
+# Изменения счетчиков энергии пишутся в журнал в той же правке состояния
+energy_journal = EnergyJournal(CONFIG['wal_dir'], CONFIG['wal_sync_interval'])
+atexit.register(energy_journal.close)
+
+def capture_counters():
+    """Снимок счетчиков для журнала: новый сегмент начинается, пока счетчики не меняются"""
+    with state_store.edit() as draft:
+        settle_rooms(draft)
+        segment = energy_journal.rotate()
+        energy = dict(draft['energy'])
+        hours = dict(draft['stats']['hours_on_today'])
+        auto_save = draft['system']['auto_save']
+    # Автосохранение файла данных и истории вместе со снимком
+    if auto_save:
+        persistence.mark_dirty('energy', 'stats', 'series')
+    return segment, energy, hours
 
 def save_data():
-    """Сохранение всех данных"""
-    try:
-        # Сохраняем данные энергии
-        with open(CONFIG['data_file'], 'w') as f:
-            json.dump(current_state, f, indent=2)
-        
-        # Сохраняем настройки отдельно
-        settings_to_save = {
-            'lamps': current_state['lamps'],
-            'system': current_state['system'],
-            'energy': {'tariff': current_state['energy']['tariff']}
-        }
-        
-        with open(CONFIG['settings_file'], 'w') as f:
-            json.dump(settings_to_save, f, indent=2)
-            
-        print("✓ Данные сохранены")
-    except Exception as e:
-        print(f"⚠ Ошибка сохранения данных: {e}")
+    """Сразу сохранить все данные"""
+    persistence.flush(force=True)
 
 # HTML шаблон с настройками
 HTML = '''
@@ -131,662 +279,12 @@ HTML = '''
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>IoT Smart Energy Monitor</title>
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-    <link href="https://fonts.googleapis.com/css2?family=Exo+2:wght@300;400;600;700&family=Roboto:wght@300;400;500&display=swap" rel="stylesheet">
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/chartjs-plugin-datalabels"></script>
-    <style>
-        :root {
-            --primary: #2196F3;
-            --primary-dark: #1976D2;
-            --secondary: #4CAF50;
-            --danger: #F44336;
-            --warning: #FF9800;
-            --dark: #1A237E;
-            --light: #E3F2FD;
-            --gray: #607D8B;
-            --sidebar-width: 250px;
-        }
-        
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-            font-family: 'Roboto', 'Exo 2', sans-serif;
-        }
-        
-        body {
-            background: linear-gradient(135deg, #0d47a1 0%, #1a237e 100%);
-            color: #fff;
-            min-height: 100vh;
-        }
-        
-        /* Top Navigation */
-        .top-nav {
-            background: rgba(255, 255, 255, 0.1);
-            backdrop-filter: blur(10px);
-            padding: 15px 30px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            border-bottom: 1px solid rgba(255, 255, 255, 0.1);
-            position: sticky;
-            top: 0;
-            z-index: 1000;
-        }
-        
-        .logo {
-            display: flex;
-            align-items: center;
-            gap: 15px;
-        }
-        
-        .logo h1 {
-            font-size: 1.8rem;
-            background: linear-gradient(to right, #64B5F6, #2196F3);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-        }
-        
-        .user-menu {
-            display: flex;
-            align-items: center;
-            gap: 20px;
-        }
-        
-        .nav-btn {
-            background: rgba(255, 255, 255, 0.1);
-            border: none;
-            color: white;
-            padding: 10px 20px;
-            border-radius: 10px;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            gap: 10px;
-            transition: all 0.3s;
-        }
-        
-        .nav-btn:hover {
-            background: rgba(255, 255, 255, 0.2);
-            transform: translateY(-2px);
-        }
-        
-        .user-info {
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        
-        .user-avatar {
-            width: 40px;
-            height: 40px;
-            border-radius: 50%;
-            background: var(--primary);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        
-        /* Main Layout */
-        .main-container {
-            display: flex;
-            min-height: calc(100vh - 70px);
-        }
-        
-        /* Sidebar */
-        .sidebar {
-            width: var(--sidebar-width);
-            background: rgba(0, 0, 0, 0.2);
-            padding: 20px;
-            border-right: 1px solid rgba(255, 255, 255, 0.1);
-            display: flex;
-            flex-direction: column;
-            gap: 10px;
-        }
-        
-        .sidebar-item {
-            padding: 15px;
-            border-radius: 10px;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            gap: 15px;
-            transition: all 0.3s;
-            color: #BBDEFB;
-            text-decoration: none;
-        }
-        
-        .sidebar-item:hover {
-            background: rgba(255, 255, 255, 0.1);
-        }
-        
-        .sidebar-item.active {
-            background: var(--primary);
-            color: white;
-        }
-        
-        .sidebar-section {
-            margin-top: 20px;
-            padding-top: 20px;
-            border-top: 1px solid rgba(255, 255, 255, 0.1);
-        }
-        
-        .sidebar-section h3 {
-            font-size: 0.9rem;
-            color: #90CAF9;
-            margin-bottom: 10px;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-        }
-        
-        /* Main Content */
-        .content {
-            flex: 1;
-            padding: 30px;
-            overflow-y: auto;
-        }
-        
-        .content-section {
-            display: none;
-        }
-        
-        .content-section.active {
-            display: block;
-            animation: fadeIn 0.5s ease;
-        }
-        
-        @keyframes fadeIn {
-            from { opacity: 0; transform: translateY(20px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-        
-        /* Dashboard Cards */
-        .dashboard-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(300px, 1fr));
-            gap: 25px;
-            margin-bottom: 30px;
-        }
-        
-        .card {
-            background: rgba(255, 255, 255, 0.08);
-            backdrop-filter: blur(15px);
-            border-radius: 20px;
-            padding: 25px;
-            border: 1px solid rgba(255, 255, 255, 0.1);
-            box-shadow: 0 15px 35px rgba(0, 0, 0, 0.2);
-            transition: transform 0.3s, box-shadow 0.3s;
-        }
-        
-        .card:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 20px 40px rgba(0, 0, 0, 0.3);
-        }
-        
-        .card-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 20px;
-        }
-        
-        .card-title {
-            font-size: 1.5rem;
-            font-weight: 600;
-            color: #BBDEFB;
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        
-        .card-actions {
-            display: flex;
-            gap: 10px;
-        }
-        
-        /* Rooms Grid */
-        .rooms-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(280px, 1fr));
-            gap: 20px;
-            margin-top: 20px;
-        }
-        
-        .room-card {
-            background: rgba(255, 255, 255, 0.05);
-            border-radius: 15px;
-            padding: 20px;
-            transition: all 0.3s;
-            border: 2px solid transparent;
-            position: relative;
-        }
-        
-        .room-card.active {
-            border-color: var(--secondary);
-            background: rgba(76, 175, 80, 0.1);
-        }
-        
-        .room-card:hover .room-actions {
-            opacity: 1;
-        }
-        
-        .room-header {
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            margin-bottom: 15px;
-        }
-        
-        .room-icon {
-            width: 50px;
-            height: 50px;
-            border-radius: 12px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 1.5rem;
-            color: white;
-        }
-        
-        .room-actions {
-            position: absolute;
-            top: 15px;
-            right: 15px;
-            opacity: 0;
-            transition: opacity 0.3s;
-            display: flex;
-            gap: 5px;
-        }
-        
-        .action-btn {
-            background: rgba(255, 255, 255, 0.1);
-            border: none;
-            color: white;
-            width: 35px;
-            height: 35px;
-            border-radius: 8px;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            transition: all 0.3s;
-        }
-        
-        .action-btn:hover {
-            background: rgba(255, 255, 255, 0.2);
-            transform: scale(1.1);
-        }
-        
-        /* Settings Page */
-        .settings-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(350px, 1fr));
-            gap: 25px;
-        }
-        
-        .setting-group {
-            background: rgba(255, 255, 255, 0.05);
-            border-radius: 15px;
-            padding: 20px;
-        }
-        
-        .setting-item {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            padding: 15px 0;
-            border-bottom: 1px solid rgba(255, 255, 255, 0.1);
-        }
-        
-        .setting-item:last-child {
-            border-bottom: none;
-        }
-        
-        .setting-label {
-            flex: 1;
-        }
-        
-        .setting-label h4 {
-            font-size: 1rem;
-            margin-bottom: 5px;
-            color: #BBDEFB;
-        }
-        
-        .setting-label p {
-            font-size: 0.9rem;
-            color: #90CAF9;
-        }
-        
-        .setting-control {
-            width: 200px;
-        }
-        
-        input[type="text"],
-        input[type="number"],
-        input[type="password"],
-        select {
-            width: 100%;
-            padding: 10px 15px;
-            background: rgba(255, 255, 255, 0.1);
-            border: 1px solid rgba(255, 255, 255, 0.2);
-            border-radius: 8px;
-            color: white;
-            font-size: 1rem;
-        }
-        
-        input:focus, select:focus {
-            outline: none;
-            border-color: var(--primary);
-            box-shadow: 0 0 0 2px rgba(33, 150, 243, 0.3);
-        }
-        
-        /* Toggle Switch */
-        .toggle {
-            position: relative;
-            display: inline-block;
-            width: 60px;
-            height: 30px;
-        }
-        
-        .toggle input {
-            opacity: 0;
-            width: 0;
-            height: 0;
-        }
-        
-        .slider {
-            position: absolute;
-            cursor: pointer;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background-color: #ccc;
-            transition: .4s;
-            border-radius: 34px;
-        }
-        
-        .slider:before {
-            position: absolute;
-            content: "";
-            height: 22px;
-            width: 22px;
-            left: 4px;
-            bottom: 4px;
-            background-color: white;
-            transition: .4s;
-            border-radius: 50%;
-        }
-        
-        input:checked + .slider {
-            background-color: var(--secondary);
-        }
-        
-        input:checked + .slider:before {
-            transform: translateX(30px);
-        }
-        
-        /* Modal Windows */
-        .modal {
-            display: none;
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0, 0, 0, 0.8);
-            z-index: 2000;
-            align-items: center;
-            justify-content: center;
-        }
-        
-        .modal.active {
-            display: flex;
-            animation: fadeIn 0.3s ease;
-        }
-        
-        .modal-content {
-            background: linear-gradient(135deg, #1a237e 0%, #0d47a1 100%);
-            border-radius: 20px;
-            width: 90%;
-            max-width: 500px;
-            max-height: 90vh;
-            overflow-y: auto;
-            border: 1px solid rgba(255, 255, 255, 0.1);
-            box-shadow: 0 25px 50px rgba(0, 0, 0, 0.5);
-        }
-        
-        .modal-header {
-            padding: 20px 30px;
-            border-bottom: 1px solid rgba(255, 255, 255, 0.1);
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }
-        
-        .modal-title {
-            font-size: 1.5rem;
-            font-weight: 600;
-            color: #BBDEFB;
-        }
-        
-        .close-modal {
-            background: none;
-            border: none;
-            color: #90CAF9;
-            font-size: 24px;
-            cursor: pointer;
-            width: 40px;
-            height: 40px;
-            border-radius: 50%;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            transition: all 0.3s;
-        }
-        
-        .close-modal:hover {
-            background: rgba(255, 255, 255, 0.1);
-        }
-        
-        .modal-body {
-            padding: 30px;
-        }
-        
-        .form-group {
-            margin-bottom: 20px;
-        }
-        
-        .form-label {
-            display: block;
-            margin-bottom: 8px;
-            color: #BBDEFB;
-            font-weight: 500;
-        }
-        
-        .form-row {
-            display: flex;
-            gap: 15px;
-            margin-bottom: 15px;
-        }
-        
-        .form-row .form-group {
-            flex: 1;
-            margin-bottom: 0;
-        }
-        
-        .color-picker {
-            display: flex;
-            gap: 10px;
-            align-items: center;
-        }
-        
-        .color-option {
-            width: 40px;
-            height: 40px;
-            border-radius: 8px;
-            cursor: pointer;
-            border: 3px solid transparent;
-            transition: all 0.3s;
-        }
-        
-        .color-option.selected {
-            border-color: white;
-            transform: scale(1.1);
-        }
-        
-        .modal-footer {
-            padding: 20px 30px;
-            border-top: 1px solid rgba(255, 255, 255, 0.1);
-            display: flex;
-            justify-content: flex-end;
-            gap: 15px;
-        }
-        
-        .btn {
-            padding: 12px 25px;
-            border: none;
-            border-radius: 10px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s;
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        
-        .btn-primary {
-            background: var(--primary);
-            color: white;
-        }
-        
-        .btn-secondary {
-            background: rgba(255, 255, 255, 0.1);
-            color: white;
-        }
-        
-        .btn-danger {
-            background: var(--danger);
-            color: white;
-        }
-        
-        .btn-success {
-            background: var(--secondary);
-            color: white;
-        }
-        
-        .btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 5px 15px rgba(0, 0, 0, 0.3);
-        }
-        
-        /* Charts */
-        .chart-container {
-            background: rgba(255, 255, 255, 0.05);
-            border-radius: 15px;
-            padding: 20px;
-            margin-top: 20px;
-            height: 300px;
-        }
-        
-        /* Statistics Cards */
-        .stats-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 20px;
-            margin-bottom: 25px;
-        }
-        
-        .stat-card {
-            background: rgba(255, 255, 255, 0.05);
-            border-radius: 15px;
-            padding: 20px;
-            text-align: center;
-        }
-        
-        .stat-value {
-            font-size: 2.2rem;
-            font-weight: 700;
-            margin: 10px 0;
-            color: #64B5F6;
-        }
-        
-        .stat-label {
-            color: #B0BEC5;
-            font-size: 0.9rem;
-            margin-bottom: 5px;
-        }
-        
-        /* Login Page */
-        .login-container {
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            min-height: 100vh;
-            padding: 20px;
-        }
-        
-        .login-box {
-            background: rgba(255, 255, 255, 0.08);
-            backdrop-filter: blur(15px);
-            border-radius: 20px;
-            padding: 40px;
-            width: 100%;
-            max-width: 400px;
-            border: 1px solid rgba(255, 255, 255, 0.1);
-            box-shadow: 0 25px 50px rgba(0, 0, 0, 0.3);
-        }
-        
-        .login-title {
-            text-align: center;
-            margin-bottom: 30px;
-            color: #BBDEFB;
-        }
-        
-        .login-form .form-group {
-            margin-bottom: 25px;
-        }
-        
-        /* Responsive */
-        @media (max-width: 768px) {
-            .sidebar {
-                width: 70px;
-                padding: 20px 10px;
-            }
-            
-            .sidebar-item span {
-                display: none;
-            }
-            
-            .dashboard-grid {
-                grid-template-columns: 1fr;
-            }
-            
-            .rooms-grid {
-                grid-template-columns: 1fr;
-            }
-            
-            .settings-grid {
-                grid-template-columns: 1fr;
-            }
-            
-            .setting-item {
-                flex-direction: column;
-                align-items: flex-start;
-                gap: 10px;
-            }
-            
-            .setting-control {
-                width: 100%;
-            }
-            
-            .form-row {
-                flex-direction: column;
-                gap: 15px;
-            }
-        }
-    </style>
+    <!-- Библиотеки берутся из static/vendor (vendor_assets.py), CDN - только запасной вариант -->
+    <link rel="stylesheet" href="{{ asset_url('vendor/fontawesome/css/all.min.css', 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css') }}">
+    <link rel="stylesheet" href="{{ asset_url('vendor/fonts/fonts.css', 'https://fonts.googleapis.com/css2?family=Exo+2:wght@300;400;600;700&family=Roboto:wght@300;400;500&display=swap') }}">
+    <script src="{{ asset_url('vendor/chart.js/chart.umd.min.js', 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js') }}"></script>
+    <script src="{{ asset_url('vendor/chartjs-plugin-datalabels/chartjs-plugin-datalabels.min.js', 'https://cdn.jsdelivr.net/npm/chartjs-plugin-datalabels@2.2.0/dist/chartjs-plugin-datalabels.min.js') }}"></script>
+    <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
 </head>
 <body>
     <!-- Login Page -->
@@ -1284,6 +782,11 @@ HTML = '''
                                 </tbody>
                             </table>
                         </div>
+                        <div style="text-align: center; padding-top: 15px;">
+                            <button class="btn btn-secondary" id="logsMoreBtn" onclick="loadMoreLogs()" style="display: none;">
+                                <i class="fas fa-chevron-down"></i> Показать ещё
+                            </button>
+                        </div>
                     </div>
                 </div>
             </div>
@@ -1424,986 +927,30 @@ HTML = '''
     </div>
     
     <!-- JavaScript -->
-    <script>
-        // Глобальные переменные
-        let currentSection = 'dashboard';
-        let selectedColor = '#2196F3';
-        let charts = {};
-        let updateInterval = 5000;
-        let timer = null;
-        
-        // Инициализация при загрузке
-        document.addEventListener('DOMContentLoaded', function() {
-            // Проверка авторизации
-            checkAuth();
-            
-            // Загрузка начальных данных
-            loadDashboardData();
-            loadRooms();
-            loadUsers();
-            loadLogs();
-            loadSettings();
-            
-            // Инициализация графиков
-            initCharts();
-            
-            // Запуск таймера обновления
-            startUpdateTimer();
-            
-            // Обновление времени
-            updateTime();
-            setInterval(updateTime, 1000);
-        });
-        
-        // Проверка авторизации
-        function checkAuth() {
-            const token = localStorage.getItem('auth_token');
-            if (token) {
-                showApp();
-            } else {
-                showLogin();
-            }
-        }
-        
-        // Показать приложение
-        function showApp() {
-            document.getElementById('loginPage').style.display = 'none';
-            document.getElementById('appContainer').style.display = 'block';
-        }
-        
-        // Показать форму входа
-        function showLogin() {
-            document.getElementById('loginPage').style.display = 'flex';
-            document.getElementById('appContainer').style.display = 'none';
-        }
-        
-        // Вход в систему
-        document.getElementById('loginForm').addEventListener('submit', function(e) {
-            e.preventDefault();
-            
-            const username = document.getElementById('loginUsername').value;
-            const password = document.getElementById('loginPassword').value;
-            
-            fetch('/api/login', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({username, password})
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    localStorage.setItem('auth_token', data.token);
-                    localStorage.setItem('user_role', data.role);
-                    localStorage.setItem('username', data.username);
-                    showApp();
-                    loadDashboardData();
-                } else {
-                    alert('Ошибка: ' + data.message);
-                }
-            })
-            .catch(error => {
-                alert('Ошибка соединения');
-            });
-        });
-        
-        // Выход из системы
-        function logout() {
-            localStorage.removeItem('auth_token');
-            localStorage.removeItem('user_role');
-            localStorage.removeItem('username');
-            showLogin();
-        }
-        
-        // Показать секцию
-        function showSection(sectionId) {
-            // Скрыть все секции
-            document.querySelectorAll('.content-section').forEach(section => {
-                section.classList.remove('active');
-            });
-            
-            // Скрыть все активные элементы сайдбара
-            document.querySelectorAll('.sidebar-item').forEach(item => {
-                item.classList.remove('active');
-            });
-            
-            // Показать выбранную секцию
-            document.getElementById(sectionId + 'Section').classList.add('active');
-            
-            // Активировать соответствующий элемент сайдбара
-            document.querySelectorAll('.sidebar-item').forEach(item => {
-                if (item.textContent.includes(getSectionName(sectionId))) {
-                    item.classList.add('active');
-                }
-            });
-            
-            currentSection = sectionId;
-            
-            // Загрузить данные для секции
-            switch(sectionId) {
-                case 'dashboard':
-                    loadDashboardData();
-                    break;
-                case 'rooms':
-                    loadRooms();
-                    break;
-                case 'energy':
-                    updateEnergyChart();
-                    break;
-                case 'statistics':
-                    updateStatistics();
-                    break;
-                case 'settings':
-                    loadSettings();
-                    break;
-                case 'users':
-                    loadUsers();
-                    break;
-                case 'logs':
-                    loadLogs();
-                    break;
-            }
-        }
-        
-        // Получить имя секции
-        function getSectionName(sectionId) {
-            const names = {
-                'dashboard': 'Панель управления',
-                'rooms': 'Управление комнатами',
-                'energy': 'Энергопотребление',
-                'statistics': 'Статистика',
-                'settings': 'Настройки системы',
-                'users': 'Пользователи',
-                'logs': 'История действий'
-            };
-            return names[sectionId] || sectionId;
-        }
-        
-        // Загрузка данных для дашборда
-        function loadDashboardData() {
-            fetch('/api/dashboard')
-                .then(response => response.json())
-                .then(data => {
-                    document.getElementById('currentPower').textContent = 
-                        data.current_power.toFixed(2) + ' кВт';
-                    document.getElementById('todayConsumption').textContent = 
-                        data.today_usage.toFixed(1) + ' кВт·ч';
-                    document.getElementById('todayCost').textContent = 
-                        data.today_cost.toFixed(0) + ' ₸';
-                    document.getElementById('activeRooms').textContent = 
-                        data.active_rooms + '/' + data.total_rooms;
-                    document.getElementById('savings').textContent = 
-                        data.savings.toFixed(0) + ' ₸';
-                    
-                    // Обновить пользователя
-                    const username = localStorage.getItem('username') || 'Администратор';
-                    document.getElementById('currentUser').textContent = username;
-                    
-                    // Обновить логи
-                    updateRecentLogs(data.recent_logs);
-                });
-        }
-        
-        // Загрузка комнат
-        function loadRooms() {
-            fetch('/api/rooms')
-                .then(response => response.json())
-                .then(rooms => {
-                    const container = document.getElementById('roomsContainer');
-                    container.innerHTML = '';
-                    
-                    Object.keys(rooms).forEach(roomId => {
-                        const room = rooms[roomId];
-                        const roomCard = `
-                            <div class="room-card ${room.state ? 'active' : ''}">
-                                <div class="room-actions">
-                                    <button class="action-btn" onclick="editRoom('${roomId}')">
-                                        <i class="fas fa-edit"></i>
-                                    </button>
-                                    <button class="action-btn" onclick="deleteRoom('${roomId}')">
-                                        <i class="fas fa-trash"></i>
-                                    </button>
-                                </div>
-                                <div class="room-header">
-                                    <div class="room-icon" style="background: ${room.color};">
-                                        <i class="fas ${room.icon}"></i>
-                                    </div>
-                                    <div class="room-status">
-                                        <span class="status-indicator ${room.state ? 'on' : ''}"></span>
-                                        <span>${room.state ? 'ВКЛ' : 'ВЫКЛ'}</span>
-                                    </div>
-                                </div>
-                                <div style="margin-bottom: 15px;">
-                                    <h3 style="font-size: 1.2rem; margin-bottom: 5px;">${room.name}</h3>
-                                    <p style="color: #90CAF9; font-size: 0.9rem;">Мощность: ${room.power} кВт</p>
-                                </div>
-                                <div style="display: flex; gap: 10px;">
-                                    <button class="btn ${room.state ? 'btn-danger' : 'btn-success'}" style="flex: 1;" onclick="toggleRoom('${roomId}', '${room.state ? 'off' : 'on'}')">
-                                        <i class="fas fa-power-off"></i>
-                                        ${room.state ? 'Выключить' : 'Включить'}
-                                    </button>
-                                    <button class="btn btn-secondary" onclick="showRoomDetails('${roomId}')">
-                                        <i class="fas fa-info"></i>
-                                    </button>
-                                </div>
-                            </div>
-                        `;
-                        container.innerHTML += roomCard;
-                    });
-                });
-        }
-        
-        // Переключение комнаты
-        function toggleRoom(roomId, state) {
-            fetch(`/api/room/${roomId}/${state}`, {
-                method: 'POST',
-                headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    loadRooms();
-                    loadDashboardData();
-                    showNotification(`Комната "${data.room_name}" ${state === 'on' ? 'включена' : 'выключена'}`);
-                }
-            });
-        }
-        
-        // Переключение всех комнат
-        function toggleAllRooms(state) {
-            fetch(`/api/all_rooms/${state}`, {
-                method: 'POST',
-                headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    loadRooms();
-                    loadDashboardData();
-                    showNotification(`Все комнаты ${state === 'on' ? 'включены' : 'выключены'}`);
-                }
-            });
-        }
-        
-        // Показать модальное окно комнаты
-        function showRoomModal(roomId) {
-            const modal = document.getElementById('roomModal');
-            const title = document.getElementById('roomModalTitle');
-            
-            if (roomId) {
-                title.textContent = 'Редактировать комнату';
-                // Загрузить данные комнаты
-                fetch(`/api/room/${roomId}`)
-                    .then(response => response.json())
-                    .then(room => {
-                        document.getElementById('roomId').value = roomId;
-                        document.getElementById('roomName').value = room.name;
-                        document.getElementById('roomPower').value = room.power;
-                        document.getElementById('roomIcon').value = room.icon;
-                        document.getElementById('roomColor').value = room.color;
-                        document.getElementById('roomDescription').value = room.description || '';
-                        selectColor(room.color);
-                    });
-            } else {
-                title.textContent = 'Добавить комнату';
-                document.getElementById('roomForm').reset();
-                document.getElementById('roomId').value = '';
-                document.getElementById('roomColor').value = '#2196F3';
-                selectColor('#2196F3');
-            }
-            
-            modal.classList.add('active');
-        }
-        
-        // Скрыть модальное окно комнаты
-        function hideRoomModal() {
-            document.getElementById('roomModal').classList.remove('active');
-        }
-        
-        // Выбрать цвет
-        function selectColor(color) {
-            selectedColor = color;
-            document.getElementById('roomColor').value = color;
-            
-            // Убрать выделение со всех цветов
-            document.querySelectorAll('.color-option').forEach(option => {
-                option.classList.remove('selected');
-            });
-            
-            // Найти и выделить выбранный цвет
-            document.querySelectorAll('.color-option').forEach(option => {
-                if (option.style.background === color || 
-                    option.style.backgroundColor === color) {
-                    option.classList.add('selected');
-                }
-            });
-        }
-        
-        // Сохранить комнату
-        function saveRoom() {
-            const roomId = document.getElementById('roomId').value;
-            const roomData = {
-                name: document.getElementById('roomName').value,
-                power: parseFloat(document.getElementById('roomPower').value),
-                icon: document.getElementById('roomIcon').value,
-                color: document.getElementById('roomColor').value,
-                description: document.getElementById('roomDescription').value
-            };
-            
-            const url = roomId ? `/api/room/${roomId}` : '/api/rooms';
-            const method = roomId ? 'PUT' : 'POST';
-            
-            fetch(url, {
-                method: method,
-                headers: {
-                    'Content-Type': 'application/json',
-                    'Authorization': 'Bearer ' + localStorage.getItem('auth_token')
-                },
-                body: JSON.stringify(roomData)
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    hideRoomModal();
-                    loadRooms();
-                    showNotification(data.message);
-                }
-            });
-        }
-        
-        // Редактировать комнату
-        function editRoom(roomId) {
-            showRoomModal(roomId);
-        }
-        
-        // Удалить комнату
-        function deleteRoom(roomId) {
-            if (confirm('Вы уверены, что хотите удалить эту комнату?')) {
-                fetch(`/api/room/${roomId}`, {
-                    method: 'DELETE',
-                    headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        loadRooms();
-                        showNotification(data.message);
-                    }
-                });
-            }
-        }
-        
-        // Загрузка пользователей
-        function loadUsers() {
-            fetch('/api/users')
-                .then(response => response.json())
-                .then(users => {
-                    const table = document.getElementById('usersTable');
-                    table.innerHTML = '';
-                    
-                    users.forEach(user => {
-                        const row = `
-                            <tr style="border-bottom: 1px solid rgba(255,255,255,0.1);">
-                                <td style="padding: 15px;">
-                                    <div style="display: flex; align-items: center; gap: 10px;">
-                                        <div style="width: 40px; height: 40px; border-radius: 50%; background: #2196F3; display: flex; align-items: center; justify-content: center;">
-                                            <i class="fas fa-user"></i>
-                                        </div>
-                                        <div>
-                                            <div>${user.username}</div>
-                                            <div style="font-size: 0.8rem; color: #90CAF9;">${user.email || ''}</div>
-                                        </div>
-                                    </div>
-                                </td>
-                                <td style="padding: 15px;">
-                                    <span style="padding: 5px 10px; border-radius: 20px; background: ${user.role === 'admin' ? '#F44336' : '#2196F3'}; font-size: 0.8rem;">
-                                        ${user.role === 'admin' ? 'Администратор' : 'Пользователь'}
-                                    </span>
-                                </td>
-                                <td style="padding: 15px; color: #90CAF9;">${user.last_login || 'Никогда'}</td>
-                                <td style="padding: 15px;">
-                                    <button class="action-btn" onclick="editUser('${user.username}')">
-                                        <i class="fas fa-edit"></i>
-                                    </button>
-                                    ${user.username !== 'admin' ? 
-                                        `<button class="action-btn" onclick="deleteUser('${user.username}')">
-                                            <i class="fas fa-trash"></i>
-                                        </button>` : ''
-                                    }
-                                </td>
-                            </tr>
-                        `;
-                        table.innerHTML += row;
-                    });
-                });
-        }
-        
-        // Показать модальное окно пользователя
-        function showUserModal(username) {
-            const modal = document.getElementById('userModal');
-            const title = document.getElementById('userModalTitle');
-            
-            if (username) {
-                title.textContent = 'Редактировать пользователя';
-                // Загрузить данные пользователя
-                fetch(`/api/user/${username}`)
-                    .then(response => response.json())
-                    .then(user => {
-                        document.getElementById('userId').value = username;
-                        document.getElementById('userUsername').value = user.username;
-                        document.getElementById('userUsername').readOnly = true;
-                        document.getElementById('userRole').value = user.role;
-                        document.getElementById('userEmail').value = user.email || '';
-                        document.getElementById('userPassword').required = false;
-                        document.getElementById('userPasswordConfirm').required = false;
-                    });
-            } else {
-                title.textContent = 'Добавить пользователя';
-                document.getElementById('userForm').reset();
-                document.getElementById('userId').value = '';
-                document.getElementById('userUsername').readOnly = false;
-                document.getElementById('userPassword').required = true;
-                document.getElementById('userPasswordConfirm').required = true;
-            }
-            
-            modal.classList.add('active');
-        }
-        
-        // Скрыть модальное окно пользователя
-        function hideUserModal() {
-            document.getElementById('userModal').classList.remove('active');
-        }
-        
-        // Сохранить пользователя
-        function saveUser() {
-            const username = document.getElementById('userId').value;
-            const password = document.getElementById('userPassword').value;
-            const passwordConfirm = document.getElementById('userPasswordConfirm').value;
-            
-            if (password !== passwordConfirm) {
-                alert('Пароли не совпадают!');
-                return;
-            }
-            
-            const userData = {
-                username: document.getElementById('userUsername').value,
-                password: password,
-                role: document.getElementById('userRole').value,
-                email: document.getElementById('userEmail').value
-            };
-            
-            const url = username ? `/api/user/${username}` : '/api/users';
-            const method = username ? 'PUT' : 'POST';
-            
-            fetch(url, {
-                method: method,
-                headers: {
-                    'Content-Type': 'application/json',
-                    'Authorization': 'Bearer ' + localStorage.getItem('auth_token')
-                },
-                body: JSON.stringify(userData)
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    hideUserModal();
-                    loadUsers();
-                    showNotification(data.message);
-                }
-            });
-        }
-        
-        // Редактировать пользователя
-        function editUser(username) {
-            showUserModal(username);
-        }
-        
-        // Удалить пользователя
-        function deleteUser(username) {
-            if (confirm(`Вы уверены, что хотите удалить пользователя ${username}?`)) {
-                fetch(`/api/user/${username}`, {
-                    method: 'DELETE',
-                    headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        loadUsers();
-                        showNotification(data.message);
-                    }
-                });
-            }
-        }
-        
-        // Загрузка логов
-        function loadLogs() {
-            fetch('/api/logs')
-                .then(response => response.json())
-                .then(logs => {
-                    updateLogsTable(logs);
-                });
-        }
-        
-        // Обновить таблицу логов
-        function updateLogsTable(logs) {
-            const table = document.getElementById('logsTable');
-            table.innerHTML = '';
-            
-            logs.forEach(log => {
-                const row = `
-                    <tr style="border-bottom: 1px solid rgba(255,255,255,0.1);">
-                        <td style="padding: 15px; color: #90CAF9;">${log.timestamp}</td>
-                        <td style="padding: 15px;">
-                            <span style="padding: 5px 10px; border-radius: 20px; background: ${getLogColor(log.action)}; font-size: 0.8rem;">
-                                ${log.action}
-                            </span>
-                        </td>
-                        <td style="padding: 15px;">${log.user}</td>
-                        <td style="padding: 15px; color: #B0BEC5;">${log.details}</td>
-                    </tr>
-                `;
-                table.innerHTML += row;
-            });
-        }
-        
-        // Обновить недавние логи
-        function updateRecentLogs(logs) {
-            const container = document.getElementById('recentLogs');
-            container.innerHTML = '';
-            
-            logs.forEach(log => {
-                const logItem = `
-                    <div style="padding: 15px; border-bottom: 1px solid rgba(255,255,255,0.1); display: flex; align-items: center; gap: 15px;">
-                        <div style="width: 40px; height: 40px; border-radius: 50%; background: ${getLogColor(log.action)}; display: flex; align-items: center; justify-content: center;">
-                            <i class="fas ${getLogIcon(log.action)}"></i>
-                        </div>
-                        <div style="flex: 1;">
-                            <div style="font-weight: 500;">${log.action}</div>
-                            <div style="font-size: 0.9rem; color: #90CAF9;">${log.details}</div>
-                        </div>
-                        <div style="font-size: 0.8rem; color: #B0BEC5;">${log.timestamp}</div>
-                    </div>
-                `;
-                container.innerHTML += logItem;
-            });
-        }
-        
-        // Очистить логи
-        function clearLogs() {
-            if (confirm('Вы уверены, что хотите очистить всю историю действий?')) {
-                fetch('/api/logs', {
-                    method: 'DELETE',
-                    headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        loadLogs();
-                        showNotification(data.message);
-                    }
-                });
-            }
-        }
-        
-        // Обновить логи
-        function refreshLogs() {
-            loadLogs();
-            fetch('/api/dashboard')
-                .then(response => response.json())
-                .then(data => {
-                    updateRecentLogs(data.recent_logs);
-                });
-        }
-        
-        // Получить цвет для типа лога
-        function getLogColor(action) {
-            const colors = {
-                'Вход в систему': '#4CAF50',
-                'Выход из системы': '#F44336',
-                'Включение': '#4CAF50',
-                'Выключение': '#F44336',
-                'Настройка': '#2196F3',
-                'Удаление': '#F44336',
-                'Добавление': '#4CAF50'
-            };
-            return colors[action] || '#607D8B';
-        }
-        
-        // Получить иконку для типа лога
-        function getLogIcon(action) {
-            const icons = {
-                'Вход в систему': 'fa-sign-in-alt',
-                'Выход из системы': 'fa-sign-out-alt',
-                'Включение': 'fa-power-off',
-                'Выключение': 'fa-power-off',
-                'Настройка': 'fa-cog',
-                'Удаление': 'fa-trash',
-                'Добавление': 'fa-plus'
-            };
-            return icons[action] || 'fa-info-circle';
-        }
-        
-        // Загрузка настроек
-        function loadSettings() {
-            fetch('/api/settings')
-                .then(response => response.json())
-                .then(settings => {
-                    document.getElementById('autoSave').checked = settings.auto_save;
-                    document.getElementById('updateInterval').value = settings.update_interval;
-                    document.getElementById('themeSelect').value = settings.theme;
-                    document.getElementById('tariffInput').value = settings.tariff;
-                    document.getElementById('baseConsumption').value = settings.base_consumption;
-                    document.getElementById('notifications').checked = settings.notifications;
-                    document.getElementById('languageSelect').value = settings.language;
-                    document.getElementById('timeFormat').value = settings.time_format;
-                    document.getElementById('unitsSystem').value = settings.units_system;
-                    
-                    updateInterval = settings.update_interval * 1000;
-                    restartUpdateTimer();
-                });
-        }
-        
-        // Сохранить все настройки
-        function saveAllSettings() {
-            const settings = {
-                auto_save: document.getElementById('autoSave').checked,
-                update_interval: parseInt(document.getElementById('updateInterval').value),
-                theme: document.getElementById('themeSelect').value,
-                tariff: parseFloat(document.getElementById('tariffInput').value),
-                base_consumption: parseFloat(document.getElementById('baseConsumption').value),
-                notifications: document.getElementById('notifications').checked,
-                language: document.getElementById('languageSelect').value,
-                time_format: document.getElementById('timeFormat').value,
-                units_system: document.getElementById('unitsSystem').value
-            };
-            
-            fetch('/api/settings', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'Authorization': 'Bearer ' + localStorage.getItem('auth_token')
-                },
-                body: JSON.stringify(settings)
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    showNotification('Настройки сохранены');
-                    updateInterval = settings.update_interval * 1000;
-                    restartUpdateTimer();
-                }
-            });
-        }
-        
-        // Инициализация графиков
-        function initCharts() {
-            // График энергопотребления
-            const energyCtx = document.getElementById('energyChart').getContext('2d');
-            charts.energy = new Chart(energyCtx, {
-                type: 'line',
-                data: {
-                    labels: [],
-                    datasets: [{
-                        label: 'Потребление (кВт)',
-                        data: [],
-                        borderColor: '#2196F3',
-                        backgroundColor: 'rgba(33, 150, 243, 0.1)',
-                        borderWidth: 3,
-                        fill: true,
-                        tension: 0.4
-                    }]
-                },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    plugins: {
-                        legend: { labels: { color: '#fff' } }
-                    },
-                    scales: {
-                        x: {
-                            ticks: { color: '#90CAF9' },
-                            grid: { color: 'rgba(255, 255, 255, 0.1)' }
-                        },
-                        y: {
-                            beginAtZero: true,
-                            ticks: { color: '#90CAF9' },
-                            grid: { color: 'rgba(255, 255, 255, 0.1)' }
-                        }
-                    }
-                }
-            });
-            
-            // График распределения
-            const distCtx = document.getElementById('distributionChart').getContext('2d');
-            charts.distribution = new Chart(distCtx, {
-                type: 'doughnut',
-                data: {
-                    labels: [],
-                    datasets: [{
-                        data: [],
-                        backgroundColor: []
-                    }]
-                },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    plugins: {
-                        legend: {
-                            position: 'right',
-                            labels: { color: '#fff' }
-                        }
-                    }
-                }
-            });
-        }
-        
-        // Обновление графика энергопотребления
-        function updateEnergyChart() {
-            const timeRange = document.getElementById('timeRange').value;
-            
-            fetch(`/api/energy_chart?range=${timeRange}`)
-                .then(response => response.json())
-                .then(data => {
-                    charts.energy.data.labels = data.labels;
-                    charts.energy.data.datasets[0].data = data.data;
-                    charts.energy.update();
-                    
-                    // Обновить финансовые показатели
-                    document.getElementById('tariffRate').textContent = 
-                        data.tariff.toFixed(0) + ' ₸';
-                    document.getElementById('monthlyCost').textContent = 
-                        data.monthly_cost.toFixed(0) + ' ₸';
-                    document.getElementById('monthlySavings').textContent = 
-                        data.monthly_savings.toFixed(0) + ' ₸';
-                    document.getElementById('peakPower').textContent = 
-                        data.peak_power.toFixed(2) + ' кВт';
-                });
-        }
-        
-        // Обновление статистики
-        function updateStatistics() {
-            fetch('/api/statistics')
-                .then(response => response.json())
-                .then(data => {
-                    // Обновить график распределения
-                    charts.distribution.data.labels = data.labels;
-                    charts.distribution.data.datasets[0].data = data.data;
-                    charts.distribution.data.datasets[0].backgroundColor = data.colors;
-                    charts.distribution.update();
-                    
-                    // Обновить статистику времени
-                    updateHoursStats(data.hours_stats);
-                    
-                    // Обновить месячную статистику
-                    updateMonthlyStats(data.monthly_stats);
-                });
-        }
-        
-        // Обновить статистику по времени
-        function updateHoursStats(stats) {
-            const container = document.getElementById('hoursStats');
-            container.innerHTML = '';
-            
-            stats.forEach(stat => {
-                const item = `
-                    <div style="padding: 15px; border-bottom: 1px solid rgba(255,255,255,0.1); display: flex; justify-content: space-between;">
-                        <div>${stat.room}</div>
-                        <div style="color: #64B5F6; font-weight: 500;">${stat.hours} ч</div>
-                    </div>
-                `;
-                container.innerHTML += item;
-            });
-        }
-        
-        // Обновить месячную статистику
-        function updateMonthlyStats(stats) {
-            const container = document.getElementById('monthlyStats');
-            container.innerHTML = '';
-            
-            stats.forEach(stat => {
-                const item = `
-                    <div style="padding: 15px; border-bottom: 1px solid rgba(255,255,255,0.1);">
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
-                            <div>${stat.month}</div>
-                            <div style="color: #64B5F6; font-weight: 500;">${stat.consumption} кВт·ч</div>
-                        </div>
-                        <div style="font-size: 0.9rem; color: #90CAF9;">${stat.cost} ₸</div>
-                    </div>
-                `;
-                container.innerHTML += item;
-            });
-        }
-        
-        // Показать модальное окно сброса
-        function showResetConfirm() {
-            document.getElementById('resetModal').classList.add('active');
-        }
-        
-        // Скрыть модальное окно сброса
-        function hideResetModal() {
-            document.getElementById('resetModal').classList.remove('active');
-            document.getElementById('resetConfirm').value = '';
-        }
-        
-        // Сбросить статистику
-        function resetStatistics() {
-            const confirmText = document.getElementById('resetConfirm').value;
-            
-            if (confirmText !== 'СБРОСИТЬ') {
-                alert('Для подтверждения введите "СБРОСИТЬ"');
-                return;
-            }
-            
-            fetch('/api/reset_stats', {
-                method: 'POST',
-                headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    hideResetModal();
-                    loadDashboardData();
-                    updateEnergyChart();
-                    updateStatistics();
-                    showNotification(data.message);
-                }
-            });
-        }
-        
-        // Экспорт данных
-        function exportData() {
-            fetch('/api/export')
-                .then(response => response.blob())
-                .then(blob => {
-                    const url = window.URL.createObjectURL(blob);
-                    const a = document.createElement('a');
-                    a.href = url;
-                    a.download = `energy_data_${new Date().toISOString().split('T')[0]}.json`;
-                    document.body.appendChild(a);
-                    a.click();
-                    document.body.removeChild(a);
-                    window.URL.revokeObjectURL(url);
-                });
-        }
-        
-        // Создать резервную копию
-        function createBackup() {
-            fetch('/api/backup', {
-                method: 'POST',
-                headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    showNotification(data.message);
-                }
-            });
-        }
-        
-        // Запустить таймер обновления
-        function startUpdateTimer() {
-            if (timer) clearInterval(timer);
-            timer = setInterval(updateDashboard, updateInterval);
-        }
-        
-        // Перезапустить таймер обновления
-        function restartUpdateTimer() {
-            if (timer) clearInterval(timer);
-            timer = setInterval(updateDashboard, updateInterval);
-        }
-        
-        // Обновить дашборд
-        function updateDashboard() {
-            if (currentSection === 'dashboard') {
-                loadDashboardData();
-            }
-            if (currentSection === 'energy') {
-                updateEnergyChart();
-            }
-            if (currentSection === 'statistics') {
-                updateStatistics();
-            }
-        }
-        
-        // Обновить время
-        function updateTime() {
-            const now = new Date();
-            const timeStr = now.toLocaleTimeString('ru-RU', {hour12: false});
-            document.getElementById('currentTime').textContent = timeStr;
-        }
-        
-        // Показать уведомление
-        function showNotification(message, type = 'success') {
-            // Создать элемент уведомления
-            const notification = document.createElement('div');
-            notification.className = 'notification';
-            notification.innerHTML = `
-                <i class="fas fa-${type === 'success' ? 'check-circle' : 'info-circle'}"></i>
-                ${message}
-            `;
-            
-            // Стили для уведомления
-            notification.style.cssText = `
-                position: fixed;
-                top: 20px;
-                right: 20px;
-                padding: 15px 25px;
-                background: ${type === 'success' ? '#4CAF50' : '#2196F3'};
-                color: white;
-                border-radius: 10px;
-                box-shadow: 0 5px 15px rgba(0,0,0,0.3);
-                z-index: 10000;
-                animation: slideIn 0.3s ease;
-                display: flex;
-                align-items: center;
-                gap: 10px;
-            `;
-            
-            document.body.appendChild(notification);
-            
-            // Удалить через 3 секунды
-            setTimeout(() => {
-                notification.style.animation = 'slideOut 0.3s ease';
-                setTimeout(() => notification.remove(), 300);
-            }, 3000);
-        }
-        
-        // Добавить стили анимации
-        const style = document.createElement('style');
-        style.textContent = `
-            @keyframes slideIn {
-                from { transform: translateX(100%); opacity: 0; }
-                to { transform: translateX(0); opacity: 1; }
-            }
-            @keyframes slideOut {
-                from { transform: translateX(0); opacity: 1; }
-                to { transform: translateX(100%); opacity: 0; }
-            }
-        `;
-        document.head.appendChild(style);
-        
-        // Показать детали комнаты
-        function showRoomDetails(roomId) {
-            fetch(`/api/room/${roomId}`)
-                .then(response => response.json())
-                .then(room => {
-                    alert(`
-                        Название: ${room.name}
-                        Мощность: ${room.power} кВт
-                        Состояние: ${room.state ? 'Включена' : 'Выключена'}
-                        Время работы сегодня: ${room.hours_today || 0} часов
-                        Потреблено сегодня: ${(room.power * (room.hours_today || 0)).toFixed(2)} кВт·ч
-                    `);
-                });
-        }
-    </script>
+    <script src="{{ asset_url('js/app.js') }}"></script>
 </body>
 </html>
 '''
 
+# Статика и страница собираются один раз: отпечатки, рендеринг и сжатие
+STATIC_ASSETS = AssetManifest(CONFIG['static_dir']).build()
+with app.app_context():
+    INDEX_PAGE = PrecompressedAsset(
+        render_template_string(HTML, asset_url=STATIC_ASSETS.url).encode('utf-8'),
+        'text/html; charset=utf-8'
+    )
+
 # API Endpoints
 @app.route('/')
 def index():
-    return render_template_string(HTML)
+    return INDEX_PAGE.response(request)
+
+@app.route('/static/<path:filename>')
+def static_asset(filename):
+    asset = STATIC_ASSETS.get(filename)
+    if asset is None:
+        abort(404)
+    return asset.response(request)
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -2430,6 +977,24 @@ def login():
     
     return jsonify({'success': False, 'message': 'Неверный логин или пароль'})
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'not_found'
+        REQUEST_SECONDS.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    return response
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
 # Middleware для проверки авторизации
 def login_required(f):
     @wraps(f)
@@ -2442,56 +1007,56 @@ def login_required(f):
 @app.route('/api/dashboard')
 @login_required
 def get_dashboard():
-    # Расчет текущей мощности
-    total_power = CONFIG['base_consumption']
-    active_rooms = 0
-    
-    for room in current_state['lamps'].values():
-        if room['state']:
-            total_power += room['power']
-            active_rooms += 1
-    
-    # Добавляем случайные колебания для реалистичности
-    total_power += random.uniform(-0.02, 0.02)
-    total_power = max(0.05, total_power)
-    
-    current_state['energy']['current_power'] = total_power
-    
-    # Расчет стоимости
-    today_cost = current_state['energy']['total_today'] * current_state['energy']['tariff']
-    month_cost = current_state['energy']['total_month'] * current_state['energy']['tariff']
-    
-    return jsonify({
-        'current_power': round(total_power, 3),
-        'today_usage': round(current_state['energy']['total_today'], 2),
-        'today_cost': round(today_cost, 0),
-        'active_rooms': active_rooms,
-        'total_rooms': len(current_state['lamps']),
-        'savings': round(current_state['stats']['savings_today'], 0),
-        'recent_logs': get_recent_logs(5)
-    })
+    snapshot = state_store.snapshot()
+    dashboard = power_summary(snapshot)
+    dashboard['version'] = snapshot.version
+    dashboard['recent_logs'] = get_recent_logs(5)
+    return jsonify(dashboard)
+
+@app.route('/api/stream')
+@login_required
+def stream():
+    # Push-поток изменений: состояние комнат, мощность, новые записи лога
+    subscriber = events.subscribe()
+    if subscriber is None:
+        # Потоков больше лимита: клиент обновляет данные запросами и повторит позже
+        return (jsonify({'success': False, 'message': 'Слишком много открытых потоков событий'}), 503,
+                {'Retry-After': str(CONFIG['sse_retry_after'])})
+    initial = [('dashboard', power_summary(state_store.snapshot()))]
+    return Response(
+        events.stream(subscriber, initial),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/rooms')
 @login_required
 def get_rooms():
+    snapshot = state_store.snapshot()
+    # Номер запуска и версия снимка служат ETag: без изменений отвечаем 304.
+    # Часы включенных комнат растут без новой версии, тогда ETag не ставим
+    etag = None if snapshot['meter'] else f'state-{state_store.epoch}-{snapshot.version}'
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    hours = energy_meter.live_hours(snapshot)
     rooms = {}
-    for room_id, room_data in current_state['lamps'].items():
-        rooms[room_id] = {
-            'name': room_data['name'],
-            'state': room_data['state'],
-            'power': room_data['power'],
-            'icon': room_data['icon'],
-            'color': room_data['color'],
-            'hours_today': current_state['stats']['hours_on_today'].get(room_id, 0)
-        }
-    return jsonify(rooms)
+    for room_id, room_data in snapshot['lamps'].items():
+        rooms[room_id] = room_view(room_data, hours.get(room_id, 0))
+    response = jsonify(rooms)
+    if etag:
+        response.set_etag(etag)
+    return response
 
 @app.route('/api/room/<room_id>')
 @login_required
 def get_room(room_id):
-    if room_id in current_state['lamps']:
-        room_data = current_state['lamps'][room_id].copy()
-        room_data['hours_today'] = current_state['stats']['hours_on_today'].get(room_id, 0)
+    snapshot = state_store.snapshot()
+    if room_id in snapshot['lamps']:
+        room_data = snapshot['lamps'][room_id].copy()
+        room_data['hours_today'] = energy_meter.live_hours(snapshot).get(room_id, 0)
         return jsonify(room_data)
     return jsonify({'success': False, 'message': 'Комната не найдена'}), 404
 
@@ -2499,31 +1064,38 @@ def get_room(room_id):
 @app.route('/api/room/<room_id>/<state>', methods=['POST'])
 @login_required
 def toggle_room(room_id, state):
-    if room_id in current_state['lamps']:
+    room = state_store.snapshot()['lamps'].get(room_id)
+    if room is not None:
         new_state = (state == 'on')
         
         # Обновляем состояние в Arduino
-        if arduino_connected:
+        if arduino.room_connected(room_id):
             if new_state:
                 success = arduino.turn_on_room(room_id)
             else:
                 success = arduino.turn_off_room(room_id)
             
+            # Состояние меняется только после подтверждения от устройства
+            if success == SUPERSEDED:
+                # Устройство выполнило более позднюю команду для этой комнаты,
+                # ее состояние установит тот, кто ее отправил
+                return jsonify({'success': False, 'message': 'Команду заменила более поздняя'}), 409
             if success:
-                current_state['lamps'][room_id]['state'] = new_state
+                set_room_state(room_id, new_state)
             else:
-                print(f"⚠ Не удалось отправить команду на Arduino")
+                print(f"⚠ Arduino не подтвердил команду")
+                return jsonify({'success': False, 'message': 'Arduino не подтвердил команду'}), 504
         else:
-            current_state['lamps'][room_id]['state'] = new_state
+            set_room_state(room_id, new_state)
         
         # Добавить лог
         username = session.get('username', 'system')
         action = 'Включение' if new_state else 'Выключение'
-        add_log(action, username, f'Комната "{current_state["lamps"][room_id]["name"]}" {state}')
+        add_log(action, username, f'Комната "{room["name"]}" {state}')
         
         return jsonify({
             'success': True,
-            'room_name': current_state['lamps'][room_id]['name'],
+            'room_name': room['name'],
             'new_state': state
         })
     return jsonify({'success': False, 'message': 'Комната не найдена'}), 404
@@ -2535,20 +1107,21 @@ def toggle_all_rooms(state):
     new_state = (state == 'on')
     
     # Обновляем состояние в Arduino
-    if arduino_connected:
+    if arduino.connected:
         if new_state:
             success = arduino.all_on()
         else:
             success = arduino.all_off()
         
+        if success == SUPERSEDED:
+            return jsonify({'success': False, 'message': 'Команду заменила более поздняя'}), 409
         if success:
-            for room_id, room_data in current_state['lamps'].items():
-                room_data['state'] = new_state
+            set_all_rooms_state(new_state)
         else:
-            print(f"⚠ Не удалось отправить команду на Arduino")
+            print(f"⚠ Arduino не подтвердил команду")
+            return jsonify({'success': False, 'message': 'Arduino не подтвердил команду'}), 504
     else:
-        for room_id, room_data in current_state['lamps'].items():
-            room_data['state'] = new_state
+        set_all_rooms_state(new_state)
     
     # Добавить лог
     username = session.get('username', 'system')
@@ -2557,7 +1130,7 @@ def toggle_all_rooms(state):
     
     return jsonify({
         'success': True,
-        'rooms_updated': len(current_state['lamps']),
+        'rooms_updated': len(state_store.snapshot()['lamps']),
         'new_state': state
     })
 
@@ -2565,93 +1138,101 @@ def toggle_all_rooms(state):
 @login_required
 def create_room():
     data = request.json
-    room_id = f'room_{len(current_state["lamps"]) + 1}'
-    
-    current_state['lamps'][room_id] = {
-        'name': data.get('name', 'Новая комната'),
-        'state': False,
-        'power': data.get('power', 0.1),
-        'icon': data.get('icon', 'fa-lightbulb'),
-        'color': data.get('color', '#2196F3'),
-        'description': data.get('description', '')
-    }
+    with state_store.edit() as draft:
+        lamps = draft.edit('lamps')
+        room_id = f'room_{len(lamps) + 1}'
+        room = lamps[room_id] = {
+            'name': data.get('name', 'Новая комната'),
+            'state': False,
+            'power': data.get('power', 0.1),
+            'icon': data.get('icon', 'fa-lightbulb'),
+            'color': data.get('color', '#2196F3'),
+            'description': data.get('description', '')
+        }
     
     # Добавить лог
     username = session.get('username', 'system')
     add_log('Добавление', username, f'Добавлена комната: {data.get("name")}')
+    events.publish('rooms', {'room_id': room_id, 'room': room_view(room, 0)})
     
-    save_data()
+    persistence.mark_dirty('lamps')
     
     return jsonify({'success': True, 'message': 'Комната добавлена', 'room_id': room_id})
 
 @app.route('/api/room/<room_id>', methods=['PUT'])
 @login_required
 def update_room(room_id):
-    if room_id in current_state['lamps']:
-        data = request.json
-        
-        old_name = current_state['lamps'][room_id]['name']
-        current_state['lamps'][room_id].update({
-            'name': data.get('name', current_state['lamps'][room_id]['name']),
-            'power': data.get('power', current_state['lamps'][room_id]['power']),
-            'icon': data.get('icon', current_state['lamps'][room_id]['icon']),
-            'color': data.get('color', current_state['lamps'][room_id]['color']),
-            'description': data.get('description', current_state['lamps'][room_id].get('description', ''))
+    data = request.json
+    with state_store.edit() as draft:
+        if room_id not in draft['lamps']:
+            return jsonify({'success': False, 'message': 'Комната не найдена'}), 404
+        room = draft.edit('lamps', room_id)
+        old_name = room['name']
+        room.update({
+            'name': data.get('name', room['name']),
+            'power': data.get('power', room['power']),
+            'icon': data.get('icon', room['icon']),
+            'color': data.get('color', room['color']),
+            'description': data.get('description', room.get('description', ''))
         })
-        
-        # Добавить лог
-        username = session.get('username', 'system')
-        add_log('Настройка', username, f'Изменена комната: {old_name} -> {data.get("name", old_name)}')
-        
-        save_data()
-        
-        return jsonify({'success': True, 'message': 'Комната обновлена'})
+        # Энергия до изменения считается по старой мощности
+        room_switched(draft, room_id)
     
-    return jsonify({'success': False, 'message': 'Комната не найдена'}), 404
+    # Добавить лог
+    username = session.get('username', 'system')
+    add_log('Настройка', username, f'Изменена комната: {old_name} -> {data.get("name", old_name)}')
+    snapshot = state_store.snapshot()
+    if room_id in snapshot['lamps']:
+        hours = energy_meter.live_hours(snapshot).get(room_id, 0)
+        events.publish('rooms', {'room_id': room_id, 'room': room_view(snapshot['lamps'][room_id], hours)})
+    
+    persistence.mark_dirty('lamps')
+    
+    return jsonify({'success': True, 'message': 'Комната обновлена'})
 
 @app.route('/api/room/<room_id>', methods=['DELETE'])
 @login_required
 def delete_room(room_id):
-    if room_id in current_state['lamps']:
-        room_name = current_state['lamps'][room_id]['name']
-        del current_state['lamps'][room_id]
-        
-        # Добавить лог
-        username = session.get('username', 'system')
-        add_log('Удаление', username, f'Удалена комната: {room_name}')
-        
-        save_data()
-        
-        return jsonify({'success': True, 'message': 'Комната удалена'})
+    with state_store.edit() as draft:
+        if room_id not in draft['lamps']:
+            return jsonify({'success': False, 'message': 'Комната не найдена'}), 404
+        room_name = draft.edit('lamps').pop(room_id)['name']
+        room_switched(draft, room_id)
+    energy_series.drop(room_id)
     
-    return jsonify({'success': False, 'message': 'Комната не найдена'}), 404
+    # Добавить лог
+    username = session.get('username', 'system')
+    add_log('Удаление', username, f'Удалена комната: {room_name}')
+    events.publish('rooms', {'room_id': room_id, 'deleted': True})
+    
+    persistence.mark_dirty('lamps')
+    
+    return jsonify({'success': True, 'message': 'Комната удалена'})
 
 @app.route('/api/energy_chart')
 @login_required
 def get_energy_chart():
     time_range = request.args.get('range', 'day')
+    # Агрегаты истории должны включать энергию по текущий момент
+    settle_energy()
     
-    # Генерируем демо-данные для графика
-    if time_range == 'day':
-        labels = [f'{h}:00' for h in range(24)]
-        data = [random.uniform(0.1, 1.5) for _ in range(24)]
-    elif time_range == 'week':
-        labels = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-        data = [random.uniform(5, 15) for _ in range(7)]
-    elif time_range == 'month':
-        labels = ['Неделя 1', 'Неделя 2', 'Неделя 3', 'Неделя 4']
-        data = [random.uniform(20, 80) for _ in range(4)]
-    else:  # year
-        labels = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
-        data = [random.uniform(100, 300) for _ in range(12)]
+    # Потребление (кВт·ч) по интервалам из готовых агрегатов
+    labels = []
+    data = []
+    granularity, buckets = chart_buckets(time_range, datetime.now())
+    for label, starts in buckets:
+        labels.append(label)
+        consumption = sum(energy_series.bucket_energy(TimeSeriesStore.TOTAL, granularity, s) for s in starts)
+        data.append(round(consumption, 3))
     
+    snapshot = state_store.snapshot()
     return jsonify({
         'labels': labels,
         'data': data,
-        'tariff': current_state['energy']['tariff'],
-        'monthly_cost': current_state['energy']['total_month'] * current_state['energy']['tariff'],
-        'monthly_savings': current_state['stats']['savings_today'] * 30,
-        'peak_power': current_state['energy']['peak_today']
+        'tariff': snapshot['energy']['tariff'],
+        'monthly_cost': snapshot['energy']['total_month'] * snapshot['energy']['tariff'],
+        'monthly_savings': snapshot['stats']['savings_today'] * 30,
+        'peak_power': snapshot['energy']['peak_today']
     })
 
 @app.route('/api/statistics')
@@ -2661,31 +1242,40 @@ def get_statistics():
     labels = []
     data = []
     colors = []
+    settle_energy()
+    snapshot = state_store.snapshot()
     
-    for room_id, room_data in current_state['lamps'].items():
-        if room_data['state']:
+    # Потребление комнат за сегодня из дневных агрегатов
+    today = bucket_start('day', datetime.now())
+    for room_id, room_data in snapshot['lamps'].items():
+        consumption = energy_series.bucket_energy(room_id, 'day', today)
+        if consumption > 0:
             labels.append(room_data['name'])
-            data.append(room_data['power'])
+            data.append(round(consumption, 3))
             colors.append(room_data['color'])
     
     # Статистика по времени работы
     hours_stats = []
-    for room_id, hours in current_state['stats']['hours_on_today'].items():
-        if room_id in current_state['lamps']:
+    for room_id, hours in snapshot['stats']['hours_on_today'].items():
+        if room_id in snapshot['lamps']:
             hours_stats.append({
-                'room': current_state['lamps'][room_id]['name'],
+                'room': snapshot['lamps'][room_id]['name'],
                 'hours': round(hours, 1)
             })
     
-    # Месячная статистика (демо)
-    monthly_stats = [
-        {'month': 'Январь', 'consumption': 150, 'cost': 3750},
-        {'month': 'Февраль', 'consumption': 140, 'cost': 3500},
-        {'month': 'Март', 'consumption': 130, 'cost': 3250},
-        {'month': 'Апрель', 'consumption': 120, 'cost': 3000},
-        {'month': 'Май', 'consumption': 110, 'cost': 2750},
-        {'month': 'Июнь', 'consumption': 100, 'cost': 2500}
-    ]
+    # Месячная статистика за последние полгода из месячных агрегатов
+    month_names = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+                   'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
+    monthly_stats = []
+    month = bucket_start('month', datetime.now())
+    for _ in range(6):
+        consumption = energy_series.bucket_energy(TimeSeriesStore.TOTAL, 'month', month)
+        monthly_stats.append({
+            'month': month_names[month.month - 1],
+            'consumption': round(consumption, 1),
+            'cost': round(consumption * snapshot['energy']['tariff'])
+        })
+        month = bucket_start('month', month - timedelta(days=1))
     
     return jsonify({
         'labels': labels,
@@ -2698,14 +1288,15 @@ def get_statistics():
 @app.route('/api/settings')
 @login_required
 def get_settings():
+    snapshot = state_store.snapshot()
     return jsonify({
-        'auto_save': current_state['system']['auto_save'],
-        'update_interval': current_state['system']['data_interval'],
-        'theme': current_state['system']['theme'],
-        'tariff': current_state['energy']['tariff'],
+        'auto_save': snapshot['system']['auto_save'],
+        'update_interval': snapshot['system']['data_interval'],
+        'theme': snapshot['system']['theme'],
+        'tariff': snapshot['energy']['tariff'],
         'base_consumption': CONFIG['base_consumption'],
-        'notifications': current_state['system']['notifications'],
-        'language': current_state['system']['language'],
+        'notifications': snapshot['system']['notifications'],
+        'language': snapshot['system']['language'],
         'time_format': '24',
         'units_system': 'metric'
     })
@@ -2715,22 +1306,24 @@ def get_settings():
 def update_settings():
     data = request.json
     
-    # Обновляем настройки системы
-    current_state['system']['auto_save'] = data.get('auto_save', True)
-    current_state['system']['data_interval'] = data.get('update_interval', 5)
-    current_state['system']['theme'] = data.get('theme', 'dark')
-    current_state['system']['notifications'] = data.get('notifications', True)
-    current_state['system']['language'] = data.get('language', 'ru')
-    
-    # Обновляем настройки энергии
-    current_state['energy']['tariff'] = data.get('tariff', 25.0)
+    with state_store.edit() as draft:
+        # Обновляем настройки системы
+        system = draft.edit('system')
+        system['auto_save'] = data.get('auto_save', True)
+        system['data_interval'] = data.get('update_interval', 5)
+        system['theme'] = data.get('theme', 'dark')
+        system['notifications'] = data.get('notifications', True)
+        system['language'] = data.get('language', 'ru')
+        
+        # Обновляем настройки энергии
+        draft.edit('energy')['tariff'] = data.get('tariff', 25.0)
     CONFIG['base_consumption'] = data.get('base_consumption', 0.05)
     
     # Добавить лог
     username = session.get('username', 'system')
     add_log('Настройка', username, 'Обновлены настройки системы')
     
-    save_data()
+    persistence.mark_dirty('system', 'energy')
     
     return jsonify({'success': True, 'message': 'Настройки сохранены'})
 
@@ -2771,25 +1364,31 @@ def get_user(username):
 @app.route('/api/logs')
 @login_required
 def get_logs():
-    # Читаем логи из файла
-    logs = []
-    log_file = 'system_logs.json'
+    # Постраничная выборка: ?cursor=&limit=&user=&action=&from=&to=
+    try:
+        cursor = request.args.get('cursor')
+        cursor = int(cursor) if cursor else None
+        limit = int(request.args.get('limit', CONFIG['logs_page_size']))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Неверные параметры запроса'}), 400
+    limit = max(1, min(limit, CONFIG['logs_max_page_size']))
     
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        except:
-            logs = []
+    logs, next_cursor = action_log.query(
+        cursor=cursor,
+        limit=limit,
+        user=request.args.get('user') or None,
+        action=request.args.get('action') or None,
+        date_from=request.args.get('from') or None,
+        date_to=request.args.get('to') or None
+    )
     
-    return jsonify(logs)
+    return jsonify({'logs': logs, 'next_cursor': next_cursor})
 
 @app.route('/api/logs', methods=['DELETE'])
 @login_required
 def clear_logs():
-    # Очищаем файл логов
-    with open('system_logs.json', 'w') as f:
-        json.dump([], f)
+    # Очищаем журнал
+    action_log.clear()
     
     # Добавить лог об очистке
     username = session.get('username', 'system')
@@ -2801,19 +1400,18 @@ def clear_logs():
 @login_required
 def reset_stats():
     # Сбросить статистику
-    current_state['energy']['total_today'] = 0.0
-    current_state['energy']['cost_today'] = 0.0
-    current_state['energy']['peak_today'] = 0.0
-    current_state['stats']['savings_today'] = 0.0
-    
-    for room_id in current_state['stats']['hours_on_today']:
-        current_state['stats']['hours_on_today'][room_id] = 0.0
+    with state_store.edit() as draft:
+        # Накопленное до сброса начисляется, дальше комнаты считаются с нуля
+        settle_rooms(draft)
+        apply_record(draft.edit('energy'), draft.edit('stats', 'hours_on_today'), (RESET,))
+        draft.edit('stats')['savings_today'] = 0.0
+        energy_journal.append([(RESET,)])
     
     # Добавить лог
     username = session.get('username', 'system')
     add_log('Сброс', username, 'Сброшена статистика потребления')
     
-    save_data()
+    persistence.mark_dirty('energy', 'stats')
     
     return jsonify({'success': True, 'message': 'Статистика сброшена'})
 
@@ -2821,11 +1419,13 @@ def reset_stats():
 @login_required
 def export_data():
     # Экспорт всех данных
+    settle_energy()
+    snapshot = state_store.snapshot()
     export_data = {
-        'lamps': current_state['lamps'],
-        'energy': current_state['energy'],
-        'stats': current_state['stats'],
-        'system': current_state['system'],
+        'lamps': snapshot['lamps'],
+        'energy': snapshot['energy'],
+        'stats': snapshot['stats'],
+        'system': snapshot['system'],
         'export_date': datetime.now().isoformat()
     }
     
@@ -2839,7 +1439,7 @@ def create_backup():
     
     try:
         with open(backup_file, 'w') as f:
-            json.dump(current_state, f, indent=2)
+            json.dump(data_to_save(state_store.snapshot()), f, indent=2)
         
         # Добавить лог
         username = session.get('username', 'system')
@@ -2852,6 +1452,7 @@ def create_backup():
 # Вспомогательные функции
 def add_log(action, user, details):
     """Добавить запись в лог"""
+    started = time.perf_counter()
     log_entry = {
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'action': action,
@@ -2859,74 +1460,165 @@ def add_log(action, user, details):
         'details': details
     }
     
-    # Читаем существующие логи
-    logs = []
-    log_file = 'system_logs.json'
-    
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        except:
-            logs = []
-    
-    # Добавляем новую запись
-    logs.insert(0, log_entry)
-    
-    # Сохраняем (ограничиваем до 1000 записей)
-    logs = logs[:1000]
-    
-    with open(log_file, 'w') as f:
-        json.dump(logs, f, indent=2)
+    # Дописываем одну строку в журнал, без перечитывания истории
+    log_entry = action_log.append(log_entry)
+    events.publish('log', log_entry)
+    ADD_LOG_SECONDS.observe(time.perf_counter() - started)
     
     return True
 
 def get_recent_logs(limit=5):
-    """Получить последние записи логов"""
-    logs = []
-    log_file = 'system_logs.json'
+    """Получить последние записи логов (из памяти, без чтения файлов)"""
+    return action_log.recent_entries(limit)
+
+def room_view(room, hours_today):
+    """Комната в ответе /api/rooms и в событии 'rooms'"""
+    return {
+        'name': room['name'],
+        'state': room['state'],
+        'power': room['power'],
+        'icon': room['icon'],
+        'color': room['color'],
+        'hours_today': hours_today
+    }
+
+def power_summary(snapshot):
+    """Показатели дашборда по снимку состояния: мощность, потребление и стоимость за сегодня"""
+    # Только включенные комнаты, с энергией по текущий момент
+    meter = snapshot['meter']
+    total_power = CONFIG['base_consumption'] + sum(power for _, power in meter.values())
+    active_rooms = len(meter)
+    energy = energy_meter.live_energy(snapshot)
     
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        except:
-            logs = []
+    today_cost = energy['total_today'] * energy['tariff']
     
-    return logs[:limit]
+    return {
+        'current_power': round(total_power, 3),
+        'today_usage': round(energy['total_today'], 2),
+        'today_cost': round(today_cost, 0),
+        'active_rooms': active_rooms,
+        'total_rooms': len(snapshot['lamps']),
+        'savings': round(snapshot['stats']['savings_today'], 0)
+    }
+
+def set_room_state(room_id, state):
+    """Установить состояние комнаты и разослать изменение подписчикам"""
+    with state_store.edit() as draft:
+        room = draft['lamps'].get(room_id)
+        if room is None or room['state'] == state:
+            return
+        draft.edit('lamps', room_id)['state'] = state
+        room_switched(draft, room_id)
+    persistence.mark_dirty('lamps')
+    events.publish('room', {'room_id': room_id, 'state': state})
+    events.publish('dashboard', power_summary(state_store.snapshot()))
+
+def set_all_rooms_state(state):
+    """Установить состояние всех комнат одной версией состояния"""
+    with state_store.edit() as draft:
+        changed = [room_id for room_id, room in draft['lamps'].items() if room['state'] != state]
+        for room_id in changed:
+            draft.edit('lamps', room_id)['state'] = state
+        if changed:
+            room_switched(draft, *changed)
+    if not changed:
+        return
+    persistence.mark_dirty('lamps')
+    for room_id in changed:
+        events.publish('room', {'room_id': room_id, 'state': state})
+    events.publish('dashboard', power_summary(state_store.snapshot()))
+
+def chart_buckets(time_range, now):
+    """Интервалы графика: (гранулярность, [(подпись, [начала корзин])])"""
+    buckets = []
+    if time_range == 'day':
+        hour = bucket_start('hour', now)
+        for i in range(23, -1, -1):
+            start = hour - timedelta(hours=i)
+            buckets.append((f'{start.hour}:00', [start]))
+        return 'hour', buckets
+    
+    day = bucket_start('day', now)
+    if time_range == 'week':
+        day_names = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+        for i in range(6, -1, -1):
+            start = day - timedelta(days=i)
+            buckets.append((day_names[start.weekday()], [start]))
+        return 'day', buckets
+    
+    if time_range == 'month':
+        for week in range(4):
+            first = day - timedelta(days=7 * (3 - week) + 6)
+            buckets.append((f'Неделя {week + 1}', [first + timedelta(days=d) for d in range(7)]))
+        return 'day', buckets
+    
+    # year
+    month_names = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+    month = bucket_start('month', now)
+    for _ in range(12):
+        buckets.append((month_names[month.month - 1], [month]))
+        month = bucket_start('month', month - timedelta(days=1))
+    buckets.reverse()
+    return 'month', buckets
+
+def room_switched(draft, *rooms):
+    """Перезапустить счетчики энергии комнат после переключения, смены мощности или удаления"""
+    samples = energy_meter.switch(draft, energy_journal, rooms, time.monotonic(), CONFIG['base_consumption'])
+    # Под блокировкой состояния: отсчеты истории идут в порядке времени
+    energy_series.record(time.time(), samples)
+
+def settle_rooms(draft):
+    """Начислить в черновике энергию включенных комнат по текущий момент"""
+    samples = energy_meter.settle(draft, energy_journal, time.monotonic())
+    if samples:
+        energy_series.record(time.time(), samples)
+
+def settle_energy():
+    """Начислить энергию включенных комнат (новая версия, только если есть включенные)"""
+    if not state_store.snapshot()['meter']:
+        return
+    with state_store.edit() as draft:
+        settle_rooms(draft)
 
 def update_energy_stats():
-    """Фоновая задача для обновления статистики"""
+    """Фоновая задача: начисление энергии включенных комнат и рассылка показателей.
+
+    Энергия считается по переключениям (energy_meter), здесь она только
+    периодически фиксируется для журнала и дашборда; без включенных комнат
+    шаг ничего не делает.
+    """
+    interval = CONFIG['energy_settle_interval']
+    last_summary = None
+    last_tick = time.monotonic()
     while True:
-        time.sleep(1)
-        
-        # Обновляем потребление для включенных комнат
-        for room_id, room_data in current_state['lamps'].items():
-            if room_data['state']:
-                # Увеличиваем счетчик часов работы
-                current_state['stats']['hours_on_today'][room_id] += 1/3600
-                
-                # Рассчитываем потребление
-                consumption = room_data['power'] * (1/3600)
-                current_state['energy']['total_today'] += consumption
-                current_state['energy']['total_month'] += consumption
-                
-                # Обновляем пиковое потребление
-                if current_state['energy']['current_power'] > current_state['energy']['peak_today']:
-                    current_state['energy']['peak_today'] = current_state['energy']['current_power']
-        
-        # Автосохранение каждые 5 минут
-        if current_state['system']['auto_save'] and int(time.time()) % 300 == 0:
-            save_data()
+        time.sleep(interval)
+        now = time.monotonic()
+        UPDATER_LAG.observe(max(now - last_tick - interval, 0.0))
+        last_tick = now
+        
+        settle_energy()
+        
+        # Рассылаем показатели только если изменились отображаемые значения
+        summary = power_summary(state_store.snapshot())
+        if summary != last_summary:
+            events.publish('dashboard', summary)
+            last_summary = summary
 
-if __name__ == '__main__':
-    # Загружаем данные
+def startup():
+    """Загрузка данных, журнал счетчиков и фоновое начисление энергии.
+
+    Выполняется при импорте модуля, поэтому работает и под gunicorn.
+    """
     load_data()
-    
-    # Запускаем фоновую задачу
-    updater_thread = threading.Thread(target=update_energy_stats, daemon=True)
-    updater_thread.start()
-    
+    if energy_journal.acquire():
+        open_energy_journal()
+    else:
+        threading.Thread(target=open_energy_journal, name='energy-wal-wait', daemon=True).start()
+    threading.Thread(target=update_energy_stats, name='energy-updater', daemon=True).start()
+
+startup()
+
+if __name__ == '__main__':
     print("=" * 60)
     print("🚀 IoT Smart Energy Monitor System")
     print("=" * 60)
@@ -2935,8 +1627,9 @@ if __name__ == '__main__':
     print("   Логин: user  | Пароль: user123")
     print("=" * 60)
     print(f"🌐 Сервер запущен: http://127.0.0.1:5000")
-    print(f"📊 Мониторинг комнат: {len(current_state['lamps'])}")
-    print(f"💰 Тариф: {current_state['energy']['tariff']} ₸/кВт·ч")
+    snapshot = state_store.snapshot()
+    print(f"📊 Мониторинг комнат: {len(snapshot['lamps'])}")
+    print(f"💰 Тариф: {snapshot['energy']['tariff']} ₸/кВт·ч")
     print("=" * 60)
     
     try:
@@ -1,248 +1,1072 @@
 # arduino_connector.py - исправленная версия
+import os
 import serial
 import time
-import json
+import random
+import asyncio
 import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-class ArduinoConnector:
-    def __init__(self, port='COM3', baudrate=9600):
+from event_bus import EventBus, DROP_OLDEST, event_key
+from metrics import REGISTRY
+
+SERIAL_BYTES = REGISTRY.counter(
+    'arduino_serial_bytes_total', 'Байты через последовательный порт', ('port', 'direction'))
+SERIAL_MESSAGES = REGISTRY.counter(
+    'arduino_serial_messages_total', 'Строки или кадры через порт (на выходе - команды)', ('port', 'direction'))
+PARSE_SECONDS = REGISTRY.histogram(
+    'arduino_parse_seconds', 'Время разбора одной порции данных с порта', ('port',),
+    buckets=(1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2))
+COMMAND_RTT = REGISTRY.histogram(
+    'arduino_command_rtt_seconds', 'Время от отправки команды до ответа устройства', ('port',))
+
+
+class LineFramer:
+    """Нарезка потока байтов на строки по '\\n'.
+
+    Буфер - один bytearray на все время работы: за один вызов feed()
+    извлекаются все полные строки, а обработанное начало буфера удаляется
+    одним срезом, поэтому пачка строк обрабатывается за линейное время.
+    """
+
+    def __init__(self, max_line=4096):
+        self.buffer = bytearray()
+        self.max_line = max_line
+
+    def feed(self, data):
+        """Добавить байты и вернуть список полных непустых строк"""
+        buffer = self.buffer
+        buffer += data
+        lines = []
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = buffer[start:end].strip()
+            if line:
+                lines.append(line.decode('utf-8', errors='ignore'))
+            start = end + 1
+        if start:
+            del buffer[:start]
+        if len(buffer) > self.max_line:
+            # Поток без переводов строк - мусор на линии, сбрасываем
+            buffer.clear()
+        return lines
+
+
+# Компактный бинарный протокол (включается командой BINARY при подключении).
+# Кадр: [LEN][OP][данные...][CRC8], LEN = 1 + длина данных,
+# CRC8 (полином 0x07) считается по LEN, OP и данным.
+# Состояние реле передается битовой маской uint16 (little-endian), бит = канал.
+OP_PING = 0x01
+OP_SET_ROOM = 0x02    # [канал, 0/1]
+OP_SET_MASK = 0x03    # [маска каналов u16, значения u16]
+OP_STATUS = 0x04
+OP_STATS = 0x05
+OP_TEXT = 0x10        # текстовая команда/строка внутри кадра
+OP_PONG = 0x81
+OP_STATE = 0x84       # [маска включенных u16] - ответ на SET_*/STATUS
+OP_STATS_REPLY = 0x85
+OP_QUICK = 0x86
+OP_ERROR = 0xFF
+
+MAX_CHANNELS = 16
+MAX_FRAME_LENGTH = 255    # LEN занимает один байт
+
+# Результат команды, которую еще в очереди заменила более поздняя
+# противоположная (ON, сразу за ним OFF): устройство выполнило последнюю
+SUPERSEDED = 'superseded'
+
+
+def _crc8_table(poly):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+CRC8_TABLE = _crc8_table(0x07)
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode_frame(op, payload=b''):
+    """Собрать кадр бинарного протокола"""
+    if len(payload) >= MAX_FRAME_LENGTH:
+        raise ValueError('Слишком длинные данные для кадра')
+    body = bytes((len(payload) + 1, op)) + bytes(payload)
+    return body + bytes((crc8(body),))
+
+
+def encode_mask(value):
+    return value.to_bytes(2, 'little')
+
+
+def decode_mask(payload):
+    return int.from_bytes(payload[:2], 'little')
+
+
+class FrameDecoder:
+    """Разбор потока байтов на кадры [LEN][OP][данные][CRC8].
+
+    При неверной длине или CRC сдвигаемся на один байт и ищем следующий
+    кадр, поэтому после помех поток сам синхронизируется.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.errors = 0
+
+    def feed(self, data):
+        """Добавить байты и вернуть список кадров (op, данные)"""
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        pos = 0
+        while len(buffer) - pos >= 3:
+            length = buffer[pos]
+            if length == 0 or length > MAX_FRAME_LENGTH:
+                pos += 1
+                self.errors += 1
+                continue
+            end = pos + length + 2
+            if end > len(buffer):
+                break
+            if crc8(buffer[pos:end - 1]) != buffer[end - 1]:
+                pos += 1
+                self.errors += 1
+                continue
+            frames.append((buffer[pos + 1], bytes(buffer[pos + 2:end - 1])))
+            pos = end
+        if pos:
+            del buffer[:pos]
+        return frames
+
+    def resync(self):
+        """Отбросить первый байт буфера и вернуть кадры, найденные после него.
+
+        Нужен, когда испорченный байт длины заставляет ждать кадр, который
+        никогда не придет: вызывается, если ответ не пришел за таймаут.
+        """
+        if not self.buffer:
+            return []
+        del self.buffer[0]
+        self.errors += 1
+        return self.feed(b'')
+
+
+class StatsRecord:
+    """Разобранная строка STATS: время работы, мощность по комнатам и общая, Вт"""
+
+    __slots__ = ('uptime', 'watts', 'total', 'received_at')
+
+    def __init__(self, uptime, watts, total, received_at):
+        self.uptime = uptime
+        self.watts = watts
+        self.total = total
+        self.received_at = received_at
+
+    def to_dict(self):
+        return {'uptime': self.uptime, 'watts': self.watts, 'total': self.total}
+
+
+class QuickRecord:
+    """Разобранная строка QUICK: общая мощность (Вт) и число включенных комнат"""
+
+    __slots__ = ('power', 'rooms_on', 'received_at')
+
+    def __init__(self, power, rooms_on, received_at):
+        self.power = power
+        self.rooms_on = rooms_on
+        self.received_at = received_at
+
+    def to_dict(self):
+        return {'power': self.power, 'rooms_on': self.rooms_on}
+
+
+def _fields(payload):
+    """'A:1,B:2' -> [('A', '1'), ('B', '2')] (части без ':' пропускаются)"""
+    fields = []
+    for part in payload.split(','):
+        key, sep, value = part.partition(':')
+        if sep:
+            fields.append((key, value))
+    return fields
+
+
+def parse_stats(payload):
+    """STATS:UPTIME:<с>,<КОМНАТА>:<Вт>,...,TOTAL:<Вт> -> StatsRecord"""
+    uptime = 0
+    total = None
+    watts = {}
+    for key, value in _fields(payload):
+        if key == 'UPTIME':
+            uptime = int(value)
+        elif key == 'TOTAL':
+            total = float(value)
+        else:
+            watts[key.lower()] = float(value)
+    if total is None:
+        total = sum(watts.values())
+    return StatsRecord(uptime, watts, total, time.time())
+
+
+def parse_quick(payload):
+    """QUICK:POWER:<Вт>,ON:<число комнат> -> QuickRecord"""
+    power = 0.0
+    rooms_on = 0
+    for key, value in _fields(payload):
+        if key == 'POWER':
+            power = float(value)
+        elif key == 'ON':
+            rooms_on = int(value)
+    return QuickRecord(power, rooms_on, time.time())
+
+
+class SerialTransport:
+    """Неблокирующий транспорт pyserial для asyncio.
+
+    Если у порта есть файловый дескриптор (Linux, pty), чтение и запись идут
+    через loop.add_reader/add_writer: ни одного потока на устройство. Иначе
+    (Windows, loop://) байты читает вспомогательный поток, а запись идет
+    через однопоточный executor, сохраняющий порядок команд.
+    """
+
+    def __init__(self, ser, loop, on_data, on_lost):
+        self.ser = ser
+        self.loop = loop
+        self.on_data = on_data
+        self.on_lost = on_lost
+        self.fd = None
+        self.closed = False
+        self.out = bytearray()
+        self.reader_thread = None
+        self.writer = None
+
+    def start(self):
+        try:
+            fd = self.ser.fileno()
+            self.loop.add_reader(fd, self._read_ready)
+            self.fd = fd
+        except (AttributeError, NotImplementedError, OSError, ValueError, serial.SerialException):
+            self.ser.timeout = 0.5
+            self.writer = ThreadPoolExecutor(max_workers=1)
+            self.reader_thread = threading.Thread(target=self._read_blocking, daemon=True)
+            self.reader_thread.start()
+
+    def write(self, data):
+        """Поставить байты в очередь на отправку (не блокирует цикл событий)"""
+        if self.closed:
+            raise serial.SerialException('Порт закрыт')
+        if self.fd is None:
+            self.loop.run_in_executor(self.writer, self.ser.write, bytes(data))
+            return
+        if not self.out:
+            try:
+                written = os.write(self.fd, data)
+            except BlockingIOError:
+                written = 0
+            if written == len(data):
+                return
+            data = data[written:]
+            self.loop.add_writer(self.fd, self._write_ready)
+        self.out += data
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.loop.remove_writer(self.fd)
+        if self.writer:
+            self.writer.shutdown(wait=False)
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+
+    def _read_ready(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._lost(e)
+            return
+        if not data:
+            self._lost(None)
+            return
+        self.on_data(data)
+
+    def _write_ready(self):
+        try:
+            written = os.write(self.fd, self.out)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._lost(e)
+            return
+        del self.out[:written]
+        if not self.out:
+            self.loop.remove_writer(self.fd)
+
+    def _read_blocking(self):
+        while not self.closed:
+            try:
+                data = self.ser.read(max(1, self.ser.in_waiting))
+            except Exception as e:
+                if not self.closed:
+                    self.loop.call_soon_threadsafe(self._lost, e)
+                return
+            if data:
+                self.loop.call_soon_threadsafe(self.on_data, data)
+
+    def _lost(self, exc):
+        if self.closed:
+            return
+        self.close()
+        self.on_lost(exc)
+
+
+class _Outgoing:
+    """Команда в очереди на отправку и ожидающие ее ответа future"""
+
+    __slots__ = ('command', 'expect', 'futures')
+
+    def __init__(self, command, expect, futures):
+        self.command = command
+        self.expect = expect
+        self.futures = futures
+
+
+class AsyncArduinoConnector:
+    """Подключение к Arduino на asyncio.
+
+    Все методы - корутины одного цикла событий, поэтому на одном цикле
+    могут работать много устройств и тысячи ожидающих команд без отдельного
+    потока чтения на каждое подключение.
+
+    Каждая команда регистрирует future, который разрешается ответом
+    устройства (например, LIVING_ROOM_ON -> LIVING_ROOM:ON). Состояние
+    комнат меняется только по ответу, а время от отправки до ответа
+    сохраняется в rtt_samples.
+
+    В порт пишет одна задача-писатель. Команды ждут в очереди, где более
+    поздняя команда для той же комнаты заменяет ожидающую (ALL_ON/ALL_OFF
+    заменяют все комнатные), а все накопленное уходит одной записью.
+    После записи писатель ждет, пока пачка уйдет в линию, - за это время
+    шторм переключений схлопывается до минимального трафика.
+
+    start() подключается в фоне и после обрыва переподключается с
+    экспоненциально растущей паузой со случайным разбросом, чтобы
+    несколько процессов не штурмовали порт одновременно.
+    """
+
+    ROOMS = ('living_room', 'kitchen', 'bedroom', 'bathroom', 'hallway')
+    BOOT_DELAY = 2.0    # Arduino перезагружается при открытии порта
+
+    def __init__(self, port='COM3', baudrate=9600, command_timeout=2.0, coalesce_window=0.002,
+                 protocol='text', channels=None, reconnect_delay=1.0, reconnect_max_delay=60.0,
+                 bus=None):
         self.port = port
         self.baudrate = baudrate
+        self.command_timeout = command_timeout
+        self.coalesce_window = coalesce_window
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.supervisor = None
+        self.link_down = None
+        self.protocol = protocol               # 'text', 'binary' или 'auto'
+        self.channels = channels or {room: i for i, room in enumerate(self.ROOMS)}
+        if protocol != 'text':
+            # Маска бинарного протокола - u16
+            for room, channel in self.channels.items():
+                if not 0 <= channel < MAX_CHANNELS:
+                    raise ValueError(f'Канал {channel} комнаты {room} вне диапазона 0..{MAX_CHANNELS - 1}')
+        self.binary = False
+        self.frame_decoder = FrameDecoder()
+        self.outbox = OrderedDict()            # слот команды -> _Outgoing
+        self.outbox_ready = None
+        self.writer_task = None
+        self.pending = {}                      # ожидаемый ответ -> очередь (future'ы команды, время отправки)
+        self.rtt_samples = deque(maxlen=1000)  # время подтверждения команд, с
+        self.last_rtt = None
         self.ser = None
+        self.transport = None
         self.connected = False
-        self.room_states = {
-            'living_room': False,
-            'kitchen': False,
-            'bedroom': False,
-            'bathroom': False,
-            'hallway': False
-        }
-        self.callbacks = []
-        
-    def connect(self):
+        self.room_states = {room: False for room in self.channels}
+        self.bus = bus or EventBus()    # callback-функции получают события через шину
+        self.event_queues = []
+        self.framer = LineFramer()
+        self.unknown_lines = 0
+        self.metric_bytes_in = SERIAL_BYTES.labels(port, 'in')
+        self.metric_bytes_out = SERIAL_BYTES.labels(port, 'out')
+        self.metric_messages_in = SERIAL_MESSAGES.labels(port, 'in')
+        self.metric_messages_out = SERIAL_MESSAGES.labels(port, 'out')
+        self.metric_parse = PARSE_SECONDS.labels(port)
+        self.metric_rtt = COMMAND_RTT.labels(port)
+        self.last_stats = None         # StatsRecord
+        self.last_quick = None         # QuickRecord
+
+    async def connect(self):
         """Подключиться к Arduino"""
+        loop = asyncio.get_running_loop()
         try:
-            self.ser = serial.Serial(self.port, self.baudrate, timeout=1)
-            time.sleep(2)  # Ждем инициализации Arduino
-            self.connected = True
-            print(f"✅ Подключено к Arduino на порту {self.port}")
+            self.ser = await loop.run_in_executor(None, self._open_port)
+            await asyncio.sleep(self.BOOT_DELAY)  # Ждем инициализации Arduino
+            self.framer = LineFramer()
+            self.transport = SerialTransport(self.ser, loop, self._on_data, self._on_lost)
+            self.transport.start()
+            self.outbox_ready = asyncio.Event()
+            self.writer_task = asyncio.ensure_future(self._write_loop())
             
-            # Запускаем поток для чтения данных
-            self.read_thread = threading.Thread(target=self._read_serial, daemon=True)
-            self.read_thread.start()
+            # Переход на бинарный протокол, если устройство его поддерживает.
+            # До конца согласования connected = False: обычные команды не
+            # попадают в одну пачку с BINARY и не уходят не в том протоколе
+            if self.protocol != 'text' and not await self._negotiate_binary():
+                if self.protocol == 'binary':
+                    raise ConnectionError('Устройство не поддерживает бинарный протокол')
+                print("⚠ Бинарный протокол недоступен, используется текстовый")
             
-            # Отправляем тестовый пинг
-            self.send_ping()
-            time.sleep(1)
+            # Без PONG связи нет: не тот порт или скорость, прошивка не
+            # загрузилась. Ждем не дольше таймаута команды
+            try:
+                await self._request('PING', ('ping',))
+            except asyncio.TimeoutError:
+                raise ConnectionError('Устройство не ответило на PING')
+            self.connected = True
+            print(f"✅ Подключено к Arduino на порту {self.port}")
             
             # Запрашиваем текущий статус
-            self.get_status()
+            await self.get_status()
             
             return True
         except Exception as e:
             print(f"❌ Ошибка подключения: {e}")
-            self.connected = False
+            self._close_link()
             return False
-    
-    def disconnect(self):
+
+    def _open_port(self):
+        return serial.serial_for_url(self.port, self.baudrate, timeout=0)
+
+    async def _negotiate_binary(self):
+        self.binary = False
+        try:
+            return await self._request('BINARY', ('binary',))
+        except (asyncio.TimeoutError, ConnectionError):
+            return False
+
+    async def disconnect(self):
         """Отключиться от Arduino"""
-        if self.ser and self.ser.is_open:
-            self.ser.close()
+        self._close_link()
+
+    @property
+    def link_state(self):
+        """'connected', 'connecting' (идут попытки подключения) или 'disconnected'"""
+        if self.connected:
+            return 'connected'
+        if self.supervisor is not None and not self.supervisor.done():
+            return 'connecting'
+        return 'disconnected'
+
+    def start(self):
+        """Подключаться в фоне и восстанавливать связь после обрывов"""
+        if self.supervisor is None or self.supervisor.done():
+            self.supervisor = asyncio.ensure_future(self._supervise())
+
+    async def stop(self):
+        """Остановить переподключение и отключиться"""
+        if self.supervisor:
+            self.supervisor.cancel()
+            self.supervisor = None
+        await self.disconnect()
+
+    async def _supervise(self):
+        delay = self.reconnect_delay
+        while True:
+            self.link_down = asyncio.Event()
+            if await self.connect():
+                delay = self.reconnect_delay
+                await self.link_down.wait()
+            
+            # Половина паузы фиксирована, половина случайна
+            pause = delay / 2 + random.uniform(0, delay / 2)
+            print(f"🔄 Повторное подключение к {self.port} через {pause:.1f} с")
+            await asyncio.sleep(pause)
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    def _close_link(self):
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+        elif self.ser:
+            try:
+                self.ser.close()
+            except Exception:
+                pass
+        self.ser = None
+        self._stop_writer()
         self.connected = False
-    
-    def send_command(self, command):
-        """Отправить команду на Arduino"""
-        if not self.connected or not self.ser:
+        self.binary = False
+        self._fail_pending()
+        if self.link_down:
+            self.link_down.set()
+
+    async def send_command(self, command):
+        """Поставить команду в очередь на отправку"""
+        if not self.connected or not self.transport:
             print(f"❌ Не подключено к Arduino")
             return False
         
+        self._enqueue(str(command))
+        return True
+
+    async def request(self, command, expect, timeout=None):
+        """Отправить команду и дождаться ответа с ключом expect.
+
+        Возвращает значение из ответа; при отсутствии ответа за timeout
+        бросает asyncio.TimeoutError, при потере связи - ConnectionError.
+        Если команду вытеснила более поздняя, future получает ответ на нее.
+        """
+        if not self.connected:
+            raise ConnectionError('Не подключено к Arduino')
+        return await self._request(command, expect, timeout)
+
+    async def _request(self, command, expect, timeout=None):
+        # Без проверки connected: нужен для согласования протокола при подключении
+        if not self.transport:
+            raise ConnectionError('Не подключено к Arduino')
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(str(command), expect, future)
         try:
+            return await asyncio.wait_for(future, timeout or self.command_timeout)
+        except asyncio.TimeoutError:
+            if self.binary:
+                for op, payload in self.frame_decoder.resync():
+                    self._process_frame(op, payload)
+            raise
+        finally:
+            if future.cancelled():
+                self._forget(future)
+
+    @staticmethod
+    def _slot(command):
+        """Слот очереди: команды одного слота вытесняют друг друга"""
+        if command in ('ALL_ON', 'ALL_OFF'):
+            return ('all',)
+        if command.endswith('_ON'):
+            return ('room', command[:-3])
+        if command.endswith('_OFF'):
+            return ('room', command[:-4])
+        return ('command', command)
+
+    def _enqueue(self, command, expect=None, future=None):
+        slot = self._slot(command)
+        if slot == ('all',):
+            superseded = [key for key in self.outbox if key[0] == 'room' or key == slot]
+        else:
+            superseded = [slot] if slot in self.outbox else []
+        
+        futures = []
+        for key in superseded:
+            futures.extend(self.outbox.pop(key).futures)
+        if future is not None:
+            futures.append(future)
+        self.outbox[slot] = _Outgoing(command, expect, futures)
+        self.outbox_ready.set()
+
+    async def _write_loop(self):
+        """Единственный писатель в порт"""
+        while True:
+            await self.outbox_ready.wait()
+            await asyncio.sleep(self.coalesce_window)
+            self.outbox_ready.clear()
+            batch = list(self.outbox.values())
+            self.outbox.clear()
+            
+            data = self._encode_batch(batch)
+            try:
+                self.transport.write(data)
+            except Exception as e:
+                print(f"❌ Ошибка отправки: {e}")
+                for item in batch:
+                    self._fail(item.futures)
+                self._close_link()
+                return
+            
+            sent_at = time.perf_counter()
+            self.metric_bytes_out.inc(len(data))
+            self.metric_messages_out.inc(len(batch))
+            for item in batch:
+                if item.expect is not None:
+                    self.pending.setdefault(item.expect, deque()).append((item.futures, sent_at))
+            
+            # Пока пачка идет по линии, новые команды копятся и схлопываются
+            await asyncio.sleep(len(data) * 10 / self.baudrate)
+
+    def _encode_batch(self, batch):
+        """Байты для отправки пачки команд одной записью"""
+        if not self.binary:
             # Arduino ожидает текстовые команды, а не JSON
-            cmd_str = str(command) + '\n'
-            self.ser.write(cmd_str.encode())
-            print(f"📤 Отправлено: {cmd_str.strip()}")
+            return ''.join(item.command + '\n' for item in batch).encode()
+        
+        # Комнатные команды и ALL_* сворачиваются в один кадр с маской
+        frames = bytearray()
+        mask = values = 0
+        switches = 0
+        for item in batch:
+            slot = self._slot(item.command)
+            if slot == ('all',):
+                mask = 0
+                for channel in self.channels.values():
+                    mask |= 1 << channel
+                values = mask if item.command == 'ALL_ON' else 0
+                switches += 2
+            elif slot[0] == 'room' and slot[1].lower() in self.channels:
+                bit = 1 << self.channels[slot[1].lower()]
+                mask |= bit
+                values = values | bit if item.command.endswith('_ON') else values & ~bit
+                switches += 1
+            elif item.command == 'PING':
+                frames += encode_frame(OP_PING)
+            elif item.command == 'STATUS':
+                frames += encode_frame(OP_STATUS)
+            elif item.command == 'STATS':
+                frames += encode_frame(OP_STATS)
+            else:
+                frames += encode_frame(OP_TEXT, item.command.encode())
+        
+        if switches == 1:
+            channel = mask.bit_length() - 1
+            frames += encode_frame(OP_SET_ROOM, bytes((channel, 1 if values else 0)))
+        elif switches:
+            frames += encode_frame(OP_SET_MASK, encode_mask(mask) + encode_mask(values))
+        return bytes(frames)
+
+    def _stop_writer(self):
+        if self.writer_task:
+            self.writer_task.cancel()
+            self.writer_task = None
+
+    def _forget(self, future):
+        """Убрать future, не дождавшийся ответа, из всех очередей"""
+        for waiters in self.pending.values():
+            for futures, _ in waiters:
+                if future in futures:
+                    futures.remove(future)
+            while waiters and not waiters[0][0]:
+                waiters.popleft()
+        for item in self.outbox.values():
+            if future in item.futures:
+                item.futures.remove(future)
+
+    async def _confirmed(self, command, expect):
+        try:
+            value = await self.request(command, expect)
+            if expect[0] in ('room', 'all') and value != expect[-1]:
+                # Команду вытеснила противоположная, устройство выполнило ее
+                return SUPERSEDED
             return True
-        except Exception as e:
-            print(f"❌ Ошибка отправки: {e}")
-            self.connected = False
-            return False
-    
-    def send_ping(self):
-        """Отправить ping на Arduino"""
-        self.send_command("PING")
-    
-    def turn_on_room(self, room_name):
-        """Включить комнату"""
+        except asyncio.TimeoutError:
+            print(f"⚠ Нет подтверждения от Arduino: {command}")
+        except ConnectionError as e:
+            print(f"❌ {e}")
+        return False
+
+    async def send_ping(self):
+        """Отправить ping на Arduino и дождаться PONG"""
+        return await self._confirmed("PING", ('ping',))
+
+    async def turn_on_room(self, room_name):
+        """Включить комнату (True - устройство подтвердило включение,
+        SUPERSEDED - до отправки ее заменила более поздняя команда)"""
         # Преобразуем имя комнаты в формат команды Arduino
         room_upper = room_name.upper().replace(" ", "_")
         cmd = f"{room_upper}_ON"
-        
-        if self.send_command(cmd):
-            self.room_states[room_name] = True
-            self._notify_callbacks('room_changed', room_name, True)
-            return True
-        return False
-    
-    def turn_off_room(self, room_name):
-        """Выключить комнату"""
+        return await self._confirmed(cmd, ('room', room_name, True))
+
+    async def turn_off_room(self, room_name):
+        """Выключить комнату (True - устройство подтвердило выключение,
+        SUPERSEDED - до отправки ее заменила более поздняя команда)"""
         room_upper = room_name.upper().replace(" ", "_")
         cmd = f"{room_upper}_OFF"
-        
-        if self.send_command(cmd):
-            self.room_states[room_name] = False
-            self._notify_callbacks('room_changed', room_name, False)
-            return True
-        return False
-    
-    def toggle_room(self, room_name):
+        return await self._confirmed(cmd, ('room', room_name, False))
+
+    async def toggle_room(self, room_name):
         """Переключить комнату"""
         if self.room_states[room_name]:
-            return self.turn_off_room(room_name)
+            return await self.turn_off_room(room_name)
         else:
-            return self.turn_on_room(room_name)
-    
-    def all_on(self):
+            return await self.turn_on_room(room_name)
+
+    async def all_on(self):
         """Включить все комнаты"""
-        if self.send_command("ALL_ON"):
-            for room in self.room_states:
-                self.room_states[room] = True
-            self._notify_callbacks('all_changed', True)
-            return True
-        return False
-    
-    def all_off(self):
+        return await self._confirmed("ALL_ON", ('all', True))
+
+    async def all_off(self):
         """Выключить все комнаты"""
-        if self.send_command("ALL_OFF"):
-            for room in self.room_states:
-                self.room_states[room] = False
-            self._notify_callbacks('all_changed', False)
-            return True
-        return False
-    
-    def get_status(self):
+        return await self._confirmed("ALL_OFF", ('all', False))
+
+    async def get_status(self):
         """Запросить статус всех комнат"""
-        return self.send_command("STATUS")
-    
-    def get_stats(self):
-        """Запросить статистику потребления"""
-        return self.send_command("STATS")
-    
-    def _read_serial(self):
-        """Чтение данных из Serial порта"""
-        buffer = ""
-        while self.connected and self.ser and self.ser.is_open:
-            try:
-                if self.ser.in_waiting:
-                    data = self.ser.read(self.ser.in_waiting).decode('utf-8', errors='ignore')
-                    buffer += data
-                    
-                    # Обработка полных строк
-                    while '\n' in buffer:
-                        line, buffer = buffer.split('\n', 1)
-                        line = line.strip()
-                        if line:
-                            self._process_received_data(line)
-                
-                time.sleep(0.01)
-            except Exception as e:
-                print(f"❌ Ошибка чтения: {e}")
-                self.connected = False
+        return await self._confirmed("STATUS", ('status',))
+
+    async def get_stats(self):
+        """Запросить статистику потребления (StatsRecord или False)"""
+        if await self._confirmed("STATS", ('stats',)):
+            return self.last_stats
+        return False
+
+    async def events(self, maxsize=1000):
+        """Асинхронный итератор событий: (тип события, аргументы)"""
+        queue = asyncio.Queue(maxsize)
+        self.event_queues.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.event_queues.remove(queue)
+
+    def _on_data(self, data):
+        started = time.perf_counter()
+        self.metric_bytes_in.inc(len(data))
+        if self.binary:
+            for op, payload in self.frame_decoder.feed(data):
+                self.metric_messages_in.inc()
+                self._process_frame(op, payload)
+        else:
+            for line in self.framer.feed(data):
+                self.metric_messages_in.inc()
+                self._process_received_data(line)
+        self.metric_parse.observe(time.perf_counter() - started)
+
+    def _process_frame(self, op, payload):
+        """Обработка кадра бинарного протокола"""
+        if op == OP_STATE:
+            self._apply_mask(decode_mask(payload))
+        elif op == OP_PONG:
+            self._on_pong(None)
+        elif op == OP_STATS_REPLY:
+            self._on_stats(payload.decode('ascii', errors='ignore'))
+        elif op == OP_QUICK:
+            self._on_quick(payload.decode('ascii', errors='ignore'))
+        elif op == OP_ERROR:
+            self._on_error_reply(payload.decode('ascii', errors='ignore'))
+        elif op == OP_TEXT:
+            self._process_received_data(payload.decode('utf-8', errors='ignore'))
+
+    def _apply_mask(self, mask):
+        """Состояние всех каналов из маски: подтверждения и события"""
+        states = set()
+        for room, channel in self.channels.items():
+            state = bool(mask >> channel & 1)
+            states.add(state)
+            if room in self.room_states and self.room_states[room] != state:
+                self.room_states[room] = state
+                self._notify_callbacks('room_changed', room, state)
+            self._resolve(('room', room, state), state)
+        if len(states) == 1:
+            self._resolve(('all', state), state)
+        if ('status',) in self.pending:
+            self._resolve(('status',), dict(self.room_states))
+            self._notify_callbacks('status_updated', dict(self.room_states))
+
+    def _on_lost(self, exc):
+        print(f"❌ Ошибка чтения: {exc or 'порт закрыт'}")
+        self._close_link()
+
+    def _resolve(self, key, value=True):
+        """Разрешить самую раннюю команду, ожидающую ответа key"""
+        waiters = self.pending.get(key)
+        while waiters:
+            futures, sent_at = waiters.popleft()
+            futures = [future for future in futures if not future.done()]
+            if futures:
+                rtt = time.perf_counter() - sent_at
+                self.last_rtt = rtt
+                self.rtt_samples.append(rtt)
+                self.metric_rtt.observe(rtt)
+                for future in futures:
+                    future.set_result(value)
                 break
-    
+        if not waiters:
+            self.pending.pop(key, None)
+
+    def _fail_pending(self):
+        for waiters in self.pending.values():
+            for futures, _ in waiters:
+                self._fail(futures)
+        for item in self.outbox.values():
+            self._fail(item.futures)
+        self.pending.clear()
+        self.outbox.clear()
+
+    @staticmethod
+    def _fail(futures):
+        for future in futures:
+            if not future.done():
+                future.set_exception(ConnectionError('Связь с Arduino потеряна'))
+
     def _process_received_data(self, data):
-        """Обработка полученных данных"""
-        print(f"📥 Получено от Arduino: {data}")
+        """Обработка полученной строки по таблице обработчиков.
+
+        Сначала строка ищется целиком (PONG, ALL_ROOMS_ON...), затем по
+        префиксу до первого ':' (STATUS, STATS...). Остаются ответы комнат
+        вида LIVING_ROOM:ON. Печать только для редких строк (ошибки, старт).
+        """
+        handler = self._LINES.get(data)
+        if handler is not None:
+            handler(self, data)
+            return
+        head, sep, payload = data.partition(':')
+        if sep:
+            handler = self._PREFIXES.get(head)
+            if handler is not None:
+                handler(self, payload)
+                return
+            if payload == 'ON' or payload == 'OFF':
+                self._on_room_reply(head, payload == 'ON')
+                return
+        if 'ERROR' in data:
+            self._on_error(data)
+            return
+        self.unknown_lines += 1
+
+    def _on_pong(self, line):
+        self._resolve(('ping',))
+        self._notify_callbacks('ping_received')
+
+    def _on_ready(self, line):
+        print("✅ Arduino готов к работе")
+
+    def _on_binary_ok(self, line):
+        # Дальше устройство говорит кадрами
+        self.binary = True
+        self.frame_decoder = FrameDecoder()
+        self._resolve(('binary',), True)
+
+    def _on_all_rooms(self, line):
+        state = (line == "ALL_ROOMS_ON")
+        for room in self.room_states:
+            self.room_states[room] = state
+        self._resolve(('all', state), state)
+        self._notify_callbacks('all_changed', state, tuple(self.room_states))
+
+    def _on_room_reply(self, room, state):
+        # Пример: "LIVING_ROOM:ON"
+        room_key = room.lower()
         
-        # Обработка ответов от Arduino
-        if data == "PONG":
-            print("✅ Arduino отвечает на ping")
-            self._notify_callbacks('ping_received')
-            
-        elif data.startswith("STATUS:"):
-            self._parse_status(data)
-            
-        elif data.startswith("STATS:"):
-            print(f"📊 Статистика: {data}")
-            self._notify_callbacks('stats_updated', data)
-            
-        elif data.startswith("QUICK:"):
-            print(f"⚡ Быстрая статистика: {data}")
-            self._notify_callbacks('quick_stats', data)
-            
-        elif "ERROR" in data:
-            print(f"⚠ Ошибка Arduino: {data}")
-            self._notify_callbacks('error', data)
-            
-        elif data == "ARDUINO READY":
-            print("✅ Arduino готов к работе")
-            
-        elif data in ["ALL_ROOMS_ON", "ALL_ROOMS_OFF"]:
-            state = (data == "ALL_ROOMS_ON")
-            for room in self.room_states:
-                self.room_states[room] = state
-            self._notify_callbacks('all_changed', state)
-            
-        elif ":ON" in data or ":OFF" in data:
-            # Пример: "LIVING_ROOM:ON"
-            try:
-                room, state = data.split(":")
-                room_lower = room.lower().replace("_", " ")
-                
-                # Маппинг названий комнат
-                room_mapping = {
-                    'living room': 'living_room',
-                    'kitchen': 'kitchen',
-                    'bedroom': 'bedroom',
-                    'bathroom': 'bathroom',
-                    'hallway': 'hallway'
-                }
-                
-                if room_lower in room_mapping:
-                    room_key = room_mapping[room_lower]
-                    self.room_states[room_key] = (state == "ON")
-                    self._notify_callbacks('room_changed', room_key, state == "ON")
-            except:
-                pass
-    
-    def _parse_status(self, status_str):
-        """Разбор строки статуса"""
+        # Подтверждение команды (в том числе для комнат вне маппинга)
+        self._resolve(('room', room_key, state), state)
+        
+        # Комнаты этого устройства
+        if room_key in self.room_states:
+            self.room_states[room_key] = state
+            self._notify_callbacks('room_changed', room_key, state)
+
+    def _on_status(self, payload):
+        # Пример: STATUS:LIVING_ROOM:1,KITCHEN:0,...
+        room_states = self.room_states
+        for room, state in _fields(payload):
+            room_key = room.lower()
+            if room_key in room_states:
+                room_states[room_key] = (state == '1')
+        self._resolve(('status',), dict(room_states))
+        self._notify_callbacks('status_updated', dict(room_states))
+
+    def _on_stats(self, payload):
         try:
-            # Пример: STATUS:LIVING_ROOM:1,KITCHEN:0,...
-            status_data = status_str[7:]  # Убираем "STATUS:"
-            parts = status_data.split(',')
-            
-            for part in parts:
-                if ':' in part:
-                    room, state = part.split(':')
-                    room_lower = room.lower().replace("_", " ")
-                    
-                    # Маппинг названий комнат
-                    room_mapping = {
-                        'living room': 'living_room',
-                        'kitchen': 'kitchen', 
-                        'bedroom': 'bedroom',
-                        'bathroom': 'bathroom',
-                        'hallway': 'hallway'
-                    }
-                    
-                    if room_lower in room_mapping:
-                        room_key = room_mapping[room_lower]
-                        self.room_states[room_key] = (state == '1')
-            
-            print(f"✓ Статус обновлен: {self.room_states}")
-            self._notify_callbacks('status_updated', self.room_states)
-            
-        except Exception as e:
-            print(f"Ошибка парсинга статуса: {e}")
+            record = parse_stats(payload)
+        except ValueError:
+            self.unknown_lines += 1
+            return
+        self.last_stats = record
+        self._resolve(('stats',), record)
+        self._notify_callbacks('stats_updated', record)
+
+    def _on_quick(self, payload):
+        try:
+            record = parse_quick(payload)
+        except ValueError:
+            self.unknown_lines += 1
+            return
+        self.last_quick = record
+        self._notify_callbacks('quick_stats', record)
+
+    def _on_error(self, message):
+        print(f"⚠ Ошибка Arduino: {message}")
+        if not self.binary:
+            # Ответ старой прошивки на BINARY: остаемся на тексте
+            self._resolve(('binary',), False)
+        self._notify_callbacks('error', message)
+
+    def _on_error_reply(self, payload):
+        self._on_error("ERROR:" + payload)
+
+    # Таблицы разбора строк: целиком и по префиксу до ':'
+    _LINES = {
+        'PONG': _on_pong,
+        'ARDUINO READY': _on_ready,
+        'BINARY:OK': _on_binary_ok,
+        'ALL_ROOMS_ON': _on_all_rooms,
+        'ALL_ROOMS_OFF': _on_all_rooms
+    }
+    _PREFIXES = {
+        'STATUS': _on_status,
+        'STATS': _on_stats,
+        'QUICK': _on_quick,
+        'ERROR': _on_error_reply
+    }
     
-    def add_callback(self, callback):
-        """Добавить callback-функцию для уведомлений"""
-        self.callbacks.append(callback)
+    def add_callback(self, callback, topics=None, maxsize=1000, policy=DROP_OLDEST, key=event_key):
+        """Добавить callback-функцию для уведомлений.
+
+        Callback вызывается в собственном потоке шины событий; topics
+        ограничивает типы событий, policy - поведение при переполнении
+        очереди (см. event_bus).
+        """
+        return self.bus.subscribe(callback, topics, maxsize, policy, key)
     
-    def _notify_callbacks(self, event_type, *args, **kwargs):
-        """Уведомить все callback-функции"""
-        for callback in self.callbacks:
-            try:
-                callback(event_type, *args, **kwargs)
-            except Exception as e:
-                print(f"Ошибка в callback: {e}")
\ No newline at end of file
+    def _notify_callbacks(self, event_type, *args):
+        """Уведомить подписчиков events() и шину событий (без ожидания)"""
+        for queue in self.event_queues:
+            if queue.full():
+                queue.get_nowait()  # медленный подписчик теряет самое старое событие
+            queue.put_nowait((event_type, args))
+        self.bus.publish(event_type, *args)
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """Общий цикл событий для синхронных подключений (один поток на все)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='arduino-loop', daemon=True).start()
+    return _loop
+
+
+class ArduinoConnector:
+    """Синхронный интерфейс поверх AsyncArduinoConnector.
+
+    Корутины выполняются в общем фоновом цикле событий, а методы ждут их
+    результата, поэтому вызывающий код (Flask) не меняется. События
+    доставляются через шину (event_bus): цикл событий только ставит их в
+    очередь подписчика, а callback вызывается в потоке доставки этого
+    подписчика. Медленный callback не задерживает порт и других
+    подписчиков, но может потерять события по правилу policy.
+    """
+
+    def __init__(self, port='COM3', baudrate=9600, command_timeout=2.0, coalesce_window=0.002,
+                 protocol='text', channels=None):
+        self.device = AsyncArduinoConnector(port, baudrate, command_timeout, coalesce_window,
+                                            protocol, channels)
+        self.loop = _background_loop()
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    @property
+    def port(self):
+        return self.device.port
+
+    @property
+    def baudrate(self):
+        return self.device.baudrate
+
+    @property
+    def connected(self):
+        return self.device.connected
+
+    @property
+    def room_states(self):
+        return self.device.room_states
+
+    @property
+    def binary(self):
+        """True, если связь идет по бинарному протоколу"""
+        return self.device.binary
+
+    @property
+    def link_state(self):
+        return self.device.link_state
+
+    @property
+    def last_rtt(self):
+        """Время подтверждения последней команды, с"""
+        return self.device.last_rtt
+
+    @property
+    def rtt_samples(self):
+        return self.device.rtt_samples
+
+    def connect(self):
+        """Подключиться к Arduino"""
+        return self._call(self.device.connect())
+
+    def disconnect(self):
+        """Отключиться от Arduino"""
+        return self._call(self.device.disconnect())
+
+    def start(self):
+        """Подключаться в фоне, не дожидаясь устройства"""
+        self.loop.call_soon_threadsafe(self.device.start)
+
+    def stop(self):
+        """Остановить фоновое переподключение и отключиться"""
+        return self._call(self.device.stop())
+
+    def send_command(self, command):
+        """Отправить команду на Arduino"""
+        return self._call(self.device.send_command(command))
+
+    def send_ping(self):
+        """Отправить ping на Arduino"""
+        return self._call(self.device.send_ping())
+
+    def turn_on_room(self, room_name):
+        """Включить комнату"""
+        return self._call(self.device.turn_on_room(room_name))
+
+    def turn_off_room(self, room_name):
+        """Выключить комнату"""
+        return self._call(self.device.turn_off_room(room_name))
+
+    def toggle_room(self, room_name):
+        """Переключить комнату"""
+        return self._call(self.device.toggle_room(room_name))
+
+    def all_on(self):
+        """Включить все комнаты"""
+        return self._call(self.device.all_on())
+
+    def all_off(self):
+        """Выключить все комнаты"""
+        return self._call(self.device.all_off())
+
+    def get_status(self):
+        """Запросить статус всех комнат"""
+        return self._call(self.device.get_status())
+
+    def get_stats(self):
+        """Запросить статистику потребления"""
+        return self._call(self.device.get_stats())
+
+    def add_callback(self, callback, topics=None, maxsize=1000, policy=DROP_OLDEST, key=event_key):
+        """Добавить callback-функцию для уведомлений (вызывается в потоке шины событий)"""
+        return self.device.add_callback(callback, topics, maxsize, policy, key)
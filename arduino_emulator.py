@@ -0,0 +1,314 @@
+# arduino_emulator.py - программная модель Arduino для проверки без железа
+#
+# Понимает тот же текстовый протокол, что и скетч (PING, <КОМНАТА>_ON/_OFF,
+# ALL_ON/ALL_OFF, STATUS, STATS, QUICK), а после команды BINARY - бинарные кадры
+# из arduino_connector. Эмулятор не привязан к порту: feed() принимает
+# байты от хоста и возвращает байты ответа.
+#
+# EmulatorServer подключает эмулятор к псевдотерминалу (pty) или TCP-порту
+# (URL socket:// для pyserial) и моделирует линию: скорость порта, задержку
+# ответа с разбросом, порчу и потерю ответов.
+#
+#   python arduino_emulator.py --baud 9600 --delay 0.005 --error-rate 0.01
+import os
+import sys
+import time
+import random
+import select
+import socket
+import argparse
+import threading
+
+from arduino_connector import (
+    FrameDecoder, encode_frame, encode_mask, decode_mask,
+    OP_PING, OP_SET_ROOM, OP_SET_MASK, OP_STATUS, OP_STATS, OP_TEXT,
+    OP_PONG, OP_STATE, OP_STATS_REPLY, OP_QUICK, OP_ERROR
+)
+
+# Комнаты в порядке каналов реле и мощность нагрузки в ваттах
+ROOMS = [
+    ('LIVING_ROOM', 100),
+    ('KITCHEN', 150),
+    ('BEDROOM', 80),
+    ('BATHROOM', 60),
+    ('HALLWAY', 50)
+]
+
+
+class ArduinoEmulator:
+    """Состояние реле и разбор команд, как в прошивке"""
+
+    def __init__(self, rooms=ROOMS, binary_supported=True):
+        self.rooms = [name for name, _ in rooms]
+        self.watts = dict(rooms)
+        self.states = {name: False for name in self.rooms}
+        self.binary_supported = binary_supported
+        self.binary = False
+        self.started = time.monotonic()
+        self.line = bytearray()
+        self.decoder = FrameDecoder()
+
+    def banner(self):
+        return b'ARDUINO READY\n'
+
+    def feed(self, data):
+        """Принять байты от хоста, вернуть байты ответа"""
+        reply = bytearray()
+        if self.binary:
+            for op, payload in self.decoder.feed(data):
+                reply += self.handle_frame(op, payload)
+            return bytes(reply)
+
+        for i, byte in enumerate(data):
+            if byte == 0x0A:
+                command = self.line.decode('ascii', errors='ignore').strip()
+                self.line.clear()
+                if command:
+                    reply += self.handle_text(command)
+                if self.binary:
+                    # Остаток пачки уже в кадрах
+                    reply += self.feed(data[i + 1:])
+                    break
+            elif byte != 0x0D:
+                self.line.append(byte)
+        return bytes(reply)
+
+    # Текстовый протокол
+
+    def handle_text(self, command):
+        if command == 'PING':
+            return b'PONG\n'
+        if command == 'STATUS':
+            return ('STATUS:' + self.status_text() + '\n').encode()
+        if command == 'STATS':
+            return ('STATS:' + self.stats_text() + '\n').encode()
+        if command == 'QUICK':
+            return ('QUICK:' + self.quick_text() + '\n').encode()
+        if command == 'BINARY':
+            if not self.binary_supported:
+                return b'ERROR:UNKNOWN_COMMAND\n'
+            self.binary = True
+            self.decoder = FrameDecoder()
+            return b'BINARY:OK\n'
+        if command in ('ALL_ON', 'ALL_OFF'):
+            state = command == 'ALL_ON'
+            for name in self.rooms:
+                self.states[name] = state
+            return b'ALL_ROOMS_ON\n' if state else b'ALL_ROOMS_OFF\n'
+        for suffix, state in (('_ON', True), ('_OFF', False)):
+            name = command[:-len(suffix)]
+            if command.endswith(suffix) and name in self.states:
+                self.states[name] = state
+                return f'{name}:{"ON" if state else "OFF"}\n'.encode()
+        return f'ERROR:UNKNOWN_COMMAND:{command}\n'.encode()
+
+    def status_text(self):
+        return ','.join(f'{name}:{int(self.states[name])}' for name in self.rooms)
+
+    def stats_text(self):
+        uptime = int(time.monotonic() - self.started)
+        parts = [f'UPTIME:{uptime}']
+        parts.extend(f'{name}:{self.power(name)}' for name in self.rooms)
+        parts.append(f'TOTAL:{self.total_power()}')
+        return ','.join(parts)
+
+    def quick_text(self):
+        return f'POWER:{self.total_power()},ON:{sum(self.states.values())}'
+
+    def power(self, name):
+        return self.watts[name] if self.states[name] else 0
+
+    def total_power(self):
+        return sum(self.power(name) for name in self.rooms)
+
+    # Бинарный протокол
+
+    def mask(self):
+        value = 0
+        for channel, name in enumerate(self.rooms):
+            if self.states[name]:
+                value |= 1 << channel
+        return value
+
+    def handle_frame(self, op, payload):
+        if op == OP_PING:
+            return encode_frame(OP_PONG)
+        if op == OP_STATUS:
+            return encode_frame(OP_STATE, encode_mask(self.mask()))
+        if op == OP_STATS:
+            return encode_frame(OP_STATS_REPLY, self.stats_text().encode())
+        if op == OP_SET_ROOM and len(payload) == 2:
+            channel, state = payload
+            if channel < len(self.rooms):
+                self.states[self.rooms[channel]] = bool(state)
+                return encode_frame(OP_STATE, encode_mask(self.mask()))
+        elif op == OP_SET_MASK and len(payload) == 4:
+            mask, values = decode_mask(payload[:2]), decode_mask(payload[2:])
+            for channel, name in enumerate(self.rooms):
+                if mask >> channel & 1:
+                    self.states[name] = bool(values >> channel & 1)
+            return encode_frame(OP_STATE, encode_mask(self.mask()))
+        elif op == OP_TEXT:
+            command = payload.decode('ascii', errors='ignore')
+            if command == 'QUICK':
+                return encode_frame(OP_QUICK, self.quick_text().encode())
+            reply = self.handle_text(command).rstrip(b'\n')
+            return encode_frame(OP_TEXT, reply)
+        return encode_frame(OP_ERROR, b'BAD_FRAME')
+
+
+class EmulatorServer:
+    """Эмулятор на конце линии с характеристиками реального порта.
+
+    Прием и ответ обрабатываются последовательно, как в однопоточной
+    прошивке: байты "идут по проводу" len * 10 / baudrate секунд в каждую
+    сторону, ответ готовится delay + случайное [0, jitter) секунд.
+    error_rate - доля ответов с одним испорченным битом, drop_rate - доля
+    потерянных ответов. При quick_interval > 0 устройство само присылает
+    QUICK-статистику с этим периодом.
+    """
+
+    def __init__(self, emulator=None, baudrate=9600, delay=0.0, jitter=0.0,
+                 error_rate=0.0, drop_rate=0.0, quick_interval=0.0, seed=None):
+        self.emulator = emulator or ArduinoEmulator()
+        self.baudrate = baudrate
+        self.delay = delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.quick_interval = quick_interval
+        self.random = random.Random(seed)
+        self.stats = {'rx_bytes': 0, 'tx_bytes': 0, 'replies': 0, 'corrupted': 0, 'dropped': 0}
+        self.running = False
+        self.thread = None
+
+    def serve_pty(self):
+        """Запустить на псевдотерминале, вернуть имя порта (/dev/pts/N)"""
+        import pty
+        import tty
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        tty.setraw(master)
+        self._slave = slave
+        self._start(master, lambda: os.read(master, 4096), lambda data: os.write(master, data))
+        return os.ttyname(slave)
+
+    def serve_tcp(self, host='127.0.0.1', port=0):
+        """Запустить на TCP-порту, вернуть URL для serial_for_url (socket://...)"""
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        listener.listen(1)
+        self.listener = listener
+
+        def accept():
+            while self.running:
+                try:
+                    conn, _ = listener.accept()
+                except OSError:
+                    return
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.emulator.binary = False
+                self._loop(conn, lambda: conn.recv(4096), conn.sendall)
+                conn.close()
+
+        self.running = True
+        self.thread = threading.Thread(target=accept, name='arduino-emulator', daemon=True)
+        self.thread.start()
+        return f'socket://{host}:{listener.getsockname()[1]}'
+
+    def stop(self):
+        self.running = False
+        if getattr(self, 'listener', None):
+            self.listener.close()
+
+    def _start(self, fd, read, write):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, args=(fd, read, write),
+                                       name='arduino-emulator', daemon=True)
+        self.thread.start()
+
+    def _wire(self, size):
+        time.sleep(size * 10 / self.baudrate)
+
+    def _loop(self, fd, read, write):
+        self._send(write, self.emulator.banner())
+        next_quick = time.monotonic() + self.quick_interval if self.quick_interval else None
+        while self.running:
+            timeout = max(next_quick - time.monotonic(), 0) if next_quick else 0.5
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if next_quick and time.monotonic() >= next_quick:
+                self._send(write, self.quick())
+                next_quick += self.quick_interval
+            if not ready:
+                continue
+            try:
+                data = read()
+            except OSError:
+                return
+            if not data:
+                return
+            self.stats['rx_bytes'] += len(data)
+            self._wire(len(data))
+            reply = self.emulator.feed(data)
+            if not reply:
+                continue
+            pause = self.delay + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            if pause:
+                time.sleep(pause)
+            self._send(write, reply)
+
+    def _send(self, write, reply):
+        self.stats['replies'] += 1
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.stats['dropped'] += 1
+            return
+        if self.error_rate and self.random.random() < self.error_rate:
+            reply = bytearray(reply)
+            reply[self.random.randrange(len(reply))] ^= 1 << self.random.randrange(8)
+            reply = bytes(reply)
+            self.stats['corrupted'] += 1
+        self._wire(len(reply))
+        try:
+            write(reply)
+        except OSError:
+            self.running = False
+            return
+        self.stats['tx_bytes'] += len(reply)
+
+    def quick(self):
+        """Непрошеная QUICK-статистика в текущем протоколе"""
+        text = self.emulator.quick_text()
+        if self.emulator.binary:
+            return encode_frame(OP_QUICK, text.encode())
+        return ('QUICK:' + text + '\n').encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Эмулятор Arduino для проверки без железа')
+    parser.add_argument('--tcp', type=int, metavar='PORT',
+                        help='слушать TCP-порт (socket://) вместо pty')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--delay', type=float, default=0.0, help='задержка ответа, с')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля испорченных ответов')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='доля потерянных ответов')
+    parser.add_argument('--quick-interval', type=float, default=0.0,
+                        help='период непрошеной QUICK-статистики, с')
+    parser.add_argument('--text-only', action='store_true', help='не поддерживать бинарный протокол')
+    args = parser.parse_args()
+
+    server = EmulatorServer(ArduinoEmulator(binary_supported=not args.text_only), args.baud,
+                            args.delay, args.jitter, args.error_rate, args.drop_rate,
+                            args.quick_interval)
+    port = server.serve_tcp(port=args.tcp) if args.tcp is not None else server.serve_pty()
+    print(f"🔌 Эмулятор Arduino: {port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"📊 {server.stats}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# arduino_pool.py - несколько Arduino как одна система освещения
+import os
+import asyncio
+
+from arduino_connector import AsyncArduinoConnector, SUPERSEDED, _background_loop
+from event_bus import EventBus, DROP_OLDEST, event_key
+
+# Контроллеры реле: порт и комнаты с номерами каналов на каждом.
+# protocol 'auto' - бинарный протокол, если прошивка его поддерживает.
+# ARDUINO_PORT позволяет подключить эмулятор (arduino_emulator.py).
+# Таблица общая для app.py и процесса-владельца портов (device_service.py)
+DEFAULT_DEVICES = {
+    'main': {
+        'port': os.environ.get('ARDUINO_PORT', 'COM3'),
+        'baudrate': 9600,
+        'protocol': 'auto',
+        'rooms': {'living_room': 0, 'kitchen': 1, 'bedroom': 2, 'bathroom': 3, 'hallway': 4}
+    }
+}
+
+
+class ArduinoPool:
+    """Набор устройств с таблицей маршрутов комната -> (устройство, канал).
+
+    У каждого устройства свой порт, своя очередь команд и свой читатель,
+    а работают они в общем фоновом цикле событий. Команда для комнаты
+    уходит только на ее устройство, а массовые операции рассылаются всем
+    устройствам параллельно, поэтому время переключения всего здания
+    определяется самым медленным портом, а не суммой всех.
+
+    Интерфейс совпадает с ArduinoConnector, поэтому app.py работает с
+    пулом из одного устройства так же, как раньше с одним подключением.
+    """
+
+    def __init__(self, devices, command_timeout=2.0, coalesce_window=0.002, protocol='text'):
+        # devices: {имя: {'port': ..., 'baudrate': ..., 'rooms': {комната: канал}}}
+        self.devices = {}
+        self.routing = {}
+        self.bus = EventBus()   # общая шина событий всех устройств
+        for name, spec in devices.items():
+            rooms = dict(spec['rooms'])
+            for room, channel in rooms.items():
+                if room in self.routing:
+                    raise ValueError(f'Комната {room} назначена двум устройствам')
+                self.routing[room] = (name, channel)
+            device = AsyncArduinoConnector(spec['port'], spec.get('baudrate', 9600),
+                                           command_timeout, coalesce_window,
+                                           spec.get('protocol', protocol), rooms, bus=self.bus)
+            self.devices[name] = device
+        self.loop = _background_loop()
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def each(self, method):
+        """Вызвать метод на всех устройствах параллельно: {имя: результат}"""
+        names = list(self.devices)
+        results = await asyncio.gather(
+            *(getattr(self.devices[name], method)() for name in names),
+            return_exceptions=True
+        )
+        return {
+            name: (False if isinstance(result, Exception) else result)
+            for name, result in zip(names, results)
+        }
+
+    def device_for(self, room_name):
+        """Устройство, управляющее комнатой, или None"""
+        route = self.routing.get(room_name)
+        return self.devices[route[0]] if route else None
+
+    @property
+    def connected(self):
+        """True, если подключено хотя бы одно устройство"""
+        return any(device.connected for device in self.devices.values())
+
+    @property
+    def link_state(self):
+        """Состояние связи каждого устройства: {имя: 'connected'/'connecting'/'disconnected'}"""
+        return {name: device.link_state for name, device in self.devices.items()}
+
+    def room_connected(self, room_name):
+        """Есть ли сейчас связь с устройством комнаты"""
+        device = self.device_for(room_name)
+        return device is not None and device.connected
+
+    @property
+    def room_states(self):
+        states = {}
+        for device in self.devices.values():
+            states.update(device.room_states)
+        return states
+
+    def connect(self):
+        """Подключиться ко всем устройствам параллельно"""
+        results = self._call(self.each('connect'))
+        connected = [name for name, ok in results.items() if ok]
+        print(f"✓ Подключено устройств: {len(connected)} из {len(results)}")
+        return bool(connected)
+
+    def disconnect(self):
+        """Отключиться от всех устройств"""
+        self._call(self.each('disconnect'))
+
+    def start(self):
+        """Подключаться ко всем устройствам в фоне, не дожидаясь их"""
+        for device in self.devices.values():
+            self.loop.call_soon_threadsafe(device.start)
+
+    def stop(self):
+        """Остановить фоновое переподключение и отключиться"""
+        self._call(self.each('stop'))
+
+    async def room_command(self, room_name, method):
+        """Выполнить команду комнаты (turn_on_room и т.п.) на ее устройстве"""
+        device = self.device_for(room_name)
+        if device is None:
+            print(f"⚠ Комната {room_name} не привязана ни к одному устройству")
+            return False
+        return await getattr(device, method)(room_name)
+
+    async def all_command(self, method):
+        """Выполнить команду на всех устройствах (True - подтвердили все).
+
+        SUPERSEDED - хотя бы на одном устройстве команду заменила более
+        поздняя, а остальные ее подтвердили.
+        """
+        results = list((await self.each(method)).values())
+        if not all(results):
+            return False
+        return SUPERSEDED if SUPERSEDED in results else True
+
+    def _room_call(self, room_name, method):
+        return self._call(self.room_command(room_name, method))
+
+    def turn_on_room(self, room_name):
+        """Включить комнату"""
+        return self._room_call(room_name, 'turn_on_room')
+
+    def turn_off_room(self, room_name):
+        """Выключить комнату"""
+        return self._room_call(room_name, 'turn_off_room')
+
+    def toggle_room(self, room_name):
+        """Переключить комнату"""
+        return self._room_call(room_name, 'toggle_room')
+
+    def all_on(self):
+        """Включить все комнаты (True - подтвердили все устройства)"""
+        return self._call(self.all_command('all_on'))
+
+    def all_off(self):
+        """Выключить все комнаты (True - подтвердили все устройства)"""
+        return self._call(self.all_command('all_off'))
+
+    def send_ping(self):
+        return self._call(self.all_command('send_ping'))
+
+    def get_status(self):
+        """Запросить статус всех устройств"""
+        return self._call(self.all_command('get_status'))
+
+    def get_stats(self):
+        """Запросить статистику у всех устройств: {имя: StatsRecord или False}"""
+        return self._call(self.each('get_stats'))
+
+    def add_callback(self, callback, topics=None, maxsize=1000, policy=DROP_OLDEST, key=event_key):
+        """Подписать callback на события всех устройств (см. event_bus)"""
+        return self.bus.subscribe(callback, topics, maxsize, policy, key)
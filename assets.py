@@ -0,0 +1,142 @@
+# assets.py - заранее сжатые статические ответы с ETag и отпечатками в URL
+import os
+import re
+import gzip
+import hashlib
+import posixpath
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаем gzip
+    brotli = None
+
+
+class PrecompressedAsset:
+    """Неизменяемый ответ, подготовленный один раз при старте.
+
+    Тело хранится в виде байтов вместе с gzip- и brotli-вариантами,
+    поэтому запрос не тратит время ни на рендеринг, ни на сжатие.
+    У каждого варианта свой сильный ETag.
+    """
+
+    def __init__(self, body, content_type, cache_control='no-cache', compress=True):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.variants = {None: body}
+        if compress:
+            self.variants['gzip'] = gzip.compress(body, 9, mtime=0)
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(body, quality=11)
+
+    def etag(self, encoding):
+        tag = self.digest[:32]
+        return f'{tag}-{encoding}' if encoding else tag
+
+    def choose_encoding(self, request):
+        """Лучший вариант из тех, что принимает клиент"""
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accepted[encoding]:
+                return encoding
+        return None
+
+    def response(self, request):
+        """Ответ на запрос: 304 при совпадении ETag, иначе тело нужного варианта"""
+        encoding = self.choose_encoding(request)
+        etag = self.etag(encoding)
+        headers = {
+            'ETag': f'"{etag}"',
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': self.cache_control
+        }
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return Response(self.variants[encoding], content_type=self.content_type, headers=headers)
+
+
+# Типы файлов: (Content-Type, сжимать ли заранее)
+ASSET_TYPES = {
+    '.css': ('text/css; charset=utf-8', True),
+    '.js': ('application/javascript; charset=utf-8', True),
+    '.json': ('application/json', True),
+    '.svg': ('image/svg+xml', True),
+    '.ttf': ('font/ttf', True),
+    '.woff': ('font/woff', False),
+    '.woff2': ('font/woff2', False),
+    '.png': ('image/png', False),
+    '.ico': ('image/x-icon', False)
+}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+CSS_URL = re.compile(rb'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+class AssetManifest:
+    """Каталог статики с хешем содержимого в именах файлов.
+
+    При сборке каждый файл читается один раз и получает имя вида
+    css/app.3f2a9c1b7d4e.css; такой URL никогда не меняет содержимое,
+    поэтому отдается с Cache-Control: immutable. Ссылки url(...) внутри
+    CSS переписываются на отпечатанные имена шрифтов и картинок.
+    """
+
+    def __init__(self, directory, url_prefix='/static'):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.urls = {}      # логическое имя -> URL с отпечатком
+        self.assets = {}    # имя с отпечатком -> PrecompressedAsset
+
+    def build(self):
+        names = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.relpath(os.path.join(root, filename), self.directory)
+                name = path.replace(os.sep, '/')
+                if os.path.splitext(name)[1] in ASSET_TYPES:
+                    names.append(name)
+
+        # CSS обрабатываем последним, когда отпечатки остальных файлов известны
+        for name in sorted(names, key=lambda n: (n.endswith('.css'), n)):
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                body = f.read()
+            if name.endswith('.css'):
+                body = self._rewrite_css(name, body)
+            self._add(name, body)
+        return self
+
+    def url(self, name, fallback=None):
+        """URL файла с отпечатком (или fallback, если файла нет)"""
+        return self.urls.get(name, fallback)
+
+    def get(self, filename):
+        return self.assets.get(filename)
+
+    def _add(self, name, body):
+        stem, ext = os.path.splitext(name)
+        content_type, compress = ASSET_TYPES[ext]
+        fingerprint = hashlib.sha256(body).hexdigest()[:12]
+        hashed = f'{stem}.{fingerprint}{ext}'
+        self.assets[hashed] = PrecompressedAsset(body, content_type, IMMUTABLE, compress)
+        self.urls[name] = f'{self.url_prefix}/{hashed}'
+
+    def _rewrite_css(self, name, body):
+        base = posixpath.dirname(name)
+
+        def replace(match):
+            ref = match.group(2).decode('utf-8')
+            if ref.startswith(('data:', 'http:', 'https:', '//', '#')):
+                return match.group(0)
+            path, suffix = re.match(r'([^?#]*)(.*)', ref).groups()
+            url = self.urls.get(posixpath.normpath(posixpath.join(base, path)))
+            if url is None:
+                return match.group(0)
+            return f'url({url}{suffix})'.encode('utf-8')
+
+        return CSS_URL.sub(replace, body)
@@ -0,0 +1,120 @@
+# bench_arduino.py - пропускная способность и задержки на эмуляторе Arduino
+#
+# Запускает ArduinoEmulator на pty (или TCP) и измеряет подтверждение команд
+# подключением и, с флагом --flask, время ответа API переключения комнат.
+#
+#   python bench_arduino.py --commands 2000 --concurrency 32 --baud 115200
+#   python bench_arduino.py --flask --commands 300
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+from arduino_connector import AsyncArduinoConnector
+from arduino_emulator import ArduinoEmulator, EmulatorServer
+
+ROOMS = ['living_room', 'kitchen', 'bedroom', 'bathroom', 'hallway']
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def report(title, latencies, elapsed, failed):
+    print(f"📊 {title}: {len(latencies)} за {elapsed:.2f} с "
+          f"({len(latencies) / elapsed:.0f}/с), ошибок {failed}")
+    print(f"   p50 {percentile(latencies, 0.5) * 1000:.2f} мс, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.2f} мс, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f} мс")
+
+
+def bench_rooms(count):
+    """По комнате на каждого параллельного клиента, чтобы команды не вытесняли друг друга"""
+    return [(f'ROOM{i}', 100) for i in range(count)]
+
+
+async def bench_connector(port, args):
+    channels = {name.lower(): i for i, (name, _) in enumerate(bench_rooms(args.concurrency))}
+    device = AsyncArduinoConnector(port, args.baud, protocol=args.protocol, channels=channels)
+    if not await device.connect():
+        print("❌ Не удалось подключиться к эмулятору")
+        return
+    latencies = []
+    failed = 0
+    counter = iter(range(args.commands))
+
+    async def worker(room):
+        nonlocal failed
+        state = False
+        for _ in counter:
+            state = not state
+            start = time.perf_counter()
+            if await (device.turn_on_room(room) if state else device.turn_off_room(room)):
+                latencies.append(time.perf_counter() - start)
+            else:
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(room) for room in channels))
+    report('команды', latencies, time.perf_counter() - start, failed)
+    await device.disconnect()
+
+
+def bench_flask(port, args):
+    # app.py подключается к устройству из ARDUINO_PORT при импорте
+    os.environ['ARDUINO_PORT'] = port
+    from app import app, arduino
+    for _ in range(100):
+        if arduino.connected:
+            break
+        time.sleep(0.1)
+    client = app.test_client()
+    client.post('/api/login', json={'username': 'admin', 'password': 'admin123'})
+
+    latencies = []
+    failed = 0
+    start = time.perf_counter()
+    for i in range(args.commands):
+        state = 'on' if i % 2 == 0 else 'off'
+        t0 = time.perf_counter()
+        response = client.post(f'/api/room/{ROOMS[i % len(ROOMS)]}/{state}')
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - t0)
+        else:
+            failed += 1
+    report('POST /api/room', latencies, time.perf_counter() - start, failed)
+    arduino.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест на эмуляторе Arduino')
+    parser.add_argument('--commands', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='параллельных клиентов (до 16 для бинарного протокола)')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--protocol', choices=['text', 'binary', 'auto'], default='text')
+    parser.add_argument('--tcp', action='store_true', help='эмулятор на TCP вместо pty')
+    parser.add_argument('--flask', action='store_true', help='мерить API вместо подключения')
+    args = parser.parse_args()
+
+    rooms = ROOMS if args.flask else bench_rooms(args.concurrency)
+    emulator = ArduinoEmulator([(name.upper(), 100) for name in rooms] if args.flask else rooms)
+    server = EmulatorServer(emulator, args.baud, args.delay, args.jitter, args.error_rate)
+    port = server.serve_tcp() if args.tcp else server.serve_pty()
+    print(f"🔌 Эмулятор: {port}")
+    if args.flask:
+        bench_flask(port, args)
+    else:
+        asyncio.run(bench_connector(port, args))
+    print(f"📊 Эмулятор: {server.stats}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+# bench_parser.py - скорость разбора строк от Arduino (строк в секунду)
+#
+# Прогоняет типичный поток ответов через LineFramer и разбор строк
+# AsyncArduinoConnector без порта и без подписчиков.
+#
+#   python bench_parser.py --lines 200000
+import sys
+import time
+import argparse
+
+from arduino_connector import AsyncArduinoConnector, LineFramer
+
+SAMPLE = [
+    'LIVING_ROOM:ON',
+    'KITCHEN:OFF',
+    'PONG',
+    'STATUS:LIVING_ROOM:1,KITCHEN:0,BEDROOM:1,BATHROOM:0,HALLWAY:1',
+    'STATS:UPTIME:86400,LIVING_ROOM:100,KITCHEN:0,BEDROOM:80,BATHROOM:0,HALLWAY:50,TOTAL:230',
+    'QUICK:POWER:230,ON:3',
+    'ALL_ROOMS_OFF',
+    'BEDROOM:ON'
+]
+
+
+def run(device, lines, chunk):
+    data = ('\n'.join(lines) + '\n').encode()
+    framer = LineFramer()
+    start = time.perf_counter()
+    for i in range(0, len(data), chunk):
+        for line in framer.feed(data[i:i + chunk]):
+            device._process_received_data(line)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарк разбора строк Arduino')
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--chunk', type=int, default=64, help='размер порции байтов с порта')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    lines = [SAMPLE[i % len(SAMPLE)] for i in range(args.lines)]
+    device = AsyncArduinoConnector('loop://')
+    best = min(run(device, lines, args.chunk) for _ in range(args.repeat))
+    print(f"📊 {args.lines} строк за {best:.3f} с: {args.lines / best:,.0f} строк/с "
+          f"(порции по {args.chunk} байт, лучший из {args.repeat})")
+    print(f"   нераспознанных строк: {device.unknown_lines}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+# device_service.py - один процесс владеет портами Arduino, воркеры ходят к нему
+#
+# Процесс-владелец держит ArduinoPool и слушает Unix-сокет. Воркеры
+# gunicorn подключаются через DeviceClient, у которого тот же интерфейс,
+# что у ArduinoPool: команды отправляются владельцу, события устройств
+# приходят обратно и раздаются локальной шиной событий.
+#
+# Кадр: длина тела u32, тип u8, номер запроса u32, тело - компактный JSON.
+# Запросы одного соединения не ждут друг друга: ответы приходят по мере
+# готовности с номером запроса, поэтому один сокет обслуживает все потоки
+# воркера, а команды разных воркеров склеиваются в общей очереди порта.
+#
+#   python device_service.py --socket /tmp/smart-energy-devices.sock
+#
+# С --supervise владелец работает дочерним процессом и перезапускается,
+# если завершился: без него команды устройствам не проходят.
+import os
+import sys
+import json
+import time
+import signal
+import random
+import socket
+import struct
+import asyncio
+import subprocess
+import argparse
+import itertools
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from arduino_pool import ArduinoPool, DEFAULT_DEVICES
+from event_bus import EventBus, DROP_OLDEST, event_key
+
+DEFAULT_SOCKET = '/tmp/smart-energy-devices.sock'
+
+HEADER = struct.Struct('<IBI')
+MAX_MESSAGE = 1 << 20
+
+# Типы кадров
+CALL = 1     # воркер -> владелец: [метод, аргументы]
+RESULT = 2   # владелец -> воркер: результат запроса
+ERROR = 3    # владелец -> воркер: текст ошибки запроса
+EVENT = 4    # владелец -> воркер: [тип события, аргументы]
+STATE = 5    # владелец -> воркер: связь устройств и маршруты комнат
+
+ROOM_METHODS = ('turn_on_room', 'turn_off_room', 'toggle_room')
+ALL_METHODS = ('all_on', 'all_off', 'send_ping', 'get_status')
+
+
+def _json_default(value):
+    # StatsRecord, QuickRecord
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    raise TypeError(f'Не сериализуется: {type(value).__name__}')
+
+
+def encode_message(kind, request_id, body):
+    payload = json.dumps(body, separators=(',', ':'), ensure_ascii=False,
+                         default=_json_default).encode('utf-8')
+    return HEADER.pack(len(payload), kind, request_id) + payload
+
+
+class MessageDecoder:
+    """Сборка кадров из потока байтов"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Добавить байты, вернуть [(тип, номер запроса, тело)]"""
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            length, kind, request_id = HEADER.unpack_from(buffer, offset)
+            if length > MAX_MESSAGE:
+                raise ValueError(f'Слишком длинный кадр: {length} байт')
+            end = offset + HEADER.size + length
+            if end > len(buffer):
+                break
+            messages.append((kind, request_id, json.loads(buffer[offset + HEADER.size:end])))
+            offset = end
+        del buffer[:offset]
+        return messages
+
+
+class DeviceServer:
+    """Unix-сокет владельца портов поверх ArduinoPool.
+
+    Работает в фоновом цикле событий пула. Каждый запрос выполняется своей
+    задачей, события шины рассылаются всем клиентам; клиенту, который не
+    успевает читать, события не дописываются (считаются в dropped).
+    """
+
+    def __init__(self, pool, path, link_poll=0.25, max_buffer=1 << 20):
+        self.pool = pool
+        self.path = path
+        self.link_poll = link_poll
+        self.max_buffer = max_buffer
+        self.clients = set()
+        self.links = {}
+        self.routing = {room: name for room, (name, _) in pool.routing.items()}
+        self.dropped = 0
+        self.server = None
+        self.watcher = None
+        self.subscription = None
+        self.tasks = set()   # выполняемые запросы: цикл событий держит на задачи только слабые ссылки
+
+    async def start(self):
+        # Сокет от прошлого запуска мешает bind
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle, self.path)
+        os.chmod(self.path, 0o660)
+        self.links = self.pool.link_state
+        self.subscription = self.pool.add_callback(self._on_event)
+        self.watcher = asyncio.ensure_future(self._watch_links())
+
+    async def stop(self):
+        if self.watcher:
+            self.watcher.cancel()
+        if self.subscription:
+            self.pool.bus.unsubscribe(self.subscription)
+        for task in list(self.tasks):
+            task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.clients):
+            writer.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _state_message(self):
+        return encode_message(STATE, 0, {'links': self.links, 'routing': self.routing})
+
+    def _broadcast(self, message):
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.dropped += 1
+                continue
+            writer.write(message)
+
+    def _on_event(self, event_type, *args):
+        # Поток шины событий: кадр собирается здесь, отправка - в цикле событий
+        message = encode_message(EVENT, 0, [event_type, args])
+        self.pool.loop.call_soon_threadsafe(self._broadcast, message)
+
+    async def _watch_links(self):
+        while True:
+            await asyncio.sleep(self.link_poll)
+            links = self.pool.link_state
+            if links != self.links:
+                self.links = links
+                self._broadcast(self._state_message())
+
+    async def _handle(self, reader, writer):
+        self.clients.add(writer)
+        writer.write(self._state_message())
+        decoder = MessageDecoder()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for kind, request_id, body in decoder.feed(data):
+                    if kind == CALL:
+                        task = asyncio.ensure_future(self._dispatch(writer, request_id, body))
+                        self.tasks.add(task)
+                        task.add_done_callback(self.tasks.discard)
+        except (ConnectionError, ValueError) as e:
+            print(f"⚠ Клиент владельца портов отключен: {e}")
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, writer, request_id, body):
+        try:
+            method, args = body
+            message = encode_message(RESULT, request_id, await self._execute(method, args))
+        except Exception as e:
+            message = encode_message(ERROR, request_id, str(e))
+        if not writer.is_closing():
+            writer.write(message)
+
+    async def _execute(self, method, args):
+        if method in ROOM_METHODS:
+            return await self.pool.room_command(args[0], method)
+        if method in ALL_METHODS:
+            return await self.pool.all_command(method)
+        if method == 'get_stats':
+            return await self.pool.each('get_stats')
+        raise ValueError(f'Неизвестный метод: {method}')
+
+
+class DeviceClient:
+    """Интерфейс ArduinoPool для воркера: устройства за процессом-владельцем.
+
+    Одно соединение на процесс, запросы всех потоков идут по нему
+    одновременно и различаются номерами. Связь с владельцем
+    восстанавливается в фоне; пока ее нет, команды возвращают False, а
+    устройства считаются отключенными.
+    """
+
+    def __init__(self, path, command_timeout=5.0, reconnect_delay=0.5, reconnect_max_delay=10.0):
+        self.path = path
+        self.command_timeout = command_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.bus = EventBus()
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.links = {}
+        self.routing = {}
+        self.ready = threading.Event()
+        self.running = False
+        self.thread = None
+
+    @property
+    def connected(self):
+        """True, если подключено хотя бы одно устройство"""
+        return any(state == 'connected' for state in self.links.values())
+
+    @property
+    def link_state(self):
+        """Состояние связи каждого устройства: {имя: 'connected'/'connecting'/'disconnected'}"""
+        return dict(self.links)
+
+    def room_connected(self, room_name):
+        """Есть ли сейчас связь с устройством комнаты"""
+        return self.links.get(self.routing.get(room_name)) == 'connected'
+
+    def start(self):
+        """Подключаться к владельцу портов в фоне"""
+        if self.thread is None or not self.thread.is_alive():
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name='device-client', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def connect(self):
+        """Подключиться и дождаться состояния устройств"""
+        self.start()
+        self.ready.wait(self.command_timeout)
+        return self.connected
+
+    def disconnect(self):
+        self.stop()
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while self.running:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                pause = delay / 2 + random.uniform(0, delay / 2)
+                print(f"🔄 Владелец портов недоступен ({e}), повтор через {pause:.1f} с")
+                time.sleep(pause)
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+            delay = self.reconnect_delay
+            self.sock = sock
+            print(f"✅ Подключено к владельцу портов: {self.path}")
+            try:
+                self._read(sock)
+            except (OSError, ValueError) as e:
+                print(f"⚠ Связь с владельцем портов потеряна: {e}")
+            finally:
+                self.sock = None
+                self.links = {}
+                self.ready.clear()
+                sock.close()
+                self._fail_pending()
+
+    def _read(self, sock):
+        decoder = MessageDecoder()
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return
+            for kind, request_id, body in decoder.feed(data):
+                if kind == EVENT:
+                    event_type, args = body
+                    self.bus.publish(event_type, *args)
+                elif kind == STATE:
+                    self.links = body['links']
+                    self.routing = body['routing']
+                    self.ready.set()
+                else:
+                    with self.pending_lock:
+                        future = self.pending.pop(request_id, None)
+                    if future is None:
+                        continue
+                    if kind == ERROR:
+                        print(f"⚠ Ошибка владельца портов: {body}")
+                        body = False
+                    future.set_result(body)
+
+    def _fail_pending(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_result(False)
+
+    def _request(self, method, *args):
+        sock = self.sock
+        if sock is None:
+            return False
+        request_id = next(self.ids) & 0xFFFFFFFF
+        future = Future()
+        with self.pending_lock:
+            self.pending[request_id] = future
+        try:
+            with self.send_lock:
+                sock.sendall(encode_message(CALL, request_id, [method, args]))
+            return future.result(self.command_timeout)
+        except (OSError, FutureTimeout):
+            return False
+        finally:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+
+    def turn_on_room(self, room_name):
+        """Включить комнату"""
+        return self._request('turn_on_room', room_name)
+
+    def turn_off_room(self, room_name):
+        """Выключить комнату"""
+        return self._request('turn_off_room', room_name)
+
+    def toggle_room(self, room_name):
+        """Переключить комнату"""
+        return self._request('toggle_room', room_name)
+
+    def all_on(self):
+        """Включить все комнаты (True - подтвердили все устройства)"""
+        return self._request('all_on')
+
+    def all_off(self):
+        """Выключить все комнаты (True - подтвердили все устройства)"""
+        return self._request('all_off')
+
+    def send_ping(self):
+        return self._request('send_ping')
+
+    def get_status(self):
+        """Запросить статус всех устройств"""
+        return self._request('get_status')
+
+    def get_stats(self):
+        """Статистика всех устройств: {имя: словарь StatsRecord или False}"""
+        return self._request('get_stats')
+
+    def add_callback(self, callback, topics=None, maxsize=1000, policy=DROP_OLDEST, key=event_key):
+        """Подписать callback на события устройств (см. event_bus)"""
+        return self.bus.subscribe(callback, topics, maxsize, policy, key)
+
+
+def supervise(argv, restart_delay=1.0, restart_max_delay=30.0, stable_uptime=60.0):
+    """Запускать владельца портов дочерним процессом и перезапускать после завершения.
+
+    Пауза перед перезапуском растет вдвое после каждого быстрого падения и
+    сбрасывается, если процесс проработал stable_uptime секунд. SIGTERM
+    передается дочернему процессу.
+    """
+    stopping = threading.Event()
+    child = None
+
+    def stop(*_):
+        stopping.set()
+        if child is not None and child.poll() is None:
+            child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    delay = restart_delay
+    try:
+        while not stopping.is_set():
+            started = time.monotonic()
+            child = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + argv)
+            code = child.wait()
+            if stopping.is_set():
+                break
+            if time.monotonic() - started >= stable_uptime:
+                delay = restart_delay
+            print(f"⚠ Владелец портов завершился (код {code}), перезапуск через {delay:.0f} с")
+            stopping.wait(delay)
+            delay = min(delay * 2, restart_max_delay)
+    except KeyboardInterrupt:
+        stop()
+        child.wait()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Процесс-владелец портов Arduino')
+    parser.add_argument('--socket', default=os.environ.get('DEVICE_SOCKET', DEFAULT_SOCKET))
+    parser.add_argument('--supervise', action='store_true',
+                        help='перезапускать процесс-владелец, если он завершился')
+    args = parser.parse_args()
+    if args.supervise:
+        return supervise(['--socket', args.socket])
+
+    pool = ArduinoPool(DEFAULT_DEVICES)
+    server = DeviceServer(pool, args.socket)
+    asyncio.run_coroutine_threadsafe(server.start(), pool.loop).result()
+    pool.start()
+    print(f"🔌 Порты Arduino обслуживаются через {args.socket}")
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    try:
+        while not stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    asyncio.run_coroutine_threadsafe(server.stop(), pool.loop).result()
+    pool.stop()
+    print("👋 Владелец портов остановлен")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# energy_meter.py - энергия по переключениям комнат вместо опроса раз в секунду
+#
+# Для каждой включенной комнаты в разделе состояния 'meter' хранится
+# (on_since, power) по монотонным часам. Энергия power × Δt начисляется,
+# когда комната переключается или меняет мощность, а также когда точные
+# счетчики нужны читателю или журналу (settle). Выключенные комнаты ничего
+# не стоят: работа пропорциональна числу включенных комнат и событий.
+#
+# Базовая нагрузка (base_power) входит только в текущую и пиковую мощность:
+# в счетчики энергии она не начисляется, поэтому и в общий ряд истории
+# (TOTAL) не попадает - графики сходятся с total_today.
+import time
+
+from energy_wal import ADD, PEAK, apply_record
+from timeseries import TimeSeriesStore
+
+
+def accrued(room_id, since, power, now):
+    """Запись ADD за время работы комнаты с since по now (или None)"""
+    if now <= since:
+        return None
+    hours = (now - since) / 3600
+    return (ADD, room_id, power * hours, hours)
+
+
+def settle(draft, journal, now, rooms=None):
+    """Начислить энергию включенных комнат (всех или из rooms) по момент now.
+
+    Записи применяются к черновику и дописываются в журнал; возвращает
+    отсчеты мощности начисленных комнат и общий отсчет для истории.
+    """
+    meter = draft['meter']
+    running = list(meter) if rooms is None else [room_id for room_id in rooms if room_id in meter]
+    records = []
+    samples = {}
+    for room_id in running:
+        since, power = meter[room_id]
+        record = accrued(room_id, since, power, now)
+        if record is not None:
+            records.append(record)
+            samples[room_id] = power
+    if not records:
+        return {}
+
+    updated = draft.edit('meter')
+    for record in records:
+        updated[record[1]] = (now, meter[record[1]][1])
+    energy = draft.edit('energy')
+    hours = draft.edit('stats', 'hours_on_today')
+    for record in records:
+        apply_record(energy, hours, record)
+    journal.append(records)
+    samples[TimeSeriesStore.TOTAL] = sum(power for _, power in updated.values())
+    return samples
+
+
+def switch(draft, journal, rooms, now, base_power):
+    """Перезапустить счетчики комнат rooms после изменения состояния или мощности.
+
+    Накопленное по старой мощности начисляется, затем включенные комнаты
+    считаются с now по текущей мощности, а выключенные (и удаленные)
+    убираются. Возвращает отсчеты мощности комнат и общий для истории.
+    """
+    settle(draft, journal, now, rooms)
+    meter = draft.edit('meter')
+    samples = {}
+    for room_id in rooms:
+        room = draft['lamps'].get(room_id)
+        if room is not None and room['state']:
+            meter[room_id] = (now, room['power'])
+            samples[room_id] = room['power']
+        else:
+            meter.pop(room_id, None)
+            samples[room_id] = 0.0
+
+    rooms_power = sum(power for _, power in meter.values())
+    total_power = base_power + rooms_power
+    energy = draft.edit('energy')
+    energy['current_power'] = total_power
+    if meter and total_power > energy['peak_today']:
+        record = (PEAK, total_power)
+        apply_record(energy, draft['stats']['hours_on_today'], record)
+        journal.append([record])
+    samples[TimeSeriesStore.TOTAL] = rooms_power
+    return samples
+
+
+def live_energy(snapshot, now=None):
+    """Счетчики energy снимка вместе с еще не начисленной энергией (без записи)"""
+    now = time.monotonic() if now is None else now
+    energy = dict(snapshot['energy'])
+    for room_id, (since, power) in snapshot['meter'].items():
+        if now > since:
+            kwh = power * (now - since) / 3600
+            energy['total_today'] += kwh
+            energy['total_month'] += kwh
+    return energy
+
+
+def live_hours(snapshot, now=None):
+    """Часы работы комнат за сегодня вместе с текущими включениями (без записи)"""
+    now = time.monotonic() if now is None else now
+    hours = dict(snapshot['stats']['hours_on_today'])
+    for room_id, (since, _) in snapshot['meter'].items():
+        if now > since:
+            hours[room_id] = hours.get(room_id, 0.0) + (now - since) / 3600
+    return hours
@@ -0,0 +1,276 @@
+# energy_wal.py - журнал предзаписи для счетчиков энергии
+#
+# Каждое изменение счетчиков дописывается в журнал короткой двоичной
+# записью: crc32 u32, тип u8, длина u16, данные. Записи идут в файл сразу,
+# а fsync делается группой раз в sync_interval секунд, поэтому при сбое
+# теряется не больше этого интервала. Раз в snapshot_interval секунд
+# счетчики сохраняются снимком, журнал начинается с нового сегмента, а
+# старые сегменты удаляются - восстановление читает снимок и только
+# сегменты после него.
+#
+# Журнал в каталоге ведет один процесс: acquire() берет блокировку файла
+# LOCK, а журнал процесса без блокировки записи не принимает.
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: блокировки нет, приложение работает одним процессом
+    fcntl = None
+
+from metrics import REGISTRY
+from persistence import write_json_atomic
+
+FSYNC_SECONDS = REGISTRY.histogram('energy_wal_fsync_seconds', 'Время fsync журнала счетчиков энергии')
+WAL_RECORDS = REGISTRY.counter('energy_wal_records_total', 'Записи, добавленные в журнал счетчиков')
+
+RECORD = struct.Struct('<IBH')
+BODY = struct.Struct('<BH')
+DOUBLE = struct.Struct('<d')
+ADD_PAYLOAD = struct.Struct('<dd')
+
+# Типы записей
+ADD = 1     # (ADD, комната, кВт·ч, часов работы)
+PEAK = 2    # (PEAK, новая пиковая мощность)
+RESET = 3   # (RESET,) - сброс счетчиков за сегодня
+
+SNAPSHOT_FILE = 'snapshot.json'
+LOCK_FILE = 'LOCK'
+SEGMENT_PREFIX = 'energy-'
+SEGMENT_SUFFIX = '.wal'
+
+
+def encode_record(record):
+    kind = record[0]
+    if kind == ADD:
+        payload = ADD_PAYLOAD.pack(record[2], record[3]) + record[1].encode('utf-8')
+    elif kind == PEAK:
+        payload = DOUBLE.pack(record[1])
+    else:
+        payload = b''
+    body = BODY.pack(kind, len(payload)) + payload
+    return struct.pack('<I', zlib.crc32(body)) + body
+
+
+def decode_records(data):
+    """Записи из данных сегмента и длина целой части (хвост после сбоя отбрасывается)"""
+    records = []
+    offset = 0
+    while len(data) - offset >= RECORD.size:
+        crc, kind, length = RECORD.unpack_from(data, offset)
+        end = offset + RECORD.size + length
+        if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+            break
+        payload = data[offset + RECORD.size:end]
+        if kind == ADD:
+            kwh, hours = ADD_PAYLOAD.unpack_from(payload)
+            records.append((ADD, payload[ADD_PAYLOAD.size:].decode('utf-8'), kwh, hours))
+        elif kind == PEAK:
+            records.append((PEAK, DOUBLE.unpack(payload)[0]))
+        else:
+            records.append((RESET,))
+        offset = end
+    return records, offset
+
+
+def apply_record(energy, hours, record):
+    """Применить запись к словарям energy и hours_on_today"""
+    kind = record[0]
+    if kind == ADD:
+        _, room_id, kwh, hours_on = record
+        energy['total_today'] += kwh
+        energy['total_month'] += kwh
+        hours[room_id] = hours.get(room_id, 0.0) + hours_on
+    elif kind == PEAK:
+        energy['peak_today'] = max(energy['peak_today'], record[1])
+    elif kind == RESET:
+        energy['total_today'] = 0.0
+        energy['cost_today'] = 0.0
+        energy['peak_today'] = 0.0
+        for room_id in hours:
+            hours[room_id] = 0.0
+
+
+class EnergyJournal:
+    """Сегменты журнала и снимок счетчиков в каталоге directory"""
+
+    COUNTERS = ('total_today', 'total_month', 'peak_today', 'cost_today')
+
+    def __init__(self, directory, sync_interval=1.0):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.fd = None
+        self.segment = None
+        self.unsynced = 0
+        self.closed = threading.Event()
+        self.thread = None
+        self.lock_fd = None
+        self.inert = False   # журнал ведет другой процесс: записи отбрасываются
+        os.makedirs(directory, exist_ok=True)
+
+    def acquire(self):
+        """Взять журнал во владение (True), если его не ведет другой процесс.
+
+        Блокировка держится до close() или завершения процесса. Без нее
+        append() ничего не пишет, чтобы не испортить чужой журнал.
+        """
+        if self.lock_fd is not None or fcntl is None:
+            self.inert = False
+            return True
+        fd = os.open(os.path.join(self.directory, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            self.inert = True
+            return False
+        self.lock_fd = fd
+        self.inert = False
+        return True
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{segment:08d}{SEGMENT_SUFFIX}')
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    segments.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    pass
+        return sorted(segments)
+
+    def _open(self, segment):
+        self.segment = segment
+        self.fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def recover(self, energy, hours):
+        """Восстановить счетчики: снимок плюс записи журнала после него.
+
+        energy и hours дополняются на месте; возвращает число примененных
+        записей. Восстановленные счетчики сразу сохраняются новым снимком,
+        после чего журнал открыт для записи с чистого сегмента.
+        """
+        snapshot = {'segment': 1, 'energy': {}, 'hours_on_today': {}}
+        try:
+            with open(os.path.join(self.directory, SNAPSHOT_FILE), 'r') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            pass
+        for key in self.COUNTERS:
+            if key in snapshot['energy']:
+                energy[key] = snapshot['energy'][key]
+        hours.update(snapshot['hours_on_today'])
+
+        replayed = 0
+        segments = [s for s in self._segments() if s >= snapshot['segment']]
+        for segment in segments:
+            path = self._segment_path(segment)
+            with open(path, 'rb') as f:
+                data = f.read()
+            records, length = decode_records(data)
+            for record in records:
+                apply_record(energy, hours, record)
+            replayed += len(records)
+            if length < len(data):
+                print(f"⚠ Журнал {path}: отброшен неполный хвост ({len(data) - length} байт)")
+                with open(path, 'r+b') as f:
+                    f.truncate(length)
+
+        with self.lock:
+            self._open((segments[-1] if segments else snapshot['segment']) + 1)
+        self.checkpoint(self.segment, energy, hours)
+        return replayed
+
+    def append(self, records):
+        """Дописать записи (на диск они попадут при ближайшем fsync)"""
+        if not records or self.inert:
+            return
+        data = b''.join(encode_record(record) for record in records)
+        with self.lock:
+            if self.fd is None:
+                # Журнал не восстанавливали: пишем в новый сегмент
+                segments = self._segments()
+                self._open(segments[-1] + 1 if segments else 1)
+            os.write(self.fd, data)
+            self.unsynced += len(data)
+        WAL_RECORDS.inc(len(records))
+
+    def sync(self):
+        """fsync накопленных записей одной операцией"""
+        with self.lock:
+            if not self.unsynced:
+                return
+            started = time.perf_counter()
+            os.fsync(self.fd)
+            self.unsynced = 0
+        FSYNC_SECONDS.observe(time.perf_counter() - started)
+
+    def rotate(self):
+        """Начать новый сегмент и вернуть его номер.
+
+        Вызывается, пока изменения счетчиков заблокированы: все записи до
+        нового сегмента уже учтены в снимке, который будет сделан сейчас.
+        """
+        with self.lock:
+            if self.fd is not None:
+                os.fsync(self.fd)
+                os.close(self.fd)
+            self.unsynced = 0
+            segments = self._segments()
+            self._open(max(segments[-1] if segments else 0, self.segment or 0) + 1)
+            return self.segment
+
+    def checkpoint(self, segment, energy, hours):
+        """Сохранить снимок счетчиков, с которого начинается сегмент segment"""
+        write_json_atomic(os.path.join(self.directory, SNAPSHOT_FILE), {
+            'segment': segment,
+            'energy': {key: energy[key] for key in self.COUNTERS if key in energy},
+            'hours_on_today': hours
+        })
+        self._remove_before(segment)
+
+    def _remove_before(self, segment):
+        for old in self._segments():
+            if old < segment:
+                os.unlink(self._segment_path(old))
+
+    def start(self, capture, snapshot_interval=300.0):
+        """Фоновый поток: fsync раз в sync_interval, снимок раз в snapshot_interval.
+
+        capture() возвращает (номер сегмента, energy, hours) и должна сама
+        вызвать rotate(), не давая счетчикам меняться до снимка.
+        """
+        def run():
+            last_snapshot = time.monotonic()
+            while not self.closed.wait(self.sync_interval):
+                try:
+                    self.sync()
+                    if time.monotonic() - last_snapshot >= snapshot_interval:
+                        self.checkpoint(*capture())
+                        last_snapshot = time.monotonic()
+                except Exception as e:
+                    print(f"⚠ Ошибка журнала счетчиков: {e}")
+
+        self.thread = threading.Thread(target=run, name='energy-wal', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.lock:
+            if self.fd is not None:
+                os.fsync(self.fd)
+                os.close(self.fd)
+                self.fd = None
+            if self.lock_fd is not None:
+                os.close(self.lock_fd)
+                self.lock_fd = None
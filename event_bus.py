@@ -0,0 +1,158 @@
+# event_bus.py - доставка событий устройства подписчикам в отдельных потоках
+import threading
+from collections import deque, OrderedDict
+
+# Что делать, если очередь подписчика заполнена
+DROP_OLDEST = 'drop_oldest'   # выбросить самое старое событие
+DROP_NEWEST = 'drop_newest'   # не ставить новое событие
+COALESCE = 'coalesce'         # заменить ожидающее событие с тем же ключом
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+
+def event_key(event_type, args):
+    """Ключ схлопывания по умолчанию: тип события"""
+    return event_type
+
+
+class Subscription:
+    """Очередь и поток доставки одного подписчика"""
+
+    def __init__(self, callback, topics, maxsize, policy, key, name):
+        self.callback = callback
+        self.topics = topics
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+        self.name = name
+        self.queue = OrderedDict() if policy == COALESCE else deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self._run, name=f'event-bus-{name}', daemon=True)
+
+    def wants(self, event_type):
+        return self.topics is None or event_type in self.topics
+
+    def put(self, event_type, args):
+        """Поставить событие в очередь, не блокируясь"""
+        with self.condition:
+            queue = self.queue
+            if self.policy == COALESCE:
+                key = self.key(event_type, args)
+                if key in queue:
+                    # Событие остается на своем месте в очереди с новыми данными
+                    queue[key] = (event_type, args)
+                    self.coalesced += 1
+                    return
+                if len(queue) >= self.maxsize:
+                    queue.popitem(last=False)
+                    self.dropped += 1
+                queue[key] = (event_type, args)
+            else:
+                if len(queue) >= self.maxsize:
+                    self.dropped += 1
+                    if self.policy == DROP_NEWEST:
+                        return
+                    queue.popleft()
+                queue.append((event_type, args))
+            self.condition.notify()
+
+    def _get(self):
+        with self.condition:
+            while not self.queue and not self.closed:
+                self.condition.wait()
+            if not self.queue:
+                return None
+            if self.policy == COALESCE:
+                return self.queue.popitem(last=False)[1]
+            return self.queue.popleft()
+
+    def _run(self):
+        while True:
+            event = self._get()
+            if event is None:
+                return
+            event_type, args = event
+            try:
+                self.callback(event_type, *args)
+                self.delivered += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Ошибка в callback: {e}")
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            queued = len(self.queue)
+        return {
+            'queued': queued,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'failed': self.failed
+        }
+
+
+class EventBus:
+    """Ограниченная шина событий с отдельной очередью на подписчика.
+
+    publish() только раскладывает событие по очередям и никогда не ждет
+    подписчиков, поэтому медленный callback не задерживает чтение порта.
+    Каждый подписчик получает свой поток доставки, фильтр по типам
+    событий и политику на случай переполнения очереди; отброшенные и
+    схлопнутые события считаются.
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback, topics=None, maxsize=1000, policy=DROP_OLDEST, key=event_key, name=None):
+        """Подписать callback(event_type, *args) на события типов topics (None - на все)"""
+        if policy not in POLICIES:
+            raise ValueError(f'Неизвестная политика очереди: {policy}')
+        name = name or getattr(callback, '__name__', 'subscriber')
+        subscription = Subscription(callback, set(topics) if topics else None,
+                                    maxsize, policy, key, name)
+        with self.lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        subscription.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+        subscription.close()
+
+    def publish(self, event_type, *args):
+        """Разослать событие подписчикам этого типа"""
+        for subscription in self.subscriptions:
+            if subscription.wants(event_type):
+                subscription.put(event_type, args)
+
+    def depth(self):
+        """Сколько событий ждут доставки во всех очередях"""
+        return sum(len(subscription.queue) for subscription in self.subscriptions)
+
+    @property
+    def dropped(self):
+        """Сколько событий отброшено по всем подписчикам"""
+        return sum(subscription.dropped for subscription in self.subscriptions)
+
+    def stats(self):
+        """Счетчики по подписчикам: {имя: {queued, delivered, dropped, coalesced, failed}}"""
+        return {subscription.name: subscription.stats() for subscription in self.subscriptions}
+
+    def close(self):
+        with self.lock:
+            subscriptions, self.subscriptions = self.subscriptions, []
+        for subscription in subscriptions:
+            subscription.close()
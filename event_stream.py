@@ -0,0 +1,82 @@
+# event_stream.py - рассылка событий браузерам через Server-Sent Events
+import json
+import queue
+import threading
+
+
+class Subscriber:
+    """Очередь событий одного подключенного клиента"""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+
+class EventBroadcaster:
+    """Рассылка событий всем подписчикам без блокировки издателя.
+
+    Если клиент не успевает забирать события и его очередь заполнена,
+    новые события для него отбрасываются, а клиент получает 'resync' и
+    перезагружает данные целиком.
+
+    Открытый поток занимает поток воркера на все время подключения,
+    поэтому число подписчиков ограничено max_subscribers: сверх него
+    subscribe() возвращает None, и клиент обновляет данные запросами.
+    """
+
+    def __init__(self, queue_size=100, heartbeat=15, max_subscribers=None):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        """Новый подписчик или None, если подписчиков уже max_subscribers"""
+        subscriber = Subscriber(self.queue_size)
+        with self.lock:
+            if self.max_subscribers is not None and len(self.subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        """Отправить событие всем подписчикам"""
+        message = format_sse(event, data)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                subscriber.overflowed = True
+
+    def stream(self, subscriber, initial=()):
+        """Генератор тела SSE-ответа для подписчика"""
+        try:
+            for event, data in initial:
+                yield format_sse(event, data)
+            while True:
+                if subscriber.overflowed:
+                    subscriber.overflowed = False
+                    with subscriber.queue.mutex:
+                        subscriber.queue.queue.clear()
+                    yield format_sse('resync', {})
+                try:
+                    yield subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # Комментарий держит соединение открытым через прокси
+                    yield ': ping\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def format_sse(event, data):
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'event: {event}\ndata: {payload}\n\n'
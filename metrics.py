@@ -0,0 +1,179 @@
+# metrics.py - счетчики и гистограммы в текстовом формате Prometheus
+#
+# Запись метрики - одно сложение (счетчик) или bisect по границам корзин
+# (гистограмма), без блокировок: в редкой гонке двух потоков инкремент
+# может потеряться, что для мониторинга допустимо. Дочерние метрики с
+# метками создаются один раз, горячий код держит ссылку на них.
+import threading
+from bisect import bisect_left
+
+# Границы корзин по умолчанию, секунды: от 100 мкс до 10 с
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """Монотонный счетчик (имя по соглашению оканчивается на _total).
+
+    fn позволяет отдавать счетчик, который уже ведется в другом месте.
+    """
+
+    __slots__ = ('value', 'fn')
+
+    def __init__(self, fn=None):
+        self.value = 0
+        self.fn = fn
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.fn() if self.fn else self.value
+
+
+class Gauge:
+    """Текущее значение; fn вычисляет его в момент чтения метрик"""
+
+    __slots__ = ('value', 'fn')
+
+    def __init__(self, fn=None):
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.fn() if self.fn else self.value
+
+
+class Histogram:
+    """Распределение значений по фиксированным корзинам"""
+
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield name + '_bucket', labels + (('le', _format_value(bound)),), cumulative
+        cumulative += self.counts[-1]
+        yield name + '_bucket', labels + (('le', '+Inf'),), cumulative
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, cumulative
+
+
+class Family:
+    """Метрика с именем, описанием и (необязательными) метками"""
+
+    def __init__(self, kind, name, documentation, labelnames, factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.children[()] = factory()
+
+    def labels(self, *values):
+        """Дочерняя метрика для значений меток (создается один раз)"""
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.children[values] = self.factory()
+        return child
+
+    def remove(self, *values):
+        with self.lock:
+            self.children.pop(values, None)
+
+    # Метрика без меток работает как ее единственный потомок
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def set(self, value):
+        self.children[()].set(value)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.documentation}')
+        lines.append(f'# TYPE {self.name} {self.kind}')
+        for values, child in list(self.children.items()):
+            labels = tuple(zip(self.labelnames, values))
+            for name, sample_labels, value in child.samples(self.name, labels):
+                lines.append(f'{name}{_format_labels(sample_labels)} {_format_value(value)}')
+
+
+class Registry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def _register(self, kind, name, documentation, labelnames, factory):
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = Family(kind, name, documentation, labelnames, factory)
+            elif family.kind != kind:
+                raise ValueError(f'Метрика {name} уже объявлена как {family.kind}')
+        return family
+
+    def counter(self, name, documentation, labelnames=(), fn=None):
+        return self._register('counter', name, documentation, labelnames, lambda: Counter(fn))
+
+    def gauge(self, name, documentation, labelnames=(), fn=None):
+        return self._register('gauge', name, documentation, labelnames, lambda: Gauge(fn))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        bounds = tuple(sorted(buckets))
+        return self._register('histogram', name, documentation, labelnames, lambda: Histogram(bounds))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus (version 0.0.4)"""
+        lines = []
+        with self.lock:
+            families = list(self.families.values())
+        for family in families:
+            family.render(lines)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Общий реестр процесса
+REGISTRY = Registry()
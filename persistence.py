@@ -0,0 +1,107 @@
+# persistence.py - фоновая атомарная запись состояния в файлы
+import os
+import json
+import time
+import tempfile
+import threading
+
+from metrics import REGISTRY
+
+SAVE_SECONDS = REGISTRY.histogram('save_data_seconds', 'Время сохранения данных в файлы')
+SAVE_FAILURES = REGISTRY.counter('save_data_failures_total', 'Неудачные записи файлов данных')
+
+
+def write_json_atomic(path, data):
+    """Записать JSON так, чтобы в path был либо старый, либо новый файл целиком"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    # Переименование тоже должно дойти до диска (на Windows каталог не открыть)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class PersistenceWorker:
+    """Сохранение измененных разделов состояния в фоновом потоке.
+
+    targets - список (путь, разделы, build): файл переписывается, если
+    изменился хотя бы один из его разделов, а build(snapshot) дает его
+    содержимое. mark_dirty() только запоминает разделы и сразу возвращает
+    управление; отметки, пришедшие за debounce секунд после первой,
+    сохраняются одной записью из одного снимка.
+    """
+
+    def __init__(self, store, targets, debounce=1.0):
+        self.store = store
+        self.targets = [(path, frozenset(sections), build) for path, sections, build in targets]
+        self.debounce = debounce
+        self.dirty = set()
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.closed = False
+        self.marks = 0
+        self.writes = 0
+        self.thread = threading.Thread(target=self._run, name='persistence', daemon=True)
+        self.thread.start()
+
+    def mark_dirty(self, *sections):
+        """Отметить разделы измененными (без ожидания записи)"""
+        with self.condition:
+            self.dirty.update(sections)
+            self.marks += 1
+            self.condition.notify()
+
+    def _take(self):
+        with self.condition:
+            dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.dirty and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                # Собираем отметки окна в одну запись
+                self.condition.wait_for(lambda: self.closed, self.debounce)
+            self.flush()
+
+    def flush(self, force=False):
+        """Записать накопленные изменения сейчас (force - все файлы)"""
+        with self.write_lock:
+            dirty = self._take()
+            snapshot = self.store.snapshot()
+            for path, sections, build in self.targets:
+                if not force and not sections & dirty:
+                    continue
+                started = time.perf_counter()
+                try:
+                    write_json_atomic(path, build(snapshot))
+                    self.writes += 1
+                except Exception as e:
+                    SAVE_FAILURES.inc()
+                    print(f"⚠ Ошибка сохранения {path}: {e}")
+                    # Попробуем в следующий раз
+                    self.mark_dirty(*sections)
+                SAVE_SECONDS.observe(time.perf_counter() - started)
+
+    def close(self):
+        """Остановить поток и записать то, что еще не сохранено"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
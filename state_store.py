@@ -0,0 +1,85 @@
+# state_store.py - состояние системы в виде неизменяемых снимков с номером версии
+import os
+import threading
+from contextlib import contextmanager
+
+
+class Snapshot:
+    """Опубликованная версия состояния.
+
+    Снимок никогда не меняется после публикации, поэтому читатель может
+    держать его сколько угодно и видит согласованные значения всех разделов.
+    """
+
+    __slots__ = ('version', 'data')
+
+    def __init__(self, version, data):
+        self.version = version
+        self.data = data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+
+class Draft:
+    """Черновик следующей версии.
+
+    Разделы читаются как есть (они общие с текущим снимком), а перед
+    изменением edit() копирует словари по пути - каждый не больше одного
+    раза. Нетронутые разделы переходят в новую версию без копирования.
+    """
+
+    def __init__(self, data):
+        self.root = dict(data)
+        self.copied = set()
+        self.changed = False
+
+    def __getitem__(self, key):
+        return self.root[key]
+
+    def edit(self, *path):
+        """Изменяемый словарь по пути, например edit('lamps', 'kitchen')"""
+        self.changed = True
+        node = self.root
+        for depth in range(len(path)):
+            key = path[depth]
+            if path[:depth + 1] not in self.copied:
+                node[key] = dict(node[key])
+                self.copied.add(path[:depth + 1])
+            node = node[key]
+        return node
+
+
+class StateStore:
+    """Хранилище состояния с копированием при записи.
+
+    Читатели берут текущий снимок без блокировок - это одно чтение ссылки.
+    Писатели по очереди собирают черновик и публикуют его как новый снимок
+    с версией на единицу больше; если блок edit() завершился исключением
+    или ничего не изменил, версия не меняется. Вложенные edit() не
+    допускаются.
+
+    Состояние живет в памяти процесса: приложение работает одним воркером.
+    Версии начинаются с 1 при каждом запуске, поэтому сравнивать их между
+    запусками можно только вместе с epoch - случайным номером запуска.
+    """
+
+    def __init__(self, data):
+        self.lock = threading.Lock()
+        self.current = Snapshot(1, data)
+        self.epoch = os.urandom(4).hex()
+
+    def snapshot(self):
+        return self.current
+
+    @property
+    def version(self):
+        return self.current.version
+
+    @contextmanager
+    def edit(self):
+        with self.lock:
+            draft = Draft(self.current.data)
+            yield draft
+            if draft.changed:
+                self.current = Snapshot(self.current.version + 1, draft.root)
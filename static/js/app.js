@@ -0,0 +1,1068 @@
+// Глобальные переменные
+let currentSection = 'dashboard';
+let selectedColor = '#2196F3';
+let charts = {};
+let updateInterval = 5000;
+let timer = null;
+
+// Инициализация при загрузке
+document.addEventListener('DOMContentLoaded', function() {
+    // Проверка авторизации
+    checkAuth();
+
+    // Загрузка начальных данных
+    loadDashboardData();
+    loadRooms();
+    loadUsers();
+    loadLogs();
+    loadSettings();
+
+    // Инициализация графиков
+    initCharts();
+
+    // Подписка на изменения и таймер обновления графиков
+    startEventStream();
+    startUpdateTimer();
+
+    // Обновление времени
+    updateTime();
+    setInterval(updateTime, 1000);
+});
+
+// Проверка авторизации
+function checkAuth() {
+    const token = localStorage.getItem('auth_token');
+    if (token) {
+        showApp();
+    } else {
+        showLogin();
+    }
+}
+
+// Показать приложение
+function showApp() {
+    document.getElementById('loginPage').style.display = 'none';
+    document.getElementById('appContainer').style.display = 'block';
+}
+
+// Показать форму входа
+function showLogin() {
+    document.getElementById('loginPage').style.display = 'flex';
+    document.getElementById('appContainer').style.display = 'none';
+}
+
+// Вход в систему
+document.getElementById('loginForm').addEventListener('submit', function(e) {
+    e.preventDefault();
+
+    const username = document.getElementById('loginUsername').value;
+    const password = document.getElementById('loginPassword').value;
+
+    fetch('/api/login', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({username, password})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            localStorage.setItem('auth_token', data.token);
+            localStorage.setItem('user_role', data.role);
+            localStorage.setItem('username', data.username);
+            showApp();
+            loadDashboardData();
+            loadRooms();
+            startEventStream();
+        } else {
+            alert('Ошибка: ' + data.message);
+        }
+    })
+    .catch(error => {
+        alert('Ошибка соединения');
+    });
+});
+
+// Выход из системы
+function logout() {
+    localStorage.removeItem('auth_token');
+    localStorage.removeItem('user_role');
+    localStorage.removeItem('username');
+    clearTimeout(streamRetry);
+    if (eventStream) {
+        eventStream.close();
+        eventStream = null;
+    }
+    showLogin();
+}
+
+// Показать секцию
+function showSection(sectionId) {
+    // Скрыть все секции
+    document.querySelectorAll('.content-section').forEach(section => {
+        section.classList.remove('active');
+    });
+
+    // Скрыть все активные элементы сайдбара
+    document.querySelectorAll('.sidebar-item').forEach(item => {
+        item.classList.remove('active');
+    });
+
+    // Показать выбранную секцию
+    document.getElementById(sectionId + 'Section').classList.add('active');
+
+    // Активировать соответствующий элемент сайдбара
+    document.querySelectorAll('.sidebar-item').forEach(item => {
+        if (item.textContent.includes(getSectionName(sectionId))) {
+            item.classList.add('active');
+        }
+    });
+
+    currentSection = sectionId;
+
+    // Загрузить данные для секции
+    switch(sectionId) {
+        case 'dashboard':
+            loadDashboardData();
+            break;
+        case 'rooms':
+            loadRooms();
+            break;
+        case 'energy':
+            updateEnergyChart();
+            break;
+        case 'statistics':
+            updateStatistics();
+            break;
+        case 'settings':
+            loadSettings();
+            break;
+        case 'users':
+            loadUsers();
+            break;
+        case 'logs':
+            loadLogs();
+            break;
+    }
+}
+
+// Получить имя секции
+function getSectionName(sectionId) {
+    const names = {
+        'dashboard': 'Панель управления',
+        'rooms': 'Управление комнатами',
+        'energy': 'Энергопотребление',
+        'statistics': 'Статистика',
+        'settings': 'Настройки системы',
+        'users': 'Пользователи',
+        'logs': 'История действий'
+    };
+    return names[sectionId] || sectionId;
+}
+
+// Загрузка данных для дашборда
+function loadDashboardData() {
+    fetch('/api/dashboard')
+        .then(response => response.json())
+        .then(data => {
+            applyDashboard(data);
+
+            // Обновить пользователя
+            const username = localStorage.getItem('username') || 'Администратор';
+            document.getElementById('currentUser').textContent = username;
+
+            // Обновить логи
+            recentLogs = data.recent_logs;
+            updateRecentLogs(recentLogs);
+        });
+}
+
+// Показатели дашборда (из /api/dashboard или из потока событий)
+function applyDashboard(data) {
+    document.getElementById('currentPower').textContent = 
+        data.current_power.toFixed(2) + ' кВт';
+    document.getElementById('todayConsumption').textContent = 
+        data.today_usage.toFixed(1) + ' кВт·ч';
+    document.getElementById('todayCost').textContent = 
+        data.today_cost.toFixed(0) + ' ₸';
+    document.getElementById('activeRooms').textContent = 
+        data.active_rooms + '/' + data.total_rooms;
+    document.getElementById('savings').textContent = 
+        data.savings.toFixed(0) + ' ₸';
+}
+
+// Подписка на push-поток изменений вместо опроса дашборда
+let eventStream = null;
+let streamRetry = null;
+let recentLogs = [];
+function startEventStream() {
+    if (eventStream) eventStream.close();
+    clearTimeout(streamRetry);
+    eventStream = new EventSource('/api/stream');
+
+    // Сервер отклонил поток (лимит подключений): опрашиваем по таймеру
+    // и пробуем подключиться снова позже
+    eventStream.onerror = () => {
+        if (eventStream && eventStream.readyState === EventSource.CLOSED) {
+            eventStream = null;
+            streamRetry = setTimeout(startEventStream, 30000);
+        }
+    };
+    eventStream.addEventListener('dashboard', e => {
+        applyDashboard(JSON.parse(e.data));
+    });
+    // Изменения комнат применяются из события, без повторной загрузки списка
+    eventStream.addEventListener('room', e => {
+        const data = JSON.parse(e.data);
+        if (!applyRoomState(data.room_id, data.state)) loadRooms();
+    });
+    eventStream.addEventListener('rooms', e => {
+        const data = JSON.parse(e.data);
+        if (data.deleted) {
+            delete roomsCache[data.room_id];
+        } else {
+            roomsCache[data.room_id] = data.room;
+        }
+        renderRooms();
+    });
+    eventStream.addEventListener('log', e => {
+        recentLogs = [JSON.parse(e.data)].concat(recentLogs).slice(0, 5);
+        updateRecentLogs(recentLogs);
+    });
+    eventStream.addEventListener('resync', () => {
+        loadDashboardData();
+        loadRooms();
+    });
+}
+
+// Загрузка комнат
+let roomsCache = {};
+function loadRooms() {
+    fetch('/api/rooms')
+        .then(response => response.json())
+        .then(rooms => {
+            roomsCache = rooms;
+            renderRooms();
+        });
+}
+
+// Состояние одной комнаты (false - комнаты нет в загруженном списке)
+function applyRoomState(roomId, state) {
+    if (!roomsCache[roomId]) return false;
+    roomsCache[roomId].state = state;
+    renderRooms();
+    return true;
+}
+
+// Карточки комнат из загруженного списка
+function renderRooms() {
+    const rooms = roomsCache;
+    const container = document.getElementById('roomsContainer');
+    container.innerHTML = '';
+
+    Object.keys(rooms).forEach(roomId => {
+        const room = rooms[roomId];
+        const roomCard = `
+            <div class="room-card ${room.state ? 'active' : ''}">
+                <div class="room-actions">
+                    <button class="action-btn" onclick="editRoom('${roomId}')">
+                        <i class="fas fa-edit"></i>
+                    </button>
+                    <button class="action-btn" onclick="deleteRoom('${roomId}')">
+                        <i class="fas fa-trash"></i>
+                    </button>
+                </div>
+                <div class="room-header">
+                    <div class="room-icon" style="background: ${room.color};">
+                        <i class="fas ${room.icon}"></i>
+                    </div>
+                    <div class="room-status">
+                        <span class="status-indicator ${room.state ? 'on' : ''}"></span>
+                        <span>${room.state ? 'ВКЛ' : 'ВЫКЛ'}</span>
+                    </div>
+                </div>
+                <div style="margin-bottom: 15px;">
+                    <h3 style="font-size: 1.2rem; margin-bottom: 5px;">${room.name}</h3>
+                    <p style="color: #90CAF9; font-size: 0.9rem;">Мощность: ${room.power} кВт</p>
+                </div>
+                <div style="display: flex; gap: 10px;">
+                    <button class="btn ${room.state ? 'btn-danger' : 'btn-success'}" style="flex: 1;" onclick="toggleRoom('${roomId}', '${room.state ? 'off' : 'on'}')">
+                        <i class="fas fa-power-off"></i>
+                        ${room.state ? 'Выключить' : 'Включить'}
+                    </button>
+                    <button class="btn btn-secondary" onclick="showRoomDetails('${roomId}')">
+                        <i class="fas fa-info"></i>
+                    </button>
+                </div>
+            </div>
+        `;
+        container.innerHTML += roomCard;
+    });
+}
+
+// Переключение комнаты
+function toggleRoom(roomId, state) {
+    fetch(`/api/room/${roomId}/${state}`, {
+        method: 'POST',
+        headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            applyRoomState(roomId, state === 'on');
+            if (!eventStream) loadDashboardData();
+            showNotification(`Комната "${data.room_name}" ${state === 'on' ? 'включена' : 'выключена'}`);
+        } else {
+            showNotification(data.message, 'error');
+        }
+    });
+}
+
+// Переключение всех комнат
+function toggleAllRooms(state) {
+    fetch(`/api/all_rooms/${state}`, {
+        method: 'POST',
+        headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            Object.keys(roomsCache).forEach(roomId => {
+                roomsCache[roomId].state = (state === 'on');
+            });
+            renderRooms();
+            if (!eventStream) loadDashboardData();
+            showNotification(`Все комнаты ${state === 'on' ? 'включены' : 'выключены'}`);
+        } else {
+            showNotification(data.message, 'error');
+        }
+    });
+}
+
+// Показать модальное окно комнаты
+function showRoomModal(roomId) {
+    const modal = document.getElementById('roomModal');
+    const title = document.getElementById('roomModalTitle');
+
+    if (roomId) {
+        title.textContent = 'Редактировать комнату';
+        // Загрузить данные комнаты
+        fetch(`/api/room/${roomId}`)
+            .then(response => response.json())
+            .then(room => {
+                document.getElementById('roomId').value = roomId;
+                document.getElementById('roomName').value = room.name;
+                document.getElementById('roomPower').value = room.power;
+                document.getElementById('roomIcon').value = room.icon;
+                document.getElementById('roomColor').value = room.color;
+                document.getElementById('roomDescription').value = room.description || '';
+                selectColor(room.color);
+            });
+    } else {
+        title.textContent = 'Добавить комнату';
+        document.getElementById('roomForm').reset();
+        document.getElementById('roomId').value = '';
+        document.getElementById('roomColor').value = '#2196F3';
+        selectColor('#2196F3');
+    }
+
+    modal.classList.add('active');
+}
+
+// Скрыть модальное окно комнаты
+function hideRoomModal() {
+    document.getElementById('roomModal').classList.remove('active');
+}
+
+// Выбрать цвет
+function selectColor(color) {
+    selectedColor = color;
+    document.getElementById('roomColor').value = color;
+
+    // Убрать выделение со всех цветов
+    document.querySelectorAll('.color-option').forEach(option => {
+        option.classList.remove('selected');
+    });
+
+    // Найти и выделить выбранный цвет
+    document.querySelectorAll('.color-option').forEach(option => {
+        if (option.style.background === color || 
+            option.style.backgroundColor === color) {
+            option.classList.add('selected');
+        }
+    });
+}
+
+// Сохранить комнату
+function saveRoom() {
+    const roomId = document.getElementById('roomId').value;
+    const roomData = {
+        name: document.getElementById('roomName').value,
+        power: parseFloat(document.getElementById('roomPower').value),
+        icon: document.getElementById('roomIcon').value,
+        color: document.getElementById('roomColor').value,
+        description: document.getElementById('roomDescription').value
+    };
+
+    const url = roomId ? `/api/room/${roomId}` : '/api/rooms';
+    const method = roomId ? 'PUT' : 'POST';
+
+    fetch(url, {
+        method: method,
+        headers: {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer ' + localStorage.getItem('auth_token')
+        },
+        body: JSON.stringify(roomData)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            hideRoomModal();
+            loadRooms();
+            showNotification(data.message);
+        }
+    });
+}
+
+// Редактировать комнату
+function editRoom(roomId) {
+    showRoomModal(roomId);
+}
+
+// Удалить комнату
+function deleteRoom(roomId) {
+    if (confirm('Вы уверены, что хотите удалить эту комнату?')) {
+        fetch(`/api/room/${roomId}`, {
+            method: 'DELETE',
+            headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                loadRooms();
+                showNotification(data.message);
+            }
+        });
+    }
+}
+
+// Загрузка пользователей
+function loadUsers() {
+    fetch('/api/users')
+        .then(response => response.json())
+        .then(users => {
+            const table = document.getElementById('usersTable');
+            table.innerHTML = '';
+
+            users.forEach(user => {
+                const row = `
+                    <tr style="border-bottom: 1px solid rgba(255,255,255,0.1);">
+                        <td style="padding: 15px;">
+                            <div style="display: flex; align-items: center; gap: 10px;">
+                                <div style="width: 40px; height: 40px; border-radius: 50%; background: #2196F3; display: flex; align-items: center; justify-content: center;">
+                                    <i class="fas fa-user"></i>
+                                </div>
+                                <div>
+                                    <div>${user.username}</div>
+                                    <div style="font-size: 0.8rem; color: #90CAF9;">${user.email || ''}</div>
+                                </div>
+                            </div>
+                        </td>
+                        <td style="padding: 15px;">
+                            <span style="padding: 5px 10px; border-radius: 20px; background: ${user.role === 'admin' ? '#F44336' : '#2196F3'}; font-size: 0.8rem;">
+                                ${user.role === 'admin' ? 'Администратор' : 'Пользователь'}
+                            </span>
+                        </td>
+                        <td style="padding: 15px; color: #90CAF9;">${user.last_login || 'Никогда'}</td>
+                        <td style="padding: 15px;">
+                            <button class="action-btn" onclick="editUser('${user.username}')">
+                                <i class="fas fa-edit"></i>
+                            </button>
+                            ${user.username !== 'admin' ? 
+                                `<button class="action-btn" onclick="deleteUser('${user.username}')">
+                                    <i class="fas fa-trash"></i>
+                                </button>` : ''
+                            }
+                        </td>
+                    </tr>
+                `;
+                table.innerHTML += row;
+            });
+        });
+}
+
+// Показать модальное окно пользователя
+function showUserModal(username) {
+    const modal = document.getElementById('userModal');
+    const title = document.getElementById('userModalTitle');
+
+    if (username) {
+        title.textContent = 'Редактировать пользователя';
+        // Загрузить данные пользователя
+        fetch(`/api/user/${username}`)
+            .then(response => response.json())
+            .then(user => {
+                document.getElementById('userId').value = username;
+                document.getElementById('userUsername').value = user.username;
+                document.getElementById('userUsername').readOnly = true;
+                document.getElementById('userRole').value = user.role;
+                document.getElementById('userEmail').value = user.email || '';
+                document.getElementById('userPassword').required = false;
+                document.getElementById('userPasswordConfirm').required = false;
+            });
+    } else {
+        title.textContent = 'Добавить пользователя';
+        document.getElementById('userForm').reset();
+        document.getElementById('userId').value = '';
+        document.getElementById('userUsername').readOnly = false;
+        document.getElementById('userPassword').required = true;
+        document.getElementById('userPasswordConfirm').required = true;
+    }
+
+    modal.classList.add('active');
+}
+
+// Скрыть модальное окно пользователя
+function hideUserModal() {
+    document.getElementById('userModal').classList.remove('active');
+}
+
+// Сохранить пользователя
+function saveUser() {
+    const username = document.getElementById('userId').value;
+    const password = document.getElementById('userPassword').value;
+    const passwordConfirm = document.getElementById('userPasswordConfirm').value;
+
+    if (password !== passwordConfirm) {
+        alert('Пароли не совпадают!');
+        return;
+    }
+
+    const userData = {
+        username: document.getElementById('userUsername').value,
+        password: password,
+        role: document.getElementById('userRole').value,
+        email: document.getElementById('userEmail').value
+    };
+
+    const url = username ? `/api/user/${username}` : '/api/users';
+    const method = username ? 'PUT' : 'POST';
+
+    fetch(url, {
+        method: method,
+        headers: {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer ' + localStorage.getItem('auth_token')
+        },
+        body: JSON.stringify(userData)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            hideUserModal();
+            loadUsers();
+            showNotification(data.message);
+        }
+    });
+}
+
+// Редактировать пользователя
+function editUser(username) {
+    showUserModal(username);
+}
+
+// Удалить пользователя
+function deleteUser(username) {
+    if (confirm(`Вы уверены, что хотите удалить пользователя ${username}?`)) {
+        fetch(`/api/user/${username}`, {
+            method: 'DELETE',
+            headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                loadUsers();
+                showNotification(data.message);
+            }
+        });
+    }
+}
+
+// Загрузка логов (первая страница)
+let logsCursor = null;
+function loadLogs() {
+    fetch('/api/logs')
+        .then(response => response.json())
+        .then(data => {
+            logsCursor = data.next_cursor;
+            updateLogsTable(data.logs, false);
+        });
+}
+
+// Загрузка следующей страницы логов
+function loadMoreLogs() {
+    if (logsCursor === null) return;
+    fetch(`/api/logs?cursor=${logsCursor}`)
+        .then(response => response.json())
+        .then(data => {
+            logsCursor = data.next_cursor;
+            updateLogsTable(data.logs, true);
+        });
+}
+
+// Обновить таблицу логов
+function updateLogsTable(logs, append) {
+    const table = document.getElementById('logsTable');
+    if (!append) table.innerHTML = '';
+    document.getElementById('logsMoreBtn').style.display = logsCursor === null ? 'none' : 'inline-flex';
+
+    logs.forEach(log => {
+        const row = `
+            <tr style="border-bottom: 1px solid rgba(255,255,255,0.1);">
+                <td style="padding: 15px; color: #90CAF9;">${log.timestamp}</td>
+                <td style="padding: 15px;">
+                    <span style="padding: 5px 10px; border-radius: 20px; background: ${getLogColor(log.action)}; font-size: 0.8rem;">
+                        ${log.action}
+                    </span>
+                </td>
+                <td style="padding: 15px;">${log.user}</td>
+                <td style="padding: 15px; color: #B0BEC5;">${log.details}</td>
+            </tr>
+        `;
+        table.innerHTML += row;
+    });
+}
+
+// Обновить недавние логи
+function updateRecentLogs(logs) {
+    const container = document.getElementById('recentLogs');
+    container.innerHTML = '';
+
+    logs.forEach(log => {
+        const logItem = `
+            <div style="padding: 15px; border-bottom: 1px solid rgba(255,255,255,0.1); display: flex; align-items: center; gap: 15px;">
+                <div style="width: 40px; height: 40px; border-radius: 50%; background: ${getLogColor(log.action)}; display: flex; align-items: center; justify-content: center;">
+                    <i class="fas ${getLogIcon(log.action)}"></i>
+                </div>
+                <div style="flex: 1;">
+                    <div style="font-weight: 500;">${log.action}</div>
+                    <div style="font-size: 0.9rem; color: #90CAF9;">${log.details}</div>
+                </div>
+                <div style="font-size: 0.8rem; color: #B0BEC5;">${log.timestamp}</div>
+            </div>
+        `;
+        container.innerHTML += logItem;
+    });
+}
+
+// Очистить логи
+function clearLogs() {
+    if (confirm('Вы уверены, что хотите очистить всю историю действий?')) {
+        fetch('/api/logs', {
+            method: 'DELETE',
+            headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                loadLogs();
+                showNotification(data.message);
+            }
+        });
+    }
+}
+
+// Обновить логи
+function refreshLogs() {
+    loadLogs();
+    fetch('/api/dashboard')
+        .then(response => response.json())
+        .then(data => {
+            recentLogs = data.recent_logs;
+            updateRecentLogs(recentLogs);
+        });
+}
+
+// Получить цвет для типа лога
+function getLogColor(action) {
+    const colors = {
+        'Вход в систему': '#4CAF50',
+        'Выход из системы': '#F44336',
+        'Включение': '#4CAF50',
+        'Выключение': '#F44336',
+        'Настройка': '#2196F3',
+        'Удаление': '#F44336',
+        'Добавление': '#4CAF50'
+    };
+    return colors[action] || '#607D8B';
+}
+
+// Получить иконку для типа лога
+function getLogIcon(action) {
+    const icons = {
+        'Вход в систему': 'fa-sign-in-alt',
+        'Выход из системы': 'fa-sign-out-alt',
+        'Включение': 'fa-power-off',
+        'Выключение': 'fa-power-off',
+        'Настройка': 'fa-cog',
+        'Удаление': 'fa-trash',
+        'Добавление': 'fa-plus'
+    };
+    return icons[action] || 'fa-info-circle';
+}
+
+// Загрузка настроек
+function loadSettings() {
+    fetch('/api/settings')
+        .then(response => response.json())
+        .then(settings => {
+            document.getElementById('autoSave').checked = settings.auto_save;
+            document.getElementById('updateInterval').value = settings.update_interval;
+            document.getElementById('themeSelect').value = settings.theme;
+            document.getElementById('tariffInput').value = settings.tariff;
+            document.getElementById('baseConsumption').value = settings.base_consumption;
+            document.getElementById('notifications').checked = settings.notifications;
+            document.getElementById('languageSelect').value = settings.language;
+            document.getElementById('timeFormat').value = settings.time_format;
+            document.getElementById('unitsSystem').value = settings.units_system;
+
+            updateInterval = settings.update_interval * 1000;
+            restartUpdateTimer();
+        });
+}
+
+// Сохранить все настройки
+function saveAllSettings() {
+    const settings = {
+        auto_save: document.getElementById('autoSave').checked,
+        update_interval: parseInt(document.getElementById('updateInterval').value),
+        theme: document.getElementById('themeSelect').value,
+        tariff: parseFloat(document.getElementById('tariffInput').value),
+        base_consumption: parseFloat(document.getElementById('baseConsumption').value),
+        notifications: document.getElementById('notifications').checked,
+        language: document.getElementById('languageSelect').value,
+        time_format: document.getElementById('timeFormat').value,
+        units_system: document.getElementById('unitsSystem').value
+    };
+
+    fetch('/api/settings', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer ' + localStorage.getItem('auth_token')
+        },
+        body: JSON.stringify(settings)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showNotification('Настройки сохранены');
+            updateInterval = settings.update_interval * 1000;
+            restartUpdateTimer();
+        }
+    });
+}
+
+// Инициализация графиков
+function initCharts() {
+    // График энергопотребления
+    const energyCtx = document.getElementById('energyChart').getContext('2d');
+    charts.energy = new Chart(energyCtx, {
+        type: 'line',
+        data: {
+            labels: [],
+            datasets: [{
+                label: 'Потребление (кВт)',
+                data: [],
+                borderColor: '#2196F3',
+                backgroundColor: 'rgba(33, 150, 243, 0.1)',
+                borderWidth: 3,
+                fill: true,
+                tension: 0.4
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: { labels: { color: '#fff' } }
+            },
+            scales: {
+                x: {
+                    ticks: { color: '#90CAF9' },
+                    grid: { color: 'rgba(255, 255, 255, 0.1)' }
+                },
+                y: {
+                    beginAtZero: true,
+                    ticks: { color: '#90CAF9' },
+                    grid: { color: 'rgba(255, 255, 255, 0.1)' }
+                }
+            }
+        }
+    });
+
+    // График распределения
+    const distCtx = document.getElementById('distributionChart').getContext('2d');
+    charts.distribution = new Chart(distCtx, {
+        type: 'doughnut',
+        data: {
+            labels: [],
+            datasets: [{
+                data: [],
+                backgroundColor: []
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: {
+                    position: 'right',
+                    labels: { color: '#fff' }
+                }
+            }
+        }
+    });
+}
+
+// Обновление графика энергопотребления
+function updateEnergyChart() {
+    const timeRange = document.getElementById('timeRange').value;
+
+    fetch(`/api/energy_chart?range=${timeRange}`)
+        .then(response => response.json())
+        .then(data => {
+            charts.energy.data.labels = data.labels;
+            charts.energy.data.datasets[0].data = data.data;
+            charts.energy.update();
+
+            // Обновить финансовые показатели
+            document.getElementById('tariffRate').textContent = 
+                data.tariff.toFixed(0) + ' ₸';
+            document.getElementById('monthlyCost').textContent = 
+                data.monthly_cost.toFixed(0) + ' ₸';
+            document.getElementById('monthlySavings').textContent = 
+                data.monthly_savings.toFixed(0) + ' ₸';
+            document.getElementById('peakPower').textContent = 
+                data.peak_power.toFixed(2) + ' кВт';
+        });
+}
+
+// Обновление статистики
+function updateStatistics() {
+    fetch('/api/statistics')
+        .then(response => response.json())
+        .then(data => {
+            // Обновить график распределения
+            charts.distribution.data.labels = data.labels;
+            charts.distribution.data.datasets[0].data = data.data;
+            charts.distribution.data.datasets[0].backgroundColor = data.colors;
+            charts.distribution.update();
+
+            // Обновить статистику времени
+            updateHoursStats(data.hours_stats);
+
+            // Обновить месячную статистику
+            updateMonthlyStats(data.monthly_stats);
+        });
+}
+
+// Обновить статистику по времени
+function updateHoursStats(stats) {
+    const container = document.getElementById('hoursStats');
+    container.innerHTML = '';
+
+    stats.forEach(stat => {
+        const item = `
+            <div style="padding: 15px; border-bottom: 1px solid rgba(255,255,255,0.1); display: flex; justify-content: space-between;">
+                <div>${stat.room}</div>
+                <div style="color: #64B5F6; font-weight: 500;">${stat.hours} ч</div>
+            </div>
+        `;
+        container.innerHTML += item;
+    });
+}
+
+// Обновить месячную статистику
+function updateMonthlyStats(stats) {
+    const container = document.getElementById('monthlyStats');
+    container.innerHTML = '';
+
+    stats.forEach(stat => {
+        const item = `
+            <div style="padding: 15px; border-bottom: 1px solid rgba(255,255,255,0.1);">
+                <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
+                    <div>${stat.month}</div>
+                    <div style="color: #64B5F6; font-weight: 500;">${stat.consumption} кВт·ч</div>
+                </div>
+                <div style="font-size: 0.9rem; color: #90CAF9;">${stat.cost} ₸</div>
+            </div>
+        `;
+        container.innerHTML += item;
+    });
+}
+
+// Показать модальное окно сброса
+function showResetConfirm() {
+    document.getElementById('resetModal').classList.add('active');
+}
+
+// Скрыть модальное окно сброса
+function hideResetModal() {
+    document.getElementById('resetModal').classList.remove('active');
+    document.getElementById('resetConfirm').value = '';
+}
+
+// Сбросить статистику
+function resetStatistics() {
+    const confirmText = document.getElementById('resetConfirm').value;
+
+    if (confirmText !== 'СБРОСИТЬ') {
+        alert('Для подтверждения введите "СБРОСИТЬ"');
+        return;
+    }
+
+    fetch('/api/reset_stats', {
+        method: 'POST',
+        headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            hideResetModal();
+            loadDashboardData();
+            updateEnergyChart();
+            updateStatistics();
+            showNotification(data.message);
+        }
+    });
+}
+
+// Экспорт данных
+function exportData() {
+    fetch('/api/export')
+        .then(response => response.blob())
+        .then(blob => {
+            const url = window.URL.createObjectURL(blob);
+            const a = document.createElement('a');
+            a.href = url;
+            a.download = `energy_data_${new Date().toISOString().split('T')[0]}.json`;
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            window.URL.revokeObjectURL(url);
+        });
+}
+
+// Создать резервную копию
+function createBackup() {
+    fetch('/api/backup', {
+        method: 'POST',
+        headers: {'Authorization': 'Bearer ' + localStorage.getItem('auth_token')}
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showNotification(data.message);
+        }
+    });
+}
+
+// Запустить таймер обновления
+function startUpdateTimer() {
+    if (timer) clearInterval(timer);
+    timer = setInterval(updateDashboard, updateInterval);
+}
+
+// Перезапустить таймер обновления
+function restartUpdateTimer() {
+    if (timer) clearInterval(timer);
+    timer = setInterval(updateDashboard, updateInterval);
+}
+
+// Обновить дашборд
+function updateDashboard() {
+    // Дашборд и комнаты обновляются из потока событий, без него - опросом
+    if (!eventStream) {
+        loadDashboardData();
+        loadRooms();
+    }
+    if (currentSection === 'energy') {
+        updateEnergyChart();
+    }
+    if (currentSection === 'statistics') {
+        updateStatistics();
+    }
+}
+
+// Обновить время
+function updateTime() {
+    const now = new Date();
+    const timeStr = now.toLocaleTimeString('ru-RU', {hour12: false});
+    document.getElementById('currentTime').textContent = timeStr;
+}
+
+// Показать уведомление
+function showNotification(message, type = 'success') {
+    // Создать элемент уведомления
+    const notification = document.createElement('div');
+    notification.className = 'notification';
+    notification.innerHTML = `
+        <i class="fas fa-${type === 'success' ? 'check-circle' : 'info-circle'}"></i>
+        ${message}
+    `;
+
+    // Стили для уведомления
+    notification.style.cssText = `
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        padding: 15px 25px;
+        background: ${type === 'success' ? '#4CAF50' : '#2196F3'};
+        color: white;
+        border-radius: 10px;
+        box-shadow: 0 5px 15px rgba(0,0,0,0.3);
+        z-index: 10000;
+        animation: slideIn 0.3s ease;
+        display: flex;
+        align-items: center;
+        gap: 10px;
+    `;
+
+    document.body.appendChild(notification);
+
+    // Удалить через 3 секунды
+    setTimeout(() => {
+        notification.style.animation = 'slideOut 0.3s ease';
+        setTimeout(() => notification.remove(), 300);
+    }, 3000);
+}
+
+// Добавить стили анимации
+const style = document.createElement('style');
+style.textContent = `
+    @keyframes slideIn {
+        from { transform: translateX(100%); opacity: 0; }
+        to { transform: translateX(0); opacity: 1; }
+    }
+    @keyframes slideOut {
+        from { transform: translateX(0); opacity: 1; }
+        to { transform: translateX(100%); opacity: 0; }
+    }
+`;
+document.head.appendChild(style);
+
+// Показать детали комнаты
+function showRoomDetails(roomId) {
+    fetch(`/api/room/${roomId}`)
+        .then(response => response.json())
+        .then(room => {
+            alert(`
+                Название: ${room.name}
+                Мощность: ${room.power} кВт
+                Состояние: ${room.state ? 'Включена' : 'Выключена'}
+                Время работы сегодня: ${room.hours_today || 0} часов
+                Потреблено сегодня: ${(room.power * (room.hours_today || 0)).toFixed(2)} кВт·ч
+            `);
+        });
+}
@@ -0,0 +1,29 @@
+# Журнал действий: дозапись после аварийного завершения
+from action_log import ActionLog
+
+
+def entry(number, timestamp='2024-01-15 10:00:00'):
+    return {'timestamp': timestamp, 'user': 'admin', 'action': 'Включение', 'details': f'#{number}'}
+
+
+def test_append_after_torn_line_survives_restart(tmp_path):
+    log = ActionLog(str(tmp_path))
+    log.open()
+    log.append(entry(1))
+    log.close()
+    path = log._segment_path(log.segments[-1])
+    with open(path, 'ab') as f:
+        f.write(b'{"timestamp":"2024-01-15 10:00:01","us')
+
+    log = ActionLog(str(tmp_path))
+    log.open()
+    written = log.append(entry(2))
+    log.close()
+    assert written['id'] == 2
+
+    log = ActionLog(str(tmp_path))
+    log.open()
+    assert [e['details'] for e in log.read_all()] == ['#2', '#1']
+    assert log.append(entry(3))['id'] == 3
+    log.close()
+
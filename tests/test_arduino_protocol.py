@@ -0,0 +1,194 @@
+# Бинарный протокол Arduino: кадры, разбор потока и согласование при подключении
+import asyncio
+
+import pytest
+
+import arduino_connector
+from arduino_connector import (
+    AsyncArduinoConnector, FrameDecoder, MAX_CHANNELS, SUPERSEDED, encode_frame, encode_mask,
+    OP_PING, OP_STATE, OP_TEXT
+)
+from arduino_emulator import ArduinoEmulator
+
+
+def test_frame_roundtrip():
+    data = encode_frame(OP_STATE, encode_mask(0b10101)) + encode_frame(OP_PING)
+    assert FrameDecoder().feed(data) == [(OP_STATE, b'\x15\x00'), (OP_PING, b'')]
+
+
+def test_frame_payload_limit():
+    with pytest.raises(ValueError):
+        encode_frame(OP_TEXT, b'x' * 255)
+
+
+def test_channel_limit():
+    channels = {'kitchen': 0, 'garage': MAX_CHANNELS}
+    with pytest.raises(ValueError):
+        AsyncArduinoConnector('emulator', protocol='auto', channels=channels)
+    # Текстовый протокол адресует комнаты по имени, маска не нужна
+    AsyncArduinoConnector('emulator', protocol='text', channels=channels)
+
+
+def test_text_frame_counted_once():
+    device = AsyncArduinoConnector('counted', protocol='auto')
+    device.binary = True
+    before = device.metric_messages_in.value
+    device._on_data(encode_frame(OP_TEXT, b'ARDUINO READY') + encode_frame(OP_PING))
+    assert device.metric_messages_in.value - before == 2
+
+
+def drain(decoder, data):
+    """Кадры из data так, как их получает подключение: resync() по таймауту"""
+    frames = decoder.feed(data)
+    while decoder.buffer:
+        frames += decoder.resync()
+    return frames
+
+
+def test_crc_failure_drops_frame():
+    bad = bytearray(encode_frame(OP_TEXT, b'KITCHEN:ON'))
+    bad[3] ^= 0x01
+    decoder = FrameDecoder()
+    assert drain(decoder, bytes(bad) + encode_frame(OP_PING)) == [(OP_PING, b'')]
+    assert decoder.errors > 0
+
+
+def test_resync_after_garbage():
+    decoder = FrameDecoder()
+    frames = drain(decoder, b'\x00\xff\x13\x37' + encode_frame(OP_STATE, encode_mask(3)))
+    assert frames == [(OP_STATE, b'\x03\x00')]
+    assert decoder.errors >= 1
+
+
+def test_split_reads():
+    data = encode_frame(OP_TEXT, b'STATUS:LIVING_ROOM:1') + encode_frame(OP_PING)
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(len(data)):
+        frames += decoder.feed(data[i:i + 1])
+    assert frames == [(OP_TEXT, b'STATUS:LIVING_ROOM:1'), (OP_PING, b'')]
+    assert decoder.errors == 0
+
+
+def test_resync_skips_corrupted_length():
+    # Испорченный байт длины заставляет ждать кадр, которого не будет
+    decoder = FrameDecoder()
+    assert decoder.feed(b'\x40' + encode_frame(OP_PING)) == []
+    assert decoder.resync() == [(OP_PING, b'')]
+
+
+class EmulatorTransport:
+    """Транспорт без порта: байты хоста идут в ArduinoEmulator.feed(), ответ - обратно"""
+
+    def __init__(self, emulator, loop, on_data, delay):
+        self.emulator = emulator
+        self.loop = loop
+        self.on_data = on_data
+        self.delay = delay
+        self.written = []
+
+    def start(self):
+        pass
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        reply = self.emulator.feed(bytes(data))
+        if reply:
+            self.loop.call_later(self.delay, self.on_data, reply)
+
+    def close(self):
+        pass
+
+
+def make_device(monkeypatch, emulator, delay=0.0):
+    device = AsyncArduinoConnector('emulator', protocol='auto', command_timeout=0.5)
+    device.BOOT_DELAY = 0
+    device._open_port = lambda: None
+    monkeypatch.setattr(arduino_connector, 'SerialTransport',
+                        lambda ser, loop, on_data, on_lost: EmulatorTransport(emulator, loop, on_data, delay))
+    return device
+
+
+def test_binary_negotiation(monkeypatch):
+    emulator = ArduinoEmulator()
+    device = make_device(monkeypatch, emulator)
+
+    async def scenario():
+        assert await device.connect()
+        assert device.binary
+        assert await device.turn_on_room('kitchen')
+        await device.disconnect()
+
+    asyncio.run(scenario())
+    assert emulator.binary
+    assert emulator.states['KITCHEN']
+    assert emulator.decoder.errors == 0
+
+
+def test_text_fallback_without_firmware_support(monkeypatch):
+    emulator = ArduinoEmulator(binary_supported=False)
+    device = make_device(monkeypatch, emulator)
+
+    async def scenario():
+        assert await device.connect()
+        assert not device.binary
+        assert await device.turn_on_room('bedroom')
+        await device.disconnect()
+
+    asyncio.run(scenario())
+    assert not emulator.binary
+    assert emulator.states['BEDROOM']
+
+
+class SilentEmulator(ArduinoEmulator):
+    """Порт открывается, но ничего не отвечает (не та скорость, нет прошивки)"""
+
+    def feed(self, data):
+        return b''
+
+
+def test_connect_fails_without_pong(monkeypatch):
+    device = make_device(monkeypatch, SilentEmulator())
+    device.command_timeout = 0.05
+
+    async def scenario():
+        assert not await device.connect()
+        assert not device.connected
+        assert device.transport is None
+
+    asyncio.run(scenario())
+
+
+def test_commands_wait_for_negotiation(monkeypatch):
+    # Команда во время согласования не должна уйти текстом вслед за BINARY
+    emulator = ArduinoEmulator()
+    device = make_device(monkeypatch, emulator, delay=0.05)
+
+    async def scenario():
+        connecting = asyncio.ensure_future(device.connect())
+        while device.transport is None:
+            await asyncio.sleep(0)
+        assert not device.connected
+        assert not await device.turn_on_room('kitchen')
+        assert await connecting
+        assert device.binary
+        await device.disconnect()
+
+    asyncio.run(scenario())
+    assert not emulator.states['KITCHEN']
+    assert emulator.decoder.errors == 0
+
+
+def test_superseded_command(monkeypatch):
+    # ON и сразу OFF для одной комнаты: уходит только OFF
+    emulator = ArduinoEmulator()
+    device = make_device(monkeypatch, emulator)
+
+    async def scenario():
+        assert await device.connect()
+        results = await asyncio.gather(device.turn_on_room('kitchen'), device.turn_off_room('kitchen'))
+        await device.disconnect()
+        return results
+
+    assert asyncio.run(scenario()) == [SUPERSEDED, True]
+    assert not emulator.states['KITCHEN']
@@ -0,0 +1,117 @@
+# Журнал счетчиков энергии: записи, хвост после сбоя, снимок, сегменты и блокировка
+import os
+
+import pytest
+
+import energy_wal
+from energy_wal import (
+    EnergyJournal, ADD, PEAK, RESET, SEGMENT_SUFFIX,
+    apply_record, decode_records, encode_record
+)
+
+
+def counters():
+    return {'total_today': 0.0, 'total_month': 0.0, 'peak_today': 0.0, 'cost_today': 0.0}
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def test_record_roundtrip():
+    records = [(ADD, 'гостиная', 0.5, 0.25), (PEAK, 1.2), (RESET,)]
+    data = b''.join(encode_record(record) for record in records)
+    assert decode_records(data) == (records, len(data))
+
+
+def test_decode_stops_at_corrupted_record():
+    good = encode_record((ADD, 'kitchen', 1.0, 0.5))
+    bad = bytearray(encode_record((PEAK, 3.0)))
+    bad[-1] ^= 0x01
+    records, length = decode_records(good + bytes(bad) + encode_record((RESET,)))
+    assert records == [(ADD, 'kitchen', 1.0, 0.5)]
+    assert length == len(good)
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    journal = EnergyJournal(str(tmp_path))
+    journal.recover(counters(), {})
+    journal.append([(ADD, 'kitchen', 1.0, 0.5), (PEAK, 0.15)])
+    journal.close()
+    path = os.path.join(str(tmp_path), segment_files(str(tmp_path))[-1])
+    with open(path, 'ab') as f:
+        f.write(encode_record((ADD, 'kitchen', 2.0, 1.0))[:7])
+
+    energy, hours = counters(), {}
+    journal = EnergyJournal(str(tmp_path))
+    assert journal.recover(energy, hours) == 2
+    journal.append([(PEAK, 0.2)])
+    journal.close()
+    assert energy['total_today'] == 1.0
+    assert hours == {'kitchen': 0.5}
+
+    # Восстановленное сохранено снимком: повторно применяется только новая запись
+    energy, hours = counters(), {}
+    assert EnergyJournal(str(tmp_path)).recover(energy, hours) == 1
+    assert energy['total_today'] == 1.0
+    assert energy['peak_today'] == 0.2
+
+
+def test_recover_snapshot_and_replay(tmp_path):
+    journal = EnergyJournal(str(tmp_path))
+    energy, hours = counters(), {}
+    journal.recover(energy, hours)
+    for record in [(ADD, 'kitchen', 1.0, 0.5), (RESET,), (ADD, 'kitchen', 0.5, 0.25)]:
+        journal.append([record])
+        apply_record(energy, hours, record)
+    segment = journal.rotate()
+    journal.checkpoint(segment, energy, hours)
+    journal.append([(ADD, 'kitchen', 0.25, 0.125), (PEAK, 2.0)])
+    journal.close()
+
+    energy, hours = counters(), {}
+    # Записи до снимка уже в нем и не применяются повторно
+    assert EnergyJournal(str(tmp_path)).recover(energy, hours) == 2
+    assert energy['total_today'] == 0.75
+    assert energy['total_month'] == 1.75
+    assert energy['peak_today'] == 2.0
+    assert hours == {'kitchen': 0.375}
+
+
+def test_checkpoint_prunes_old_segments(tmp_path):
+    journal = EnergyJournal(str(tmp_path))
+    energy, hours = counters(), {}
+    journal.recover(energy, hours)
+    journal.append([(ADD, 'kitchen', 1.0, 0.5)])
+    first = journal.segment
+    journal.rotate()
+    journal.append([(ADD, 'kitchen', 1.0, 0.5)])
+    segment = journal.rotate()
+    assert len(segment_files(str(tmp_path))) == 3
+
+    journal.checkpoint(segment, energy, hours)
+    assert segment > first
+    assert segment_files(str(tmp_path)) == [os.path.basename(journal._segment_path(segment))]
+    journal.close()
+
+
+@pytest.mark.skipif(energy_wal.fcntl is None, reason='нет блокировок файлов')
+def test_second_journal_stays_inert_until_owner_closes(tmp_path):
+    owner = EnergyJournal(str(tmp_path))
+    assert owner.acquire()
+    owner.recover(counters(), {})
+
+    other = EnergyJournal(str(tmp_path))
+    assert not other.acquire()
+    assert other.inert
+    before = segment_files(str(tmp_path))
+    other.append([(ADD, 'kitchen', 1.0, 0.5)])
+    assert segment_files(str(tmp_path)) == before
+
+    owner.close()
+    assert other.acquire()
+    other.append([(ADD, 'kitchen', 1.0, 0.5)])
+    other.close()
+    energy = counters()
+    assert EnergyJournal(str(tmp_path)).recover(energy, {}) == 1
+    assert energy['total_today'] == 1.0
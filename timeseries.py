@@ -0,0 +1,305 @@
+# timeseries.py - хранилище временных рядов мощности по комнатам
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+# Гранулярности агрегатов и сколько корзин каждой хранить
+ROLLUP_RETENTION = {
+    'minute': 2 * 24 * 60,
+    'hour': 62 * 24,
+    'day': 400,
+    'month': 120
+}
+
+# Агрегаты, которые переживают перезапуск (на них строятся графики)
+PERSISTED_ROLLUPS = ('hour', 'day', 'month')
+
+
+def bucket_start(granularity, moment):
+    """Начало корзины (локальное время), в которую попадает moment"""
+    if granularity == 'minute':
+        return moment.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_end(granularity, start):
+    """Начало следующей корзины"""
+    if granularity == 'minute':
+        return start + timedelta(minutes=1)
+    if granularity == 'hour':
+        return start + timedelta(hours=1)
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+class RingSeries:
+    """Кольцевой буфер отсчетов (время, мощность) фиксированной емкости.
+
+    Данные лежат в двух плоских массивах array('d'), поэтому отсчет занимает
+    16 байт. Массивы растут по мере записи, пока не наберут capacity
+    отсчетов, и дальше память ряда не растет: ряд комнаты, которую не
+    включали, почти ничего не стоит.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d')
+        self.values = array('d')
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, ts, value):
+        """Добавить отсчет (время должно не убывать)"""
+        if self.count < self.capacity:
+            # Буфер еще не заполнен, начало в нуле
+            self.times.append(ts)
+            self.values.append(value)
+            self.count += 1
+            return
+        i = self.start
+        self.start = (self.start + 1) % self.capacity
+        self.times[i] = ts
+        self.values[i] = value
+
+    def last(self):
+        """Последний отсчет или None"""
+        if not self.count:
+            return None
+        i = (self.start + self.count - 1) % self.capacity
+        return self.times[i], self.values[i]
+
+    def _at(self, k):
+        return (self.start + k) % self.capacity
+
+    def _bisect(self, ts):
+        """Логический индекс первого отсчета с временем >= ts"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self._at(mid)] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def samples(self, start, end):
+        """Отсчеты с временем в [start, end)"""
+        result = []
+        k = self._bisect(start)
+        while k < self.count:
+            i = self._at(k)
+            if self.times[i] >= end:
+                break
+            result.append((self.times[i], self.values[i]))
+            k += 1
+        return result
+
+    def energy(self, start, end):
+        """Энергия за [start, end) в кВт·ч.
+
+        Мощность считается постоянной от отсчета до следующего отсчета.
+        """
+        if not self.count:
+            return 0.0
+        k = max(self._bisect(start) - 1, 0)
+        total = 0.0
+        while k < self.count:
+            i = self._at(k)
+            t0 = self.times[i]
+            if t0 >= end:
+                break
+            t1 = self.times[self._at(k + 1)] if k + 1 < self.count else t0
+            lo, hi = max(t0, start), min(t1, end)
+            if hi > lo:
+                total += self.values[i] * (hi - lo)
+            k += 1
+        return total / 3600
+
+
+class Bucket:
+    """Агрегат корзины: энергия (кВт·ч), мин./макс. мощность и число отсчетов"""
+
+    __slots__ = ('sum', 'min', 'max', 'count')
+
+    def __init__(self):
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.count = 0
+
+    def to_dict(self):
+        return {'sum': self.sum, 'min': self.min, 'max': self.max, 'count': self.count}
+
+    @classmethod
+    def from_values(cls, values):
+        bucket = cls()
+        bucket.sum, bucket.min, bucket.max, bucket.count = values
+        return bucket
+
+
+class Rollup:
+    """Корзины одной гранулярности, обновляемые по мере поступления отсчетов.
+
+    Границы текущей корзины кешируются в секундах epoch, поэтому обычный
+    отсчет обходится парой сравнений без вычисления календаря.
+    """
+
+    def __init__(self, granularity, retention):
+        self.granularity = granularity
+        self.retention = retention
+        self.buckets = OrderedDict()
+        self.current = None
+        self.current_start = 0.0
+        self.current_end = 0.0
+
+    def _locate(self, ts):
+        if self.current_start <= ts < self.current_end:
+            return self.current, self.current_end
+        start = bucket_start(self.granularity, datetime.fromtimestamp(ts))
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = Bucket()
+            while len(self.buckets) > self.retention:
+                self.buckets.popitem(last=False)
+        self.current = bucket
+        self.current_start = start.timestamp()
+        self.current_end = bucket_end(self.granularity, start).timestamp()
+        return bucket, self.current_end
+
+    def add_sample(self, ts, value):
+        bucket, _ = self._locate(ts)
+        if bucket.count == 0 or value < bucket.min:
+            bucket.min = value
+        if bucket.count == 0 or value > bucket.max:
+            bucket.max = value
+        bucket.count += 1
+
+    def add_energy(self, t0, t1, power):
+        """Разнести энергию мощности power на [t0, t1) по корзинам"""
+        if power == 0:
+            return
+        t = t0
+        while t < t1:
+            bucket, end = self._locate(t)
+            segment_end = min(t1, end)
+            bucket.sum += power * (segment_end - t) / 3600
+            t = segment_end
+
+    def get(self, start):
+        return self.buckets.get(start)
+
+    def export(self):
+        """Корзины списком [начало, энергия, мин., макс., отсчетов]"""
+        return [[start.isoformat(), bucket.sum, bucket.min, bucket.max, bucket.count]
+                for start, bucket in self.buckets.items()]
+
+    def load(self, rows):
+        """Восстановить корзины из export(); уже накопленные данные остаются"""
+        for row in rows:
+            start = datetime.fromisoformat(row[0])
+            if start not in self.buckets:
+                self.buckets[start] = Bucket.from_values(row[1:])
+        self.buckets = OrderedDict(sorted(self.buckets.items()))
+        while len(self.buckets) > self.retention:
+            self.buckets.popitem(last=False)
+        self.current = None
+        self.current_start = self.current_end = 0.0
+
+
+class TimeSeriesStore:
+    """Набор рядов мощности: по одному на комнату и общий ряд 'total'.
+
+    Кроме сырых отсчетов для каждого ряда ведутся агрегаты по минутам,
+    часам, дням и месяцам. Они обновляются инкрементально при записи,
+    поэтому графики за большие периоды читают считанные корзины.
+    Часовые, дневные и месячные агрегаты сохраняются между запусками
+    (export_rollups/load_rollups), сырые отсчеты и минуты - только в памяти.
+    """
+
+    TOTAL = 'total'
+
+    def __init__(self, capacity=17280):
+        self.capacity = capacity
+        self.series = {}
+        self.rollups = {}
+        self.lock = threading.Lock()
+
+    def record(self, ts, values):
+        """Записать отсчеты сразу для нескольких рядов: {ключ: мощность}"""
+        with self.lock:
+            for key, value in values.items():
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = RingSeries(self.capacity)
+                    self.rollups[key] = [Rollup(g, n) for g, n in ROLLUP_RETENTION.items()]
+                previous = series.last()
+                series.append(ts, value)
+                for rollup in self.rollups[key]:
+                    if previous is not None and ts > previous[0]:
+                        rollup.add_energy(previous[0], ts, previous[1])
+                    rollup.add_sample(ts, value)
+
+    def drop(self, key):
+        """Удалить ряд (например, для удаленной комнаты)"""
+        with self.lock:
+            self.series.pop(key, None)
+            self.rollups.pop(key, None)
+
+    def bucket(self, key, granularity, start):
+        """Агрегат корзины, начинающейся в start (datetime), или None"""
+        with self.lock:
+            for rollup in self.rollups.get(key, ()):
+                if rollup.granularity == granularity:
+                    return rollup.get(start)
+        return None
+
+    def bucket_energy(self, key, granularity, start):
+        """Энергия корзины в кВт·ч (0, если данных нет)"""
+        bucket = self.bucket(key, granularity, start)
+        return bucket.sum if bucket else 0.0
+
+    def export_rollups(self):
+        """Агрегаты графиков для сохранения: {ряд: {гранулярность: корзины}}"""
+        with self.lock:
+            return {
+                key: {rollup.granularity: rollup.export()
+                      for rollup in rollups if rollup.granularity in PERSISTED_ROLLUPS}
+                for key, rollups in self.rollups.items()
+            }
+
+    def load_rollups(self, data):
+        """Загрузить агрегаты, сохраненные export_rollups() (сырые отсчеты не сохраняются)"""
+        with self.lock:
+            for key, granularities in data.items():
+                rollups = self.rollups.get(key)
+                if rollups is None:
+                    self.series[key] = RingSeries(self.capacity)
+                    rollups = self.rollups[key] = [Rollup(g, n) for g, n in ROLLUP_RETENTION.items()]
+                for rollup in rollups:
+                    if rollup.granularity in granularities:
+                        rollup.load(granularities[rollup.granularity])
+
+    def samples(self, key, start, end):
+        with self.lock:
+            series = self.series.get(key)
+            return series.samples(start, end) if series else []
+
+    def energy(self, key, start, end):
+        with self.lock:
+            series = self.series.get(key)
+            return series.energy(start, end) if series else 0.0
+
+    def latest(self, key):
+        with self.lock:
+            series = self.series.get(key)
+            return series.last() if series else None
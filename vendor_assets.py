@@ -0,0 +1,86 @@
+# vendor_assets.py - загрузка внешних библиотек в static/vendor
+#
+# Запускается при сборке (см. render.yaml), чтобы панели в локальной сети
+# не ходили на публичные CDN. Шрифты и картинки, на которые ссылаются
+# скачанные CSS, скачиваются рядом, а ссылки переписываются на локальные.
+import os
+import re
+import sys
+import posixpath
+import urllib.request
+from urllib.parse import urljoin, urlparse
+
+VENDOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'vendor')
+
+# Современный браузер: Google Fonts отдает woff2 только ему
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+
+# (локальный путь, URL) - версии закреплены
+LIBRARIES = [
+    ('chart.js/chart.umd.min.js',
+     'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js'),
+    ('chartjs-plugin-datalabels/chartjs-plugin-datalabels.min.js',
+     'https://cdn.jsdelivr.net/npm/chartjs-plugin-datalabels@2.2.0/dist/chartjs-plugin-datalabels.min.js'),
+    ('fontawesome/css/all.min.css',
+     'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css'),
+    ('fonts/fonts.css',
+     'https://fonts.googleapis.com/css2?family=Exo+2:wght@300;400;600;700&family=Roboto:wght@300;400;500&display=swap'),
+]
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def fetch(url):
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+def save(path, data):
+    full_path = os.path.join(VENDOR_DIR, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'wb') as f:
+        f.write(data)
+
+
+def vendor_css(path, url, css):
+    """Скачать ресурсы из url(...) и переписать ссылки на локальные пути"""
+    base_dir = posixpath.dirname(path)
+    downloaded = {}
+
+    def replace(match):
+        ref = match.group(2)
+        if ref.startswith(('data:', '#')):
+            return match.group(0)
+        absolute = urljoin(url, ref)
+        parsed = urlparse(absolute)
+        if absolute not in downloaded:
+            if urlparse(url).netloc == parsed.netloc and not ref.startswith(('http:', 'https:', '//')):
+                # Относительная ссылка: сохраняем ту же структуру каталогов
+                local = posixpath.normpath(posixpath.join(base_dir, ref.split('?')[0].split('#')[0]))
+            else:
+                local = posixpath.join(base_dir, 'files', posixpath.basename(parsed.path))
+            save(local, fetch(absolute))
+            downloaded[absolute] = posixpath.relpath(local, base_dir)
+        return f'url({downloaded[absolute]})'
+
+    return CSS_URL.sub(replace, css)
+
+
+def main():
+    for path, url in LIBRARIES:
+        print(f"📥 {url}")
+        data = fetch(url)
+        if path.endswith('.css'):
+            data = vendor_css(path, url, data.decode('utf-8')).encode('utf-8')
+        save(path, data)
+    print(f"✓ Библиотеки сохранены в {VENDOR_DIR}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Ошибка загрузки библиотек: {e}")
+        sys.exit(1)